@@ -1,11 +1,11 @@
 import os
+import hashlib
 import streamlit as st
 import google.generativeai as genai
 from dotenv import load_dotenv
 
 # 1. 設定の読み込み
 load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
 # 2. モデルの設定（医療秘書としての役割）
 system_instruction = """
@@ -13,10 +13,42 @@ system_instruction = """
 ユーザーの入力した雑多な文章から医学的に重要な情報を抽出し、医師がカルテに記述するような形式で出力してください。
 医学的な診断（病名の断定）は行わず、あくまで「症状の正確な伝達」に徹してください。
 """
-model = genai.GenerativeModel(
-    'gemini-2.5-flash',
-    system_instruction=system_instruction
-)
+
+# 同じ入力の結果をセッション内で使い回す件数
+MAX_CACHED_SUMMARIES = 20
+
+
+@st.cache_resource
+def get_model():
+    """クライアント設定とモデルはプロセスで1回だけ作る（再実行・他のセッションでも使い回す）"""
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    return genai.GenerativeModel(
+        'gemini-2.5-flash',
+        system_instruction=system_instruction
+    )
+
+
+def input_key(text):
+    return hashlib.sha256(text.strip().encode("utf-8")).hexdigest()
+
+
+def stream_text(response):
+    """ストリームの各チャンクのテキストを順に返す（本文のないチャンクは飛ばす）"""
+    for chunk in response:
+        if chunk.parts:
+            yield chunk.text
+
+
+def show_summary(summary):
+    st.markdown("---")
+    st.success("✅ 作成完了｜この画面を医師に見せてください")
+
+    # 結果を目立たせる（コンテナ化）
+    with st.container(border=True):
+        st.markdown(summary)
+
+    st.caption("※このサマリーはAIが作成しました。補足があれば口頭で医師にお伝えください。")
+
 
 # 3. 画面構成
 st.set_page_config(page_title="医師提示用サマリー作成", layout="centered")
@@ -31,10 +63,16 @@ user_input = st.text_area(
     placeholder="（例）\n昨日の夜からお腹が痛い。\n朝起きたら熱が38度あった。\n吐き気もあって、水しか飲めていない。\n普段飲んでいる薬は〇〇です。"
 )
 
+# 作成済みのサマリー（入力のハッシュ → 本文）。ウィジェット操作による再実行ではAPIを呼ばない
+summaries = st.session_state.setdefault("summaries", {})
+
 # 実行ボタン
 if st.button("医師に見せる画面を作成する", type="primary", use_container_width=True):
     if user_input:
-        with st.spinner("医師向けに情報を整理中..."):
+        key = input_key(user_input)
+        if key in summaries:
+            st.session_state["shown"] = key
+        else:
             prompt = f"""
             以下の患者の訴えを、医師が診療しやすいように【医療用サマリー】として整理してください。
             専門用語（例：お腹が痛い→腹痛、熱がある→発熱）への変換は適切に行ってください。
@@ -62,18 +100,28 @@ if st.button("医師に見せる画面を作成する", type="primary", use_cont
             """
             
             try:
-                response = model.generate_content(prompt)
-                
+                with st.spinner("医師向けに情報を整理中..."):
+                    response = get_model().generate_content(prompt, stream=True)
+
                 st.markdown("---")
-                st.success("✅ 作成完了｜この画面を医師に見せてください")
-                
-                # 結果を目立たせる（コンテナ化）
+                # 生成された順にコンテナへ流し込む（全文を待たずに表示を始める）
                 with st.container(border=True):
-                    st.markdown(response.text)
-                
-                st.caption("※このサマリーはAIが作成しました。補足があれば口頭で医師にお伝えください。")
-                
+                    summary = st.write_stream(stream_text(response))
+
+                summaries[key] = summary
+                while len(summaries) > MAX_CACHED_SUMMARIES:
+                    summaries.pop(next(iter(summaries)))
+
             except Exception as e:
                 st.error(f"エラーが発生しました: {e}")
+            else:
+                # 保存した結果で描き直す（以降の再実行でも同じ表示になる）
+                st.session_state["shown"] = key
+                st.rerun()
     else:
-        st.warning("症状を入力してください。")
\ No newline at end of file
+        st.warning("症状を入力してください。")
+
+# 表示中の結果は、入力が同じあいだは再実行後も保存した本文から描き直す
+shown = st.session_state.get("shown")
+if shown is not None and user_input and shown == input_key(user_input) and shown in summaries:
+    show_summary(summaries[shown])
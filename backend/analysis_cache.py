@@ -0,0 +1,221 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_cache_key(masked_text: str, language: str, prompt_version: str, model_name: str) -> str:
+    """マスク済みテキスト + 言語 + プロンプト/モデルのバージョンからキーを作る"""
+    raw = json.dumps([masked_text, language, prompt_version, model_name], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+
+    def as_dict(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "coalesced": self.coalesced,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+# --- Backends ---
+
+class MemoryLRUCache:
+    """プロセス内 LRU + TTL"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.time():
+                del self._data[key]
+                self.stats.evictions += 1
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.stats.evictions += 1
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache:
+    """
+    ローカルのSQLiteファイルを使うキャッシュ
+    同じファイルを指せば、複数ワーカー(プロセス)間で結果を共有できる
+    """
+
+    def __init__(self, path: str, maxsize: int = 10000, ttl: float = 3600.0):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS analysis_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_cache_accessed ON analysis_cache(accessed_at)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        # fork 後の子プロセスでは親の接続を使わず開き直す（prefork.py）
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str):
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute("SELECT value, expires_at FROM analysis_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at < now:
+            conn.execute("DELETE FROM analysis_cache WHERE key = ?", (key,))
+            self.stats.evictions += 1
+            return None
+        conn.execute("UPDATE analysis_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def set(self, key: str, value):
+        conn = self._conn()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO analysis_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), now + self.ttl, now),
+        )
+        expired = conn.execute("DELETE FROM analysis_cache WHERE expires_at < ?", (now,)).rowcount
+        overflow = conn.execute(
+            "DELETE FROM analysis_cache WHERE key IN ("
+            " SELECT key FROM analysis_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.maxsize,),
+        ).rowcount
+        self.stats.evictions += max(expired, 0) + max(overflow, 0)
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0]
+
+
+# --- Front (single-flight) ---
+
+class AnalysisCache:
+    """
+    バックエンドの前段で、同一キーの同時リクエストを1回の上流呼び出しにまとめる
+    （single-flight）。成功した結果のみキャッシュする。
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._inflight = {}
+
+    @property
+    def stats(self) -> CacheStats:
+        return self.backend.stats
+
+    def get(self, key: str):
+        value = self.backend.get(key)
+        if value is None:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        return value
+
+    def peek(self, key: str):
+        """ヒット/ミスに数えずに値を返す（このあと get_or_compute で引く前の確認用）"""
+        return self.backend.get(key)
+
+    def set(self, key: str, value):
+        self.backend.set(key, value)
+
+    async def get_or_compute(self, key: str, compute, cacheable=None):
+        """
+        compute: 結果(dict)を返すコルーチン関数
+        cacheable(結果) が偽の結果は返すだけで保存しない（一部が欠けた結果など）
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.stats.coalesced += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+            if cacheable is None or cacheable(value):
+                self.set(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            # 待っている側がいない場合の "exception was never retrieved" 警告を抑止
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def info(self) -> dict:
+        info = self.stats.as_dict()
+        info["backend"] = type(self.backend).__name__
+        info["size"] = len(self.backend)
+        info["maxsize"] = self.backend.maxsize
+        info["inflight"] = len(self._inflight)
+        return info
+
+
+def create_analysis_cache():
+    """
+    環境変数から設定を読み込んでキャッシュを作る
+      ANALYSIS_CACHE_BACKEND: memory (既定) / sqlite / off
+      ANALYSIS_CACHE_SIZE, ANALYSIS_CACHE_TTL, ANALYSIS_CACHE_PATH
+    """
+    backend_name = os.getenv("ANALYSIS_CACHE_BACKEND", "memory").lower()
+    maxsize = int(os.getenv("ANALYSIS_CACHE_SIZE", "1024"))
+    ttl = float(os.getenv("ANALYSIS_CACHE_TTL", "3600"))
+    if backend_name == "off":
+        return None
+    if backend_name == "sqlite":
+        path = os.getenv("ANALYSIS_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "analysis_cache.sqlite3"))
+        return AnalysisCache(SQLiteCache(path, maxsize=maxsize, ttl=ttl))
+    return AnalysisCache(MemoryLRUCache(maxsize=maxsize, ttl=ttl))
@@ -0,0 +1,291 @@
+import json
+import re
+
+# ==========================================
+# 解析結果(JSON)の検証・部分修復
+# ==========================================
+# Gemini の出力が少し崩れている（```json で囲まれている・後ろに説明文がある・途中で切れている・
+# 項目が欠けている）だけで 500 にすると、利用者は同じ待ち時間をもう一度払って再送することになる。
+# ここでは {summary, departments, explanation} の形を前提に、直せるものはその場で直し、
+# 直せない項目（欠落・途中で切れた文字列）だけを呼び出し側が再生成できるよう一覧にして返す。
+
+SUMMARY_FIELDS = ("chief_complaint", "history", "symptoms", "background")
+ANALYSIS_FIELDS = tuple(f"summary.{f}" for f in SUMMARY_FIELDS) + ("departments", "explanation")
+
+_FENCE_RE = re.compile(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", re.DOTALL)
+_DEPARTMENT_SPLIT_RE = re.compile(r"[、,，/／・\n]+")
+JAPANESE_LANGUAGES = ("Japanese", "日本語", "ja")
+
+
+class AnalysisParseError(ValueError):
+    """JSONとして読める部分がない出力"""
+
+
+class RepairedJson:
+    """
+    value: 修復後の値
+    repairs: 行った修復の種類（fence / leading_text / trailing_text / trailing_comma / truncated）
+    cut_paths: 途中で切れていた値のパス（"summary.history" など。中身は信用できないので再生成する）
+    """
+    __slots__ = ("value", "repairs", "cut_paths")
+
+    def __init__(self, value, repairs=(), cut_paths=()):
+        self.value = value
+        self.repairs = list(repairs)
+        self.cut_paths = set(cut_paths)
+
+
+class _Container:
+    __slots__ = ("kind", "key", "expect", "member_start")
+
+    def __init__(self, kind: str, member_start: int):
+        self.kind = kind                  # "obj" or "arr"
+        self.key = None                   # obj の場合、現在のキー
+        self.expect = "key" if kind == "obj" else "value"
+        self.member_start = member_start  # 書きかけの要素を捨てるときに out を切り詰める位置
+
+
+def _path(stack) -> str:
+    return ".".join(c.key for c in stack if c.kind == "obj" and c.key is not None)
+
+
+def repair_json(text: str) -> RepairedJson:
+    """出力テキストから JSON の値を取り出す。崩れていれば直す（直せなければ AnalysisParseError）"""
+    try:
+        return RepairedJson(json.loads(text))
+    except (TypeError, ValueError):
+        pass
+    if not isinstance(text, str):
+        raise AnalysisParseError("response has no text")
+
+    repairs = []
+    if "```" in text:
+        m = _FENCE_RE.search(text)
+        if m:
+            text = m.group(1)
+            repairs.append("fence")
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        raise AnalysisParseError("no JSON value found")
+    if text[:start].strip():
+        repairs.append("leading_text")
+
+    out = []
+    stack = []
+    in_string = escape = string_is_key = False
+    key_start = 0
+    pending_comma = None
+    end = None
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+                top = stack[-1]
+                if string_is_key:
+                    try:
+                        top.key = json.loads("".join(out[key_start:]))
+                    except ValueError:
+                        top.key = None
+                    top.expect = "colon"
+                else:
+                    top.expect = "comma"
+            continue
+        if ch in " \t\r\n":
+            out.append(ch)
+            continue
+        if ch in "{[":
+            out.append(ch)
+            stack.append(_Container("obj" if ch == "{" else "arr", len(out)))
+        elif ch in "}]":
+            if pending_comma is not None:
+                del out[pending_comma]
+                if "trailing_comma" not in repairs:
+                    repairs.append("trailing_comma")
+            out.append(ch)
+            stack.pop()
+            if not stack:
+                end = i + 1
+                break
+            stack[-1].expect = "comma"
+        elif ch == ",":
+            out.append(ch)
+            top = stack[-1]
+            top.member_start = len(out) - 1
+            top.expect = "key" if top.kind == "obj" else "value"
+            pending_comma = len(out) - 1
+            continue
+        elif ch == ":":
+            out.append(ch)
+            stack[-1].expect = "value"
+        elif ch == '"':
+            top = stack[-1]
+            string_is_key = top.kind == "obj" and top.expect == "key"
+            key_start = len(out)
+            out.append(ch)
+            in_string = True
+        else:
+            # 数値・true/false/null
+            out.append(ch)
+            stack[-1].expect = "literal"
+        pending_comma = None
+
+    cut_paths = set()
+    if end is not None:
+        if text[end:].strip():
+            repairs.append("trailing_text")
+        candidates = ["".join(out)]
+    else:
+        # 途中で切れている: 書きかけの文字列を閉じる / 書きかけの要素を捨てる → 括弧を閉じる
+        repairs.append("truncated")
+        top = stack[-1]
+        closers = "".join("}" if c.kind == "obj" else "]" for c in reversed(stack))
+        if in_string and not string_is_key:
+            cut_paths.add(_path(stack))
+            if escape:
+                out.pop()
+            closed = "".join(out) + '"'
+        else:
+            closed = None
+            if top.kind == "obj" and top.expect in ("colon", "value", "literal"):
+                cut_paths.add(_path(stack))
+        dropped = "".join(out[:top.member_start])
+        candidates = [c + closers for c in (closed, "".join(out), dropped) if c is not None]
+
+    for candidate in candidates:
+        try:
+            return RepairedJson(json.loads(candidate), repairs, cut_paths)
+        except ValueError:
+            continue
+    raise AnalysisParseError("could not repair JSON")
+
+
+def _get_path(obj: dict, path: str):
+    for key in path.split("."):
+        if not isinstance(obj, dict):
+            return None
+        obj = obj.get(key)
+    return obj
+
+
+def normalize_analysis(repaired: RepairedJson, language: str):
+    """
+    スキーマに合わせて値を整える
+    戻り値: (結果, 欠けている項目のパス一覧, 行った整形の種類一覧)
+    - 文字列のはずの項目が配列 → 箇条書きの文字列に、departments が文字列 → 配列に（coerced）
+    - explanation がない日本語の結果 → 空文字（もともと空文字を返す指示のため再生成しない: defaulted）
+    """
+    value = repaired.value if repaired is not None else None
+    cut = repaired.cut_paths if repaired is not None else set()
+    repairs = []
+    if isinstance(value, list) and value and isinstance(value[0], dict):
+        value = value[0]
+        repairs.append("coerced")
+    if not isinstance(value, dict):
+        value = {}
+
+    summary = value.get("summary")
+    if not isinstance(summary, dict):
+        # summary で包まれずにトップレベルに出てしまった場合
+        summary = {f: value[f] for f in SUMMARY_FIELDS if f in value}
+        if summary:
+            repairs.append("coerced")
+
+    missing = []
+    result_summary = {}
+    for field in SUMMARY_FIELDS:
+        v = summary.get(field)
+        if f"summary.{field}" in cut:
+            missing.append(f"summary.{field}")
+            continue
+        if isinstance(v, list):
+            v = "\n".join(f"- {item}" for item in v if item)
+            repairs.append("coerced")
+        if isinstance(v, str):
+            # 空文字も整った出力（該当する情報がない）。欠けているのはキーがない・途中で切れた項目だけ
+            result_summary[field] = v
+        else:
+            missing.append(f"summary.{field}")
+
+    departments = value.get("departments")
+    if isinstance(departments, str):
+        departments = [d.strip() for d in _DEPARTMENT_SPLIT_RE.split(departments) if d.strip()]
+        repairs.append("coerced")
+    if isinstance(departments, list) and "departments" not in cut:
+        departments = [d for d in departments if isinstance(d, str) and d.strip()]
+    else:
+        departments = None
+        missing.append("departments")
+
+    explanation = value.get("explanation")
+    if not isinstance(explanation, str) or "explanation" in cut:
+        if language in JAPANESE_LANGUAGES:
+            explanation = ""
+            repairs.append("defaulted")
+        else:
+            explanation = None
+            missing.append("explanation")
+
+    result = {"summary": result_summary}
+    if departments is not None:
+        result["departments"] = departments
+    if explanation is not None:
+        result["explanation"] = explanation
+    return result, missing, sorted(set(repairs), key=repairs.index)
+
+
+def merge_missing(result: dict, fill: dict, missing) -> list:
+    """再生成した項目（normalize_analysis 済みの fill）を result に入れる。まだ欠けている項目を返す"""
+    still_missing = []
+    for path in missing:
+        value = _get_path(fill, path)
+        if value is None:
+            still_missing.append(path)
+        elif path.startswith("summary."):
+            result["summary"][path.split(".", 1)[1]] = value
+        else:
+            result[path] = value
+    return still_missing
+
+
+def finalize(result: dict, missing) -> dict:
+    """欠けたままの項目を空の値で埋め、incomplete に一覧を残す（空のまま画面が崩れないように）"""
+    for path in missing:
+        if path.startswith("summary."):
+            result["summary"].setdefault(path.split(".", 1)[1], "")
+        else:
+            result.setdefault(path, [] if path == "departments" else "")
+    ordered = {
+        "summary": {f: result["summary"][f] for f in SUMMARY_FIELDS},
+        "departments": result["departments"],
+        "explanation": result["explanation"],
+    }
+    if missing:
+        ordered["incomplete"] = list(missing)
+    return ordered
+
+
+def apply_update(previous: dict, repaired: RepairedJson, language: str):
+    """
+    差分更新の出力（変わる項目だけのJSON）を前回の結果に重ねる。戻り値: (結果, 値が変わった項目)
+    途中で切れた出力は、どの項目が更新されるはずだったか分からないので AnalysisParseError にする
+    """
+    if "truncated" in repaired.repairs:
+        raise AnalysisParseError("incremental update was truncated")
+    update, not_given, _ = normalize_analysis(repaired, language)
+    result = {
+        "summary": dict(previous["summary"]),
+        "departments": previous["departments"],
+        "explanation": previous["explanation"],
+    }
+    changed = [
+        path for path in ANALYSIS_FIELDS
+        if path not in not_given and _get_path(update, path) != _get_path(previous, path)
+    ]
+    merge_missing(result, update, changed)
+    return finalize(result, []), changed
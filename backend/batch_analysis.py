@@ -0,0 +1,107 @@
+import asyncio
+
+from analysis_result import AnalysisParseError, RepairedJson, normalize_analysis, repair_json
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    ローカルでの簡易トークン数見積もり
+    日本語などの非ASCII文字は約1文字=1トークン、ASCIIは約4文字=1トークンとして数える
+    """
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return non_ascii + (len(text) - non_ascii + 3) // 4
+
+
+def pack_batches(items, token_budget: int = 6000, max_items: int = 10) -> list:
+    """
+    items: [(id, テキスト), ...] を、1グループの合計見積もりトークンが
+    token_budget 以下・件数が max_items 以下になるよう詰める（First-Fit Decreasing）
+    予算を単独で超える項目は、それだけで1グループにする
+    """
+    sized = sorted(((estimate_tokens(text), item_id, text) for item_id, text in items), reverse=True)
+    groups = []  # [[合計トークン, [(id, text), ...]], ...]
+    for tokens, item_id, text in sized:
+        for group in groups:
+            if group[0] + tokens <= token_budget and len(group[1]) < max_items:
+                group[0] += tokens
+                group[1].append((item_id, text))
+                break
+        else:
+            groups.append([tokens, [(item_id, text)]])
+    return [members for _, members in groups]
+
+
+def split_batch_response(text: str, expected_ids, language: str = "Japanese") -> dict:
+    """
+    JSON配列のレスポンスを id ごとの結果に分割する
+    崩れた・途中で切れたJSONは読める要素までを使う（analysis_result.repair_json）
+    配列にない id・項目が欠けた要素は含めない（呼び出し側で個別に再試行する）
+    """
+    try:
+        repaired = repair_json(text)
+    except AnalysisParseError:
+        return {}
+    data = repaired.value
+    if isinstance(data, dict):
+        data = data.get("results") or data.get("items") or []
+    if not isinstance(data, list):
+        return {}
+    if "truncated" in repaired.repairs:
+        # 最後の要素は途中で切れている
+        data = data[:-1]
+
+    expected = {str(i): i for i in expected_ids}
+    results = {}
+    for entry in data:
+        if not isinstance(entry, dict):
+            continue
+        item_id = expected.get(str(entry.get("id")))
+        if item_id is None or item_id in results:
+            continue
+        result, missing, _ = normalize_analysis(RepairedJson(entry), language)
+        if not missing:
+            results[item_id] = result
+    return results
+
+
+async def run_batch(items, language: str, build_prompt, generate, analyze_single,
+                    token_budget: int = 6000, max_items: int = 10) -> dict:
+    """
+    items: [(id, マスク済みテキスト), ...]（同一言語）
+    build_prompt(group, language) -> プロンプト
+    generate(prompt) -> (レスポンステキスト, 応答したモデル名) を返すコルーチン関数
+    analyze_single(text) -> 1件分の結果 を返すコルーチン関数（取りこぼしの個別再試行用）
+
+    戻り値: {id: 結果(dict) または Exception}, 上流呼び出し回数
+    """
+    calls = 0
+
+    async def run_group(group):
+        nonlocal calls
+        results = {}
+        if len(group) > 1:
+            try:
+                calls += 1
+                text, model_name = await generate(build_prompt(group, language))
+                results = split_batch_response(text, [item_id for item_id, _ in group], language)
+                for entry in results.values():
+                    entry["model"] = model_name
+            except Exception as e:
+                print(f"Batch Group Error: {e}")
+
+        # まとめて解析できなかった項目だけを個別に再試行する
+        async def retry(item_id, safe_text):
+            nonlocal calls
+            try:
+                calls += 1
+                results[item_id] = await analyze_single(safe_text)
+            except Exception as e:
+                results[item_id] = e
+
+        await asyncio.gather(*[retry(i, t) for i, t in group if i not in results])
+        return results
+
+    merged = {}
+    for group_results in await asyncio.gather(*[run_group(g) for g in pack_batches(items, token_budget, max_items)]):
+        merged.update(group_results)
+    return merged, calls
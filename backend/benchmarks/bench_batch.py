@@ -0,0 +1,48 @@
+"""
+バッチ解析のプロンプトトークン削減量の見積もり
+
+    python benchmarks/bench_batch.py [--notes 40]
+
+N件を /analyze で個別に送った場合と、/analyze/batch でまとめた場合の
+入力トークン見積もり（batch_analysis.estimate_tokens）と呼び出し回数を比較する。
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from batch_analysis import estimate_tokens, pack_batches  # noqa: E402
+from prompts import analysis_template, batch_template, build_analysis_prompt, build_batch_prompt  # noqa: E402
+
+NOTES = [
+    "昨日の夜からお腹が痛い。朝起きたら熱が38度あった。吐き気もあって、水しか飲めていない。",
+    "3日前から咳が止まらない。夜になるとひどくなる。痰は黄色。熱はない。喘息の持病あり。",
+    "今朝から右の頭がズキズキ痛む。光がまぶしい。市販の頭痛薬を飲んだが効かない。",
+    "1週間前から腰が痛い。重いものを持ってから。足のしびれはない。高血圧の薬を飲んでいる。",
+]
+
+
+def report():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--notes", type=int, default=40)
+    args = parser.parse_args()
+
+    items = [(i, NOTES[i % len(NOTES)]) for i in range(args.notes)]
+    # system_instruction も入力トークンとして課金されるため含めて数える
+    single_system = estimate_tokens(analysis_template("Japanese").system)
+    batch_system = estimate_tokens(batch_template("Japanese").system)
+    single_tokens = sum(single_system + estimate_tokens(build_analysis_prompt(t, "Japanese")) for _, t in items)
+    groups = pack_batches(items, main.BATCH_TOKEN_BUDGET, main.BATCH_MAX_ITEMS)
+    batch_tokens = sum(batch_system + estimate_tokens(build_batch_prompt(g, "Japanese")) for g in groups)
+
+    print(f"notes            : {args.notes}")
+    print(f"single  calls    : {args.notes:5d}  input tokens ~{single_tokens}")
+    print(f"batch   calls    : {len(groups):5d}  input tokens ~{batch_tokens}")
+    print(f"tokens per note  : {single_tokens / args.notes:.0f} -> {batch_tokens / args.notes:.0f} "
+          f"({100 * (1 - batch_tokens / single_tokens):.0f}% less)")
+
+
+if __name__ == "__main__":
+    report()
@@ -0,0 +1,90 @@
+"""
+数値・期間・部位・用語のローカル抽出（clinical_hints）で減るトークン数と待ち時間
+
+    python benchmarks/bench_hints.py [--repeat 300] [--ms-per-output-token 4] [--max-local-ms 2]
+
+bench_prompt.py と同じ入力で、1リクエストあたりの
+- 入力トークン: 変更前（太字・言い換えの指示を含む system_instruction）と変更後（短い指示 + 【用語】のヒント）
+- 出力トークン: Gemini に付けさせていた ** の分（入力に出てくる数値・期間・部位の種類数 × 開き/閉じの2トークン）
+- ローカル処理の時間: normalize_width + annotate（抽出・ヒント作成）+ emphasize（生成後の太字付け）
+を見積もり、出力トークンの減少分 × --ms-per-output-token を生成時間の短縮としてローカル処理の時間と並べる。
+ローカル処理が --max-local-ms を超えるか、入力トークンが変更前より増える入力があれば終了コード 1。
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_analysis import estimate_tokens  # noqa: E402
+from bench_prompt import NOTES  # noqa: E402
+from clinical_hints import HINT_REGEX, emphasize_text, normalize_width  # noqa: E402
+from prompts import ANALYSIS_RULES, analysis_template, annotate  # noqa: E402
+
+# 変更前の指示（太字・言い換えを Gemini に任せていたもの）
+PREVIOUS_RULES = """重要指示:
+- 医師が読むためのカルテ用語（例: 「熱がある」→「発熱」、「お腹が痛い」→「腹痛」）に変換すること。
+- **数値**（体温、回数）、**期間**（いつから）、**部位**（右下腹部など）は、医師が見落とさないよう **太字** で囲むこと（例: **38.5度**）。
+- 否定された症状（「吐き気はない」など）も、鑑別診断に重要なため省略せずに記載すること。
+- `departments` は、可能性のある診療科を広い範囲で抽出すること。"""
+BOLD_MARKER_TOKENS = 2  # "**" の開き・閉じ（実際のトークナイザでは1つずつ別トークンになる）
+
+# 全角数字を含む入力（normalize_width の確認用）
+NOTES = {**NOTES, "full-width": "３日前から右下腹部が痛い。熱は３８．５度。嘔吐は２回。血圧は１３０／８５。お腹が痛い。"}
+
+
+def previous_system(language: str) -> str:
+    system = analysis_template(language).system
+    return system.replace(ANALYSIS_RULES, PREVIOUS_RULES).replace("例: 3日前からの発熱", "例: **3日前**からの発熱")
+
+
+def bold_spans(text: str) -> int:
+    """Gemini が太字にしていたはずの箇所の数（入力中の数値・期間・部位。同じ表記はサマリーでも1回と数える）"""
+    return len({m.group() for m in HINT_REGEX.finditer(text) if m.lastgroup != "TERM"})
+
+
+def local_pass(text: str) -> str:
+    safe_text = normalize_width(text)
+    annotate(safe_text)
+    # サマリーは入力とほぼ同じ量の数値・期間・部位を含むので、入力そのものに太字を付けて代用する
+    return emphasize_text(safe_text)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=300)
+    parser.add_argument("--ms-per-output-token", type=float, default=4.0, help="生成の1トークンあたりの時間（Flash でおよそ 3〜5ms）")
+    parser.add_argument("--max-local-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    template = analysis_template("Japanese")
+    before_system = estimate_tokens(previous_system("Japanese"))
+    after_system = estimate_tokens(template.system)
+    print(f"system_instruction: {before_system} -> {after_system} tokens (cached prefix)")
+    print(f"{'input':11s} {'chars':>6s} {'in before':>9s} {'in after':>8s} {'out saved':>9s} "
+          f"{'gen saved':>9s} {'local':>8s}  hints")
+    ok = True
+    total_saved = 0
+    for name, text in NOTES.items():
+        safe_text = normalize_width(text)
+        before = before_system + estimate_tokens(template.render(safe_text))
+        after = after_system + estimate_tokens(template.render(annotate(safe_text)))
+        out_saved = bold_spans(safe_text) * BOLD_MARKER_TOKENS
+        local_ms = min(timeit.repeat(lambda: local_pass(text), number=args.repeat, repeat=3)) / args.repeat * 1000
+        gen_saved_ms = out_saved * args.ms_per_output_token
+        hints = annotate(safe_text)[len(safe_text):].strip().replace("\n", " ")
+        print(f"{name:11s} {len(text):6d} {before:9d} {after:8d} {out_saved:9d} "
+              f"{gen_saved_ms:7.0f}ms {local_ms:6.3f}ms  {hints[:60] or '-'}")
+        total_saved += (before - after) + out_saved
+        if after > before or local_ms > args.max_local_ms:
+            ok = False
+
+    print(f"\nsample: {emphasize_text(normalize_width(NOTES['full-width']))}")
+    print(f"tokens saved over {len(NOTES)} inputs: {total_saved} (input + output)")
+    print("OK" if ok else f"FAIL: input tokens grew or local pass above {args.max_local_ms}ms")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+PDFレンダリングのスループット計測
+
+    python benchmarks/bench_pdf.py [--count 200] [--workers 4] [--target 15]
+
+PDFs/sec/core が --target (環境変数 PDF_BENCH_TARGET) を下回ると終了コード 1 を返す。
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_renderer import PDF_SIZES, PdfRenderPool  # noqa: E402
+
+SAMPLE_TEXT = "\n".join([
+    "■ 主訴",
+    "**3日前**からの発熱（最高**38.5度**）",
+    "",
+    "■ 現病歴",
+    "**3日前**の夜から悪寒を伴う発熱あり。**昨日**より**右下腹部**に痛みが出現し、徐々に増悪。",
+    "食欲低下あり。嘔吐は**2回**。下痢はない。呼吸苦はない。",
+    "",
+    "■ 随伴症状",
+    "- 悪寒",
+    "- 食欲不振",
+    "・嘔気",
+    "",
+    "■ 既往歴・服薬・アレルギー",
+    "特記なし",
+] * 3)
+
+
+async def run(count: int, workers: int) -> dict:
+    pool = PdfRenderPool(workers=workers)
+    pool.start()
+    try:
+        results = {}
+        for size in PDF_SIZES:
+            started = time.perf_counter()
+            outputs = await asyncio.gather(*[pool.render(SAMPLE_TEXT, size) for _ in range(count)])
+            elapsed = time.perf_counter() - started
+            cores = max(workers, 1)
+            results[size] = {
+                "pdfs": count,
+                "seconds": round(elapsed, 3),
+                "pdfs_per_sec": round(count / elapsed, 1),
+                "pdfs_per_sec_per_core": round(count / elapsed / cores, 1),
+                "avg_bytes": sum(len(o) for o in outputs) // count,
+            }
+        return results
+    finally:
+        pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--target", type=float, default=float(os.getenv("PDF_BENCH_TARGET", "15")))
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.count, args.workers))
+    failed = False
+    for size, r in results.items():
+        ok = r["pdfs_per_sec_per_core"] >= args.target
+        failed |= not ok
+        print(f"{size:8s} {r['pdfs_per_sec']:7.1f} PDFs/s  {r['pdfs_per_sec_per_core']:6.1f} /core  "
+              f"{r['avg_bytes']:6d} bytes  {'OK' if ok else 'BELOW TARGET'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
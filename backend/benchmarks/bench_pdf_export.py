@@ -0,0 +1,93 @@
+"""
+履歴の一括PDFエクスポート（/api/pdf/export）のメモリ使用量計測
+
+    python benchmarks/bench_pdf_export.py [--counts 50,1000] [--page-size 20] [--max-growth 8]
+
+ローカルSQLiteに件数の違う履歴を用意して書き出し、ヒープのピーク（tracemalloc）を比べる。
+最小件数と最大件数のピーク差が --max-growth (MB) を超えると終了コード 1 を返す。
+件数に比例して増えていなければ、ページ単位のストリーミングが効いている。
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from summary_store import SQLiteSummaryStore  # noqa: E402
+
+SAMPLE_CONTENT = {
+    "chief_complaint": "**3日前**からの発熱（最高**38.5度**）",
+    "history": "**3日前**の夜から悪寒を伴う発熱あり。**昨日**より**右下腹部**に痛みが出現し、徐々に増悪。\n"
+               "食欲低下あり。嘔吐は**2回**。下痢はない。呼吸苦はない。",
+    "symptoms": "- 悪寒\n- 食欲不振\n- 嘔気",
+    "background": "特記なし",
+}
+
+
+def make_store(count: int) -> SQLiteSummaryStore:
+    store = SQLiteSummaryStore(":memory:")
+    for i in range(count):
+        store.insert({
+            "id": f"bench-{i:06d}", "user_id": "bench-user",
+            "created_at": f"2026-01-01T{i // 3600:02d}:{i // 60 % 60:02d}:{i % 60:02d}",
+            "content": SAMPLE_CONTENT,
+        })
+    return store
+
+
+async def export(store, pdf_size: str) -> dict:
+    import main
+    pages = main.iter_export_pages(store, "bench-user")
+    first_rows = await anext(pages, None)
+    total = chunks = 0
+    started = time.perf_counter()
+    tracemalloc.start()
+    try:
+        async for chunk in main.stream_export_pdf(pages, first_rows, pdf_size, None):
+            total += len(chunk)
+            chunks += 1
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "bytes": total,
+        "chunks": chunks,
+        "seconds": round(time.perf_counter() - started, 2),
+        "peak_heap_mb": round(peak / 1e6, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--counts", default="50,1000")
+    parser.add_argument("--page-size", type=int, default=int(os.getenv("EXPORT_PAGE_SIZE", "20")))
+    parser.add_argument("--size", default="A4")
+    parser.add_argument("--max-growth", type=float, default=float(os.getenv("PDF_EXPORT_MAX_GROWTH_MB", "8")))
+    args = parser.parse_args()
+    os.environ["EXPORT_PAGE_SIZE"] = str(args.page_size)
+    os.environ.setdefault("WEBHOOK_DB_PATH", os.path.join(tempfile.gettempdir(), "bench_export_webhooks.sqlite3"))
+    os.environ.setdefault("PDF_RENDER_WORKERS", "0")  # tracemalloc で測れるよう同じプロセスで描画する
+
+    # フォント登録・ReportLab の初回読み込みを計測から除く
+    asyncio.run(export(make_store(1), args.size))
+
+    results = {}
+    for count in (int(c) for c in args.counts.split(",")):
+        r = results[count] = asyncio.run(export(make_store(count), args.size))
+        print(f"{count:6d} summaries  {r['bytes'] / 1e6:7.2f} MB PDF  {r['chunks']:5d} chunks  "
+              f"peak heap {r['peak_heap_mb']:6.2f} MB  {r['seconds']:6.1f}s")
+
+    counts = sorted(results)
+    growth = results[counts[-1]]["peak_heap_mb"] - results[counts[0]]["peak_heap_mb"]
+    ok = growth <= args.max_growth
+    print(f"peak heap growth {counts[0]} -> {counts[-1]}: {growth:.2f} MB (budget {args.max_growth} MB) "
+          f"{'OK' if ok else 'FAIL'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
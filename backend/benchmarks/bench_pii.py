@@ -0,0 +1,92 @@
+"""
+個人情報マスキングの速度比較（4000文字入力）
+
+    python benchmarks/bench_pii.py [--repeat 2000]
+
+従来の mask_pii（re.sub を2回連鎖）と pii.mask（1パス）を同じコーパスで比較する。
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pii import mask  # noqa: E402
+
+# 実際の入力に近い文章（個人情報あり・なしを混在させる）
+CORPUS_SENTENCES = [
+    "昨日の夜からお腹が痛い。朝起きたら熱が38.5度あった。",
+    "吐き気もあって、水しか飲めていない。嘔吐は2回。",
+    "2024 10 17から咳が続いていて、夜になるとひどくなる。",
+    "普段飲んでいる薬はアムロジピン5mgです。アレルギーはありません。",
+    "右下腹部が押すと痛い。歩くと響く感じがする。",
+    "連絡先は090-1234-5678、メールは taro.yamada@example.com です。",
+    "住所は東京都新宿区西新宿2丁目8番1号、〒160-0023 です。",
+    "保険者番号: 06123456、マイナンバーは1234 5678 9012。",
+    "参考にしたページ https://example.jp/health/fever?id=3 を見ました。",
+    "３日前から頭痛。市販薬を飲んだが効かない。光がまぶしい。",
+]
+
+
+# 個人情報を含む文（上の CORPUS_SENTENCES のうち 5〜9 番目）
+PII_SENTENCES = CORPUS_SENTENCES[5:9]
+
+
+def build_corpus(n: int = 50, length: int = 4000, seed: int = 0, pii_sentences: int = None) -> list:
+    """
+    pii_sentences: 1入力あたりに含める個人情報入りの文の数（None なら全文からランダムに選ぶ）
+    """
+    rng = random.Random(seed)
+    plain = [s for s in CORPUS_SENTENCES if s not in PII_SENTENCES]
+    corpus = []
+    for _ in range(n):
+        parts = []
+        if pii_sentences is not None:
+            parts.extend(rng.choice(PII_SENTENCES) for _ in range(pii_sentences))
+        pool = CORPUS_SENTENCES if pii_sentences is None else plain
+        while sum(len(p) for p in parts) < length:
+            parts.insert(rng.randrange(len(parts) + 1), rng.choice(pool))
+        corpus.append("".join(parts)[:length])
+    return corpus
+
+
+_LEGACY_PHONE = re.compile(r'\d{2,4}[-\s]?\d{2,4}[-\s]?\d{3,4}')
+_LEGACY_EMAIL = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+
+
+def legacy_mask_pii(text: str) -> str:
+    """従来の実装（backend/main.py の mask_pii と同じ正規表現）"""
+    text = _LEGACY_PHONE.sub('[PHONE_HIDDEN]', text)
+    text = _LEGACY_EMAIL.sub('[EMAIL_HIDDEN]', text)
+    return text
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    def bench(fn, corpus):
+        n = len(corpus) * args.repeat
+        return min(timeit.repeat(lambda: [fn(t) for t in corpus], number=args.repeat, repeat=5)) / n * 1e6
+
+    corpora = {
+        "typical (2 PII sentences)": build_corpus(pii_sentences=2),
+        "PII-dense (40% sentences)": build_corpus(),
+    }
+    for label, corpus in corpora.items():
+        legacy_us = bench(legacy_mask_pii, corpus)
+        single_us = bench(mask, corpus)
+        print(f"{label}: {len(corpus)} inputs x {len(corpus[0])} chars")
+        print(f"  legacy (2x re.sub) : {legacy_us:8.1f} us/input")
+        print(f"  pii.mask (1 pass)  : {single_us:8.1f} us/input  ({legacy_us / single_us:.2f}x)")
+
+    sample = CORPUS_SENTENCES[2]
+    print(f"false positive check: {legacy_mask_pii(sample)!r} -> {mask(sample).text!r}")
+
+
+if __name__ == "__main__":
+    run()
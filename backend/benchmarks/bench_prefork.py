@@ -0,0 +1,195 @@
+"""
+pre-fork マルチワーカー（prefork.py）のスケーリングとメモリ共有の計測
+
+    python benchmarks/bench_prefork.py [--workers 1,2,4] [--seconds 5] [--connections 64] [--min-efficiency 0.7]
+
+ワーカー数を変えて実際に prefork.serve() でサーバーを起動し、キャッシュに当たる /analyze
+（PIIマスク・キャッシュキー計算・直列化など Python の CPU 処理が中心）に別プロセスから負荷をかける。
+- スループット（req/s）と、1ワーカー時に対する効率 = rps(N) / (N × rps(1))
+- ワーカー1つあたりの RSS / PSS / Private（/proc/<pid>/smaps_rollup。Private が小さいほど親と共有できている）
+負荷をかける側にもコアが要るため、効率は N × 2 <= コア数 のワーカー数だけを --min-efficiency と比べる。
+下回れば終了コード 1。
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+PAYLOAD = json.dumps({
+    "text": "昨日の夜からお腹が痛い。朝起きたら熱が38度あった。吐き気もあって、水しか飲めていない。"
+            "電話は090-1234-5678、住所は東京都千代田区1-2-3。普段飲んでいる薬は降圧剤です。",
+}, ensure_ascii=False).encode("utf-8")
+REQUEST = (
+    b"POST /analyze HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+    b"Content-Length: %d\r\n\r\n%s" % (len(PAYLOAD), PAYLOAD)
+)
+
+
+# --- サーバー側（--serve で子プロセスとして起動される） ---
+
+def run_server(workers: int, port: int):
+    import prefork
+    prefork.configure_shared_state(os.environ["PREFORK_STATE_DIR"], workers)
+    import main
+    from fakes import FakeGenerativeModel, LatencyProfile
+    main.gemini_model.set(FakeGenerativeModel(LatencyProfile()))
+    app = prefork.warm_up()
+    prefork.serve(app, "127.0.0.1", port, workers, graceful_timeout=5)
+
+
+# --- 負荷をかける側 ---
+
+async def _connection(port: int, deadline: float, counts: dict):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        while time.monotonic() < deadline:
+            writer.write(REQUEST)
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            await reader.readexactly(length)
+            status = head[9:12].decode()
+            counts[status] = counts.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+def _client(port: int, connections: int, seconds: float, queue):
+    counts = {}
+
+    async def run():
+        deadline = time.monotonic() + seconds
+        await asyncio.gather(*[_connection(port, deadline, counts) for _ in range(connections)])
+
+    asyncio.run(run())
+    queue.put(counts)
+
+
+def generate_load(port: int, connections: int, seconds: float, processes: int) -> dict:
+    queue = multiprocessing.Queue()
+    clients = [
+        multiprocessing.Process(target=_client, args=(port, max(1, connections // processes), seconds, queue))
+        for _ in range(processes)
+    ]
+    for c in clients:
+        c.start()
+    counts = {}
+    for _ in clients:
+        for status, n in queue.get().items():
+            counts[status] = counts.get(status, 0) + n
+    for c in clients:
+        c.join()
+    return counts
+
+
+def wait_ready(port: int, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1) as s:
+                s.sendall(b"GET /healthz HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n")
+                if s.recv(64).startswith(b"HTTP/1.1 200"):
+                    return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def worker_memory(parent_pid: int) -> list:
+    """ワーカーごとの (RSS, PSS, Private) MB"""
+    try:
+        with open(f"/proc/{parent_pid}/task/{parent_pid}/children") as f:
+            pids = [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+    rows = []
+    for pid in pids:
+        fields = {}
+        try:
+            with open(f"/proc/{pid}/smaps_rollup") as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                        fields[parts[0][:-1]] = int(parts[1]) / 1024
+        except OSError:
+            continue
+        rows.append((fields.get("Rss", 0), fields.get("Pss", 0),
+                     fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)))
+    return rows
+
+
+def measure(workers: int, port: int, args) -> dict:
+    env = dict(os.environ, PREFORK_STATE_DIR=tempfile.mkdtemp(prefix="bench_prefork_"))
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", str(workers), str(port)],
+                              env=env, cwd=BACKEND_DIR)
+    try:
+        wait_ready(port)
+        generate_load(port, 1, 0.5, 1)  # 解析結果をキャッシュに載せ、全ワーカーを温める
+        generate_load(port, args.connections, 1.0, args.clients)
+        counts = generate_load(port, args.connections, args.seconds, args.clients)
+        memory = worker_memory(server.pid)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+    ok = counts.get("200", 0)
+    return {
+        "workers": workers,
+        "rps": ok / args.seconds,
+        "errors": sum(counts.values()) - ok,
+        "memory": memory,
+    }
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == "--serve":
+        run_server(int(sys.argv[2]), int(sys.argv[3]))
+        return
+
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default=",".join(str(n) for n in (1, 2, 4, 8) if n == 1 or n * 2 <= cores))
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--connections", type=int, default=64)
+    parser.add_argument("--clients", type=int, default=max(1, cores // 2), help="負荷をかけるプロセス数")
+    parser.add_argument("--port", type=int, default=18765)
+    parser.add_argument("--min-efficiency", type=float, default=0.7)
+    args = parser.parse_args()
+    os.environ.setdefault("WEBHOOK_DB_PATH", os.path.join(tempfile.gettempdir(), "bench_prefork_webhooks.sqlite3"))
+    os.environ.setdefault("WARMUP_IN_BACKGROUND", "0")
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+    print(f"cores: {cores}  clients: {args.clients}  connections: {args.connections}")
+    print(f"{'workers':>7s} {'req/s':>9s} {'efficiency':>10s} {'errors':>6s}  {'RSS/worker':>10s} {'PSS/worker':>10s} {'private/worker':>14s}")
+    results, ok = [], True
+    for workers in (int(w) for w in args.workers.split(",")):
+        r = measure(workers, args.port, args)
+        results.append(r)
+        base = results[0]["rps"] / results[0]["workers"]
+        efficiency = r["rps"] / (workers * base) if base else 0.0
+        checked = workers * 2 <= cores or workers == 1
+        if checked and efficiency < args.min_efficiency:
+            ok = False
+        mem = r["memory"]
+        avg = [sum(m[i] for m in mem) / len(mem) if mem else 0.0 for i in range(3)]
+        print(f"{workers:7d} {r['rps']:9.0f} {efficiency:9.2f}{'' if checked else '*'} {r['errors']:6d}  "
+              f"{avg[0]:8.1f}MB {avg[1]:8.1f}MB {avg[2]:12.1f}MB")
+    print("* コア数が足りないため効率の判定から除外")
+    print("OK" if ok else f"FAIL: efficiency below {args.min_efficiency}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+解析プロンプトの入力トークン比較（変更前の f-string プロンプト vs テンプレート）
+
+    python benchmarks/bench_prompt.py
+
+1リクエストあたりの入力トークン見積もり（batch_analysis.estimate_tokens）を、
+system_instruction を含めた合計・毎回同じ接頭辞（キャッシュ対象）・リクエストごとの部分に分けて表示する。
+後半は、1行書き足して再解析したときの全文解析と差分更新（incremental_prompt）の比較
+（入力 + 出力の見積もり。system_instruction は共通なので除く。差分更新のほうが高くつく入力では全文解析になる）。
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_analysis import estimate_tokens  # noqa: E402
+from fakes import SAMPLE_ANALYSIS  # noqa: E402
+from incremental import estimate_costs, plan_edits  # noqa: E402
+from prompts import analysis_template, incremental_prompt, trim_to_budget  # noqa: E402
+
+# Gemini 2.5 Flash の暗黙的キャッシュが効く最小トークン数
+IMPLICIT_CACHE_MIN_TOKENS = 1024
+TOKEN_BUDGET = int(os.getenv("PROMPT_INPUT_TOKEN_BUDGET", "4500"))
+# 再解析で書き足す1行（音声入力の追記を想定）
+APPENDED_LINE = "\n吐き気もあって、今朝は1回吐いた。"
+
+NOTES = {
+    "short": "昨日の夜からお腹が痛い。朝起きたら熱が38度あった。",
+    "typical": (
+        "3日前から咳が止まらない。夜になるとひどくなる。痰は黄色。熱はない。喘息の持病あり。"
+        "普段はアムロジピン5mgを飲んでいる。アレルギーは特にない。息苦しさは少しある。"
+    ) * 2,
+    # 入力上限（4000文字）近くまで、同じ訴えを繰り返し・空白を多く含む入力
+    "near-limit": (
+        "今朝から右の頭がズキズキ痛む！！！！　光がまぶしい。\n\n"
+        "市販の頭痛薬を飲んだが効かない。。。吐き気もある。いたーーーい\n\n"
+    ) * 65,
+    # 繰り返しのない長い経過記録（入力上限内なので、既定の予算では中略されない）
+    "diary": "".join(f"{i}日目: 頭痛は朝に強く、夕方には軽くなる。体温は37.{i % 10}度。\n" for i in range(1, 120)),
+}
+
+# --- 変更前のプロンプト（main.py から移す前のもの） ---
+
+LEGACY_SYSTEM_INSTRUCTION = """
+あなたは救急・総合診療の経験豊富な「医療秘書AI」です。
+患者（ユーザー）の入力した症状から、医師が診断に必要な情報（OPQRST、既往歴、リスク因子）を抽出し、
+電子カルテにそのまま貼り付けられる「医学的サマリー」を作成してください。
+
+【重要：法的制約】
+1. あなたは医師ではありません。「診断（病名の断定）」は絶対に行わないでください。
+2. 「○○病の疑いがあります」といった病名の示唆も避けてください。
+3. 診療科の提案を行う場合は、あくまで「一般的に考えられる可能性」として提示し、断定的な表現を避けてください。
+
+【出力品質の基準】
+- 医師が短時間で状況を把握できる「専門的かつ簡潔」な表現を用いること。
+- 患者が「言ったこと」と「言わなかったこと（陰性所見）」を明確に区別すること。
+"""
+
+LEGACY_JSON_FORMAT = """{
+            "summary": {
+                "chief_complaint": "主訴（一番の症状を一言で。期間を含める。例: **3日前**からの発熱）",
+                "history": "現病歴（OPQRSTに基づき、時系列順に記述。重要な陰性所見（例: 呼吸苦はない）もあれば含める）",
+                "symptoms": "随伴症状（主訴に伴うその他の症状。箇条書き推奨）",
+                "background": "既往歴・服薬・アレルギー（入力になければ「特記なし」）"
+            },
+            "departments": ["診療科1", "診療科2"], 
+            "explanation": "ユーザーへの説明（日本語以外の場合のみ）"
+        }"""
+
+LEGACY_RULES = """重要指示: 
+        - 医師が読むためのカルテ用語（例: 「熱がある」→「発熱」、「お腹が痛い」→「腹痛」）に変換すること。
+        - **数値**（体温、回数）、**期間**（いつから）、**部位**（右下腹部など）は、医師が見落とさないよう **太字** で囲むこと（例: **38.5度**）。
+        - 否定された症状（「吐き気はない」など）も、鑑別診断に重要なため省略せずに記載すること。
+        - `departments` は、可能性のある診療科を広い範囲で抽出すること。"""
+
+
+def legacy_prompt(safe_text: str, language: str) -> str:
+    explanation_instruction = ""
+    if language not in ["Japanese", "日本語", "ja"]:
+         explanation_instruction = f"- `explanation`: ユーザーへの説明を{language}で記述（AIの理解を伝えるため）。"
+    else:
+         explanation_instruction = "- `explanation`: 空文字（\"\"）にしてください。"
+
+    prompt = f"""
+        以下の患者の訴えを分析し、以下のJSONフォーマットのみを出力してください。
+        Markdown記号（###など）は含めないでください。純粋なJSON文字列のみを返してください。
+
+        対象テキスト:
+        {safe_text}
+        
+        ユーザーの使用言語: {language}
+
+        【出力JSONフォーマット】
+        {LEGACY_JSON_FORMAT}
+
+        {LEGACY_RULES}
+        """
+    return prompt
+
+
+def report():
+    print(f"{'input':11s} {'chars':>6s} {'before':>7s} {'after':>7s} {'prefix':>7s} {'per-req':>8s} {'saved':>6s}  trim")
+    for language in ("Japanese", "English"):
+        template = analysis_template(language)
+        prefix = estimate_tokens(template.system)
+        for name, text in NOTES.items():
+            before = estimate_tokens(LEGACY_SYSTEM_INSTRUCTION) + estimate_tokens(legacy_prompt(text, language))
+            trimmed, method = trim_to_budget(text, TOKEN_BUDGET)
+            per_request = estimate_tokens(template.render(trimmed))
+            after = prefix + per_request
+            print(f"{name[:5] + '/' + language[:2]:11s} {len(text):6d} {before:7d} {after:7d} {prefix:7d} "
+                  f"{per_request:8d} {100 * (1 - after / before):5.0f}%  {method or '-'}")
+        cacheable = "yes" if prefix >= IMPLICIT_CACHE_MIN_TOKENS else f"no (< {IMPLICIT_CACHE_MIN_TOKENS})"
+        print(f"  {language}: static prefix ~{prefix} tokens, implicit cache eligible: {cacheable}")
+
+
+def report_incremental():
+    print(f"\n{'re-analyze':11s} {'full':>7s} {'incr':>7s} {'saved':>6s}")
+    template = analysis_template("Japanese")
+    for name, text in NOTES.items():
+        new_text = text + APPENDED_LINE
+        edits = plan_edits(text, new_text, max_ratio=0.3, max_chars=800)
+        full_prompt = template.render(trim_to_budget(new_text, TOKEN_BUDGET)[0])
+        if edits is None:
+            print(f"{name:11s} {estimate_tokens(full_prompt):7d} {'-':>7s} {'-':>6s}  (large change)")
+            continue
+        full, incremental = estimate_costs(full_prompt, incremental_prompt(SAMPLE_ANALYSIS, edits), SAMPLE_ANALYSIS)
+        note = "" if incremental < full else "  (full analysis is cheaper)"
+        print(f"{name:11s} {full:7d} {incremental:7d} {100 * (1 - incremental / full):5.0f}%{note}")
+
+
+if __name__ == "__main__":
+    report()
+    report_incremental()
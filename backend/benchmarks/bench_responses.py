@@ -0,0 +1,140 @@
+"""
+レスポンスの直列化・圧縮の計測（送信バイト数と1レスポンスあたりのサーバーCPU時間）
+
+    python benchmarks/bench_responses.py [--iterations 2000] [--requests 300]
+
+1. 単体: 解析結果・履歴1ページ・PDF を次の3通りで書き出したときの CPU時間と本文サイズ
+   - default      : FastAPI 既定（jsonable_encoder → json.dumps、圧縮なし）
+   - fast         : responses.json_response（orjson + その場で圧縮）
+   - pass-through : 直列化・圧縮済みの EncodedBody をそのまま返す（キャッシュヒット時）
+2. 通し: キャッシュに当たる /analyze を Accept-Encoding を変えて呼び、本文サイズと CPU時間を測る
+"""
+import argparse
+import asyncio
+import copy
+import os
+import sys
+import tempfile
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+import responses  # noqa: E402
+from fakes import SAMPLE_ANALYSIS  # noqa: E402
+
+ANALYSIS = copy.deepcopy(SAMPLE_ANALYSIS)
+ANALYSIS["summary"]["history"] = (
+    "**3日前**の夜から悪寒を伴う発熱あり（最高**38.5度**）。**昨日**より**右下腹部**に痛みが出現し、徐々に増悪。"
+    "食欲低下あり。嘔吐は**2回**。下痢はない。呼吸苦はない。市販の解熱剤を**1回**内服したが効果は乏しい。"
+)
+ANALYSIS["departments"] = ["内科", "消化器内科", "外科"]
+ANALYSIS["model"] = "gemini-2.5-flash"
+
+HISTORY_PAGE = {
+    "items": [{
+        "id": f"0f8c2a9e-1b7d-4c55-9a0e-{i:012d}", "user_id": "6a1d4e0c-2f3b-4a8e-b1c9-7d5e3f2a1b0c",
+        "created_at": f"2026-10-{1 + i % 28:02d}T09:{i % 60:02d}:00.000000+00:00", "is_private": False,
+        "chief_complaint": "**3日前**からの発熱", "preview": ANALYSIS["summary"]["history"][:120],
+        "departments": ["内科", "消化器内科"], "display_name": "母", "is_me": i % 2 == 0,
+    } for i in range(20)],
+    "next_cursor": "2026-10-01T09:00:00.000000+00:00",
+}
+
+ENCODINGS = ("identity", "gzip", "br")
+
+
+def fake_request(encoding: str):
+    return types.SimpleNamespace(headers={"accept-encoding": "" if encoding == "identity" else encoding})
+
+
+def cpu_per_call(fn, iterations: int) -> float:
+    """1回あたりのCPU時間（マイクロ秒）"""
+    started = time.process_time()
+    for _ in range(iterations):
+        fn()
+    return (time.process_time() - started) / iterations * 1e6
+
+
+def unit_results(iterations: int, pdf_bytes: bytes) -> list:
+    rows = []
+    for name, obj in (("analysis", ANALYSIS), ("history", HISTORY_PAGE)):
+        default = JSONResponse(jsonable_encoder(obj)).body
+        rows.append((name, "default", "identity", len(default),
+                     cpu_per_call(lambda: JSONResponse(jsonable_encoder(obj)), iterations)))
+        prepared = responses.EncodedBody.json(obj).prepare()
+        for encoding in ENCODINGS:
+            if encoding == "br" and responses.brotli is None:
+                continue
+            request = fake_request(encoding)
+            size = len(responses.json_response(request, obj).body)
+            rows.append((name, "fast", encoding, size,
+                         cpu_per_call(lambda: responses.json_response(request, obj), iterations)))
+            rows.append((name, "pass-through", encoding, size,
+                         cpu_per_call(lambda: responses.encoded_response(request, prepared), iterations)))
+
+    prepared = responses.EncodedBody(pdf_bytes, "application/pdf").prepare()
+    for encoding in ENCODINGS:
+        if encoding == "br" and responses.brotli is None:
+            continue
+        request = fake_request(encoding)
+        size = len(responses.encoded_response(request, prepared).body)
+        rows.append(("pdf", "fast", encoding, size, cpu_per_call(
+            lambda: responses.encoded_response(request, responses.EncodedBody(pdf_bytes, "application/pdf")),
+            max(1, iterations // 10))))
+        rows.append(("pdf", "pass-through", encoding, size,
+                     cpu_per_call(lambda: responses.encoded_response(request, prepared), iterations)))
+    return rows
+
+
+async def end_to_end(requests: int) -> list:
+    import httpx
+    import main
+    from fakes import FakeGenerativeModel, LatencyProfile
+
+    main.gemini_model.set(FakeGenerativeModel(LatencyProfile(), response={k: v for k, v in ANALYSIS.items() if k != "model"}))
+    rows = []
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            payload = {"text": "昨日の夜からお腹が痛い。朝起きたら熱が38度あった。吐き気もある。"}
+            await client.post("/analyze", json=payload)  # 1回目でキャッシュに載せる
+            for encoding in ENCODINGS:
+                if encoding == "br" and responses.brotli is None:
+                    continue
+                headers = {"Accept-Encoding": encoding}
+                wire = 0
+                started = time.process_time()
+                for _ in range(requests):
+                    async with client.stream("POST", "/analyze", json=payload, headers=headers) as r:
+                        wire = sum([len(chunk) async for chunk in r.aiter_raw()])
+                cpu = (time.process_time() - started) / requests * 1e6
+                rows.append(("/analyze (hit)", "app", encoding, wire, cpu))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+    os.environ.setdefault("WEBHOOK_DB_PATH", os.path.join(tempfile.gettempdir(), "bench_responses_webhooks.sqlite3"))
+    os.environ.setdefault("WARMUP_IN_BACKGROUND", "0")
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+    from pdf_renderer import render_pdf
+    from bench_pdf import SAMPLE_TEXT
+    pdf_bytes = render_pdf(SAMPLE_TEXT, "A4")
+
+    print(f"json encoder: {'orjson' if responses.orjson else 'json (stdlib)'}  "
+          f"brotli: {'yes' if responses.brotli else 'no'}")
+    print(f"{'payload':16s} {'path':13s} {'encoding':9s} {'bytes':>8s} {'cpu/resp':>10s}")
+    for payload, path, encoding, size, cpu in unit_results(args.iterations, pdf_bytes) + asyncio.run(end_to_end(args.requests)):
+        print(f"{payload:16s} {path:13s} {encoding:9s} {size:8d} {cpu:8.1f}us")
+
+
+if __name__ == "__main__":
+    main()
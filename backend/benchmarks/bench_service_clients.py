@@ -0,0 +1,239 @@
+"""
+Stripe / Supabase 呼び出しのレイテンシ比較（同期SDK → 共有の非同期クライアント）
+
+    python benchmarks/bench_service_clients.py [--latency-ms 40] [--calls 200] [--concurrency 32] [--min-speedup 1.0]
+
+Stripe（POST /v1/checkout/sessions）と Supabase（GET /rest/v1/profiles・GET /auth/v1/user）の
+ローカルHTTP代替を別プロセスで起動し、同じ呼び出しを2通りで --concurrency 並列に送る。
+- before: 変更前の呼び出し方（stripe-python の同期呼び出しをハンドラ内で直接・supabase-py の同期クライアントをスレッドで）
+- after:  main.py の共有クライアント（service_clients.ServiceClient 経由の stripe_api / supabase.AsyncClient）
+呼び出しごとの p50 / p95、スループット、代替サーバーが受け付けたTCP接続数、
+計測中のイベントループの最大遅延（他のリクエストがどれだけ待たされるか）を表示する。
+after のスループットが before の --min-speedup 倍未満の呼び出しがあれば終了コード 1。
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+USER = {
+    "id": "user-1", "aud": "authenticated", "role": "authenticated", "email": "user@example.com",
+    "app_metadata": {}, "user_metadata": {}, "created_at": "2026-01-01T00:00:00Z",
+}
+PROFILE = {"id": "user-1", "display_name": "bench", "plan_type": "pro_monthly",
+           "subscription_status": "active", "stripe_customer_id": "cus_bench"}
+
+
+# --- ローカルHTTP代替（別プロセス。HTTP/1.1 keep-alive） ---
+
+def run_stand_in(port: int, latency: float, ready):
+    stats = {"connections": 0, "requests": 0}
+
+    def route(method: str, path: str):
+        if path.startswith("/__stats"):
+            return 200, dict(stats)
+        if method == "POST" and path.startswith("/v1/checkout/sessions"):
+            return 200, {"id": f"cs_test_{stats['requests']}", "object": "checkout.session",
+                         "url": "https://checkout.stripe.test/session"}
+        if path.startswith("/rest/v1/profiles"):
+            return 200, [PROFILE]
+        if path.startswith("/auth/v1/user"):
+            return 200, USER
+        return 404, {"error": {"message": f"no route for {method} {path}"}}
+
+    async def handle(reader, writer):
+        stats["connections"] += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                method, path, _ = lines[0].split(" ", 2)
+                headers = {k.strip().lower(): v.strip() for k, v in (l.split(":", 1) for l in lines[1:] if ":" in l)}
+                await reader.readexactly(int(headers.get("content-length", "0")))
+                if not path.startswith("/__"):
+                    stats["requests"] += 1
+                    await asyncio.sleep(latency)
+                status, body = route(method, path)
+                data = json.dumps(body).encode()
+                close = headers.get("connection", "").lower() == "close"
+                writer.write(
+                    f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                    f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def main():
+        server = await asyncio.start_server(handle, "127.0.0.1", port, backlog=1024)
+        ready.set()
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(main())
+
+
+async def stand_in_connections(client, base: str) -> int:
+    return (await client.get(f"{base}/__stats")).json()["connections"]
+
+
+# --- 呼び出し方 ---
+
+def before_calls(base: str) -> dict:
+    """変更前: 同期SDK（Stripe はイベントループ上で直接、Supabase はスレッドで）"""
+    import stripe
+    from supabase import create_client
+
+    stripe.api_key = "sk_test_bench"
+    stripe.api_base = base
+    supabase = create_client(base, "service-role-key")
+
+    async def checkout():
+        stripe.checkout.Session.create(
+            mode="subscription", line_items=[{"price": "price_bench", "quantity": 1}],
+            success_url="https://example.com/ok", metadata={"user_id": "user-1"},
+        )
+
+    async def profile():
+        await asyncio.to_thread(
+            lambda: supabase.table("profiles").select("*").eq("id", "user-1").limit(1).execute())
+
+    async def auth():
+        await asyncio.to_thread(supabase.auth.get_user, "user-token")
+
+    return {"checkout": checkout, "profile": profile, "auth": auth}
+
+
+def after_calls() -> dict:
+    """変更後: main.py の共有クライアント"""
+    import main
+
+    async def checkout():
+        await main.stripe_api.create_checkout_session(
+            mode="subscription", line_items=[{"price": "price_bench", "quantity": 1}],
+            success_url="https://example.com/ok", metadata={"user_id": "user-1"},
+        )
+
+    async def profile():
+        assert await main.fetch_profile("user-1")
+
+    async def auth():
+        assert await main.get_user_id_from_token("Bearer user-token") == "user-1"
+
+    return {"checkout": checkout, "profile": profile, "auth": auth}
+
+
+async def measure(call, calls: int, concurrency: int) -> dict:
+    latencies, errors = [], []
+    max_lag = 0.0
+    done = asyncio.Event()
+
+    async def ticker():
+        nonlocal max_lag
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.005)
+            max_lag = max(max_lag, time.perf_counter() - started - 0.005)
+
+    remaining = iter(range(calls))
+
+    async def worker():
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                await call()
+            except Exception as e:
+                errors.append(e)
+            latencies.append(time.perf_counter() - started)
+
+    tick = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    done.set()
+    await tick
+    if errors:
+        print(f"  errors: {len(errors)} (first: {errors[0]!r})")
+    latencies.sort()
+    return {
+        "rps": calls / elapsed,
+        "p50": statistics.median(latencies) * 1000,
+        "p95": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "max_lag": max_lag * 1000,
+        "errors": len(errors),
+    }
+
+
+async def run(args, base: str) -> bool:
+    import httpx
+
+    results = {}
+    async with httpx.AsyncClient(headers={"Connection": "close"}) as probe:
+        for mode, calls in (("before", before_calls(base)), ("after", after_calls())):
+            for name, call in calls.items():
+                await call()  # 接続・SDK の初期化を計測から外す
+                opened = await stand_in_connections(probe, base)
+                r = await measure(call, args.calls, args.concurrency)
+                # 集計の取得自体も1接続（Connection: close）
+                r["connections"] = await stand_in_connections(probe, base) - opened - 1
+                results[(name, mode)] = r
+
+    import main
+    await main.close_service_clients()
+
+    print(f"stand-in latency {args.latency_ms:g}ms  calls {args.calls}  concurrency {args.concurrency}")
+    print(f"{'call':9s} {'mode':7s} {'req/s':>8s} {'p50':>9s} {'p95':>9s} {'new conns':>9s} {'loop lag':>9s}")
+    ok = True
+    for name in ("checkout", "profile", "auth"):
+        for mode in ("before", "after"):
+            r = results[(name, mode)]
+            print(f"{name:9s} {mode:7s} {r['rps']:8.1f} {r['p50']:7.1f}ms {r['p95']:7.1f}ms "
+                  f"{r['connections']:9d} {r['max_lag']:7.1f}ms")
+        speedup = results[(name, "after")]["rps"] / results[(name, "before")]["rps"]
+        if speedup < args.min_speedup or results[(name, "after")]["errors"]:
+            ok = False
+        print(f"{'':9s} speedup x{speedup:.1f}")
+    print("OK" if ok else f"FAIL: speedup below {args.min_speedup} or errors")
+    return ok
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency-ms", type=float, default=40.0, help="代替サーバーの応答時間")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--port", type=int, default=18780)
+    parser.add_argument("--min-speedup", type=float, default=1.0)
+    args = parser.parse_args()
+
+    base = f"http://127.0.0.1:{args.port}"
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=run_stand_in, args=(args.port, args.latency_ms / 1000, ready), daemon=True)
+    server.start()
+    ready.wait(10)
+
+    os.environ.update(
+        SUPABASE_URL=base, SUPABASE_SERVICE_ROLE_KEY="service-role-key",
+        STRIPE_SECRET_KEY="sk_test_bench", STRIPE_API_BASE=base,
+        WARMUP_IN_BACKGROUND="0", RATE_LIMIT_ENABLED="0",
+    )
+    os.environ.pop("USE_LOCAL_SUPABASE", None)
+    try:
+        ok = asyncio.run(run(args, base))
+    finally:
+        server.terminate()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main_()
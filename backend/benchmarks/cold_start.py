@@ -0,0 +1,98 @@
+"""
+バックエンドのコールドスタート計測
+
+    python benchmarks/cold_start.py [--budget 2.0] [--top 15] [--port 8765]
+
+1. python -X importtime で `import main` のモジュール別読み込み時間（累計）を表示
+2. `import main` の直後に重いSDK（HEAVY_MODULES）が読み込まれていないかを確認
+3. uvicorn を起動し、/healthz が応答するまでの時間（time-to-first-ready）を計測
+
+time-to-first-ready が --budget 秒 (環境変数 COLD_START_BUDGET) を超えるか、
+重いSDKが起動時に読み込まれていると終了コード 1 を返す。（tests/test_cold_start.py からも使う）
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COLD_START_BUDGET = float(os.getenv("COLD_START_BUDGET", "2.0"))
+# 初回利用時まで読み込みを遅らせているSDK
+HEAVY_MODULES = ("google.generativeai", "stripe", "reportlab")
+
+
+def import_profile(top: int) -> list:
+    """[(累計マイクロ秒, 自身のマイクロ秒, モジュール名), ...] を累計の大きい順に返す"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue  # ヘッダー行
+        rows.append((cumulative_us, self_us, parts[2].strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def heavy_modules_after_import() -> list:
+    """新しいプロセスで `import main` した直後に読み込まれている HEAVY_MODULES"""
+    code = f"import sys, main; print('loaded:', *(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    proc = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    # main は設定の警告を標準出力に出すので、最後の行だけを見る
+    return proc.stdout.splitlines()[-1].split()[1:]
+
+
+def time_to_first_ready(port: int, timeout: float = 30.0, env: dict = None) -> float:
+    env = dict(os.environ if env is None else env, STARTUP_PROFILE="1")
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {proc.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=1) as r:
+                    if r.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError(f"/healthz did not respond within {timeout}s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=float, default=COLD_START_BUDGET)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    print(f"{'cumulative':>12s} {'self':>10s}  module")
+    for cumulative_us, self_us, name in import_profile(args.top):
+        print(f"{cumulative_us / 1000:10.1f}ms {self_us / 1000:8.1f}ms  {name}")
+
+    heavy = heavy_modules_after_import()
+    print(f"heavy modules after `import main`: {', '.join(heavy) or 'none'}")
+
+    ready = time_to_first_ready(args.port)
+    ok = ready <= args.budget and not heavy
+    print(f"time-to-first-ready {ready:.2f}s (budget {args.budget:.2f}s)  {'OK' if ok else 'OVER BUDGET'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
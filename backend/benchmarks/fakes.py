@@ -0,0 +1,175 @@
+"""
+ベンチマーク用の外部サービス代替（Gemini / Stripe / Supabase）
+
+有料APIを呼ばずに main.py の各経路を動かすため、応答時間の分布と失敗率を設定できる。
+
+    gemini = FakeGenerativeModel(LatencyProfile.parse("800,0.4,0.01"))
+    main.gemini_model.set(gemini)
+"""
+import asyncio
+import json
+import math
+import random
+import types
+
+from batch_analysis import estimate_tokens
+from local_supabase import LocalSupabase
+
+
+class FakeUpstreamError(Exception):
+    """代替サービスが失敗率に従って投げるエラー"""
+
+
+class LatencyProfile:
+    """
+    対数正規分布の応答時間 + 一定確率の失敗
+    median_ms: 中央値（ミリ秒）、sigma: ばらつき（0 なら固定）、failure_rate: 0〜1
+    """
+
+    def __init__(self, median_ms: float = 0.0, sigma: float = 0.0, failure_rate: float = 0.0, seed: int = None):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+
+    @classmethod
+    def parse(cls, spec: str, seed: int = None) -> "LatencyProfile":
+        """"中央値ms[,sigma[,失敗率]]" 形式（例: "800,0.4,0.01"）"""
+        parts = [float(p) for p in spec.split(",")] if spec else []
+        return cls(*parts, seed=seed)
+
+    def sample(self) -> float:
+        """待ち時間（秒）"""
+        if self.median_ms <= 0:
+            return 0.0
+        return self.median_ms * math.exp(self.sigma * self._rng.gauss(0, 1)) / 1000
+
+    def should_fail(self) -> bool:
+        return self.failure_rate > 0 and self._rng.random() < self.failure_rate
+
+    def describe(self) -> dict:
+        return {"median_ms": self.median_ms, "sigma": self.sigma, "failure_rate": self.failure_rate}
+
+
+# --- Gemini ---
+
+SAMPLE_ANALYSIS = {
+    "summary": {
+        "chief_complaint": "**3日前**からの発熱",
+        "history": "**3日前**の夜から悪寒を伴う発熱あり。",
+        "symptoms": "- 悪寒\n- 食欲不振",
+        "background": "特記なし",
+    },
+    "departments": ["内科"],
+    "explanation": "",
+}
+
+
+class FakeResponse:
+    """generate_content_async の戻り値（.text / .usage_metadata / stream=True なら async for）"""
+
+    def __init__(self, text: str, prompt_tokens: int, chunk_size: int = 40):
+        self.text = text
+        self.usage_metadata = types.SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=estimate_tokens(text),
+            total_token_count=prompt_tokens + estimate_tokens(text),
+        )
+        self._chunk_size = chunk_size
+
+    def __aiter__(self):
+        async def chunks():
+            for i in range(0, len(self.text), self._chunk_size):
+                await asyncio.sleep(0)
+                yield types.SimpleNamespace(text=self.text[i:i + self._chunk_size])
+        return chunks()
+
+
+class FakeGenerativeModel:
+    """
+    main.GeminiModels / genai.GenerativeModel の代替。常に SAMPLE_ANALYSIS（バッチなら配列）を返す
+    for_system() で system_instruction を付けたモデルを返す（トークン数に含める）
+    """
+
+    def __init__(self, latency: LatencyProfile, response: dict = None, system: str = "", parent=None,
+                 latency_by_model: dict = None):
+        self.latency = latency
+        self.response = response or SAMPLE_ANALYSIS
+        self.system = system
+        self._parent = parent
+        # モデル名ごとに応答時間・失敗率を変える（フォールバック・ヘッジの確認用）
+        self.latency_by_model = latency_by_model or {}
+        self.calls = 0
+        self.failures = 0
+
+    def for_system(self, system: str, model_name: str = None) -> "FakeGenerativeModel":
+        root = self._parent or self
+        latency = root.latency_by_model.get(model_name, root.latency)
+        return FakeGenerativeModel(latency, self.response, system, parent=root)
+
+    async def generate_content_async(self, prompt, generation_config=None, stream=False, **kwargs):
+        counter = self._parent or self
+        counter.calls += 1
+        await asyncio.sleep(self.latency.sample())
+        if self.latency.should_fail():
+            counter.failures += 1
+            raise FakeUpstreamError("fake Gemini failure")
+        prompt_text = prompt if isinstance(prompt, str) else json.dumps(prompt, ensure_ascii=False, default=str)
+        ids = [line.split("=", 1)[1].rstrip("]") for line in prompt_text.split() if line.startswith("[id=")]
+        body = [dict(self.response, id=i) for i in ids] if ids else self.response
+        return FakeResponse(json.dumps(body, ensure_ascii=False), estimate_tokens(self.system + prompt_text))
+
+
+# --- Stripe ---
+
+class FakeStripe:
+    """
+    stripe モジュールの代替（Webhook.construct_event）
+    署名検証はローカル処理なので待ち時間なし。失敗率に従って署名エラーにする
+    Checkout セッションの作成は stripe_api（HTTP）経由なので、bench_service_clients.py のローカルHTTP代替を使う
+    """
+
+    def __init__(self, latency: LatencyProfile):
+        self.latency = latency
+        self.calls = 0
+        fake = self
+
+        class Webhook:
+            @staticmethod
+            def construct_event(payload, sig_header, secret):
+                fake.calls += 1
+                if fake.latency.should_fail():
+                    raise FakeUpstreamError("fake signature verification failure")
+                return json.loads(payload)
+
+        self.Webhook = Webhook
+        self.api_key = None
+
+
+# --- Supabase ---
+
+class _FakeAuth:
+    def __init__(self, owner):
+        self._owner = owner
+
+    async def get_user(self, token: str):
+        """トークン文字列をそのままユーザーIDとして扱う"""
+        await asyncio.sleep(self._owner.latency.sample())
+        if self._owner.latency.should_fail():
+            raise FakeUpstreamError("fake Supabase auth failure")
+        return types.SimpleNamespace(user=types.SimpleNamespace(id=token))
+
+
+class FakeSupabase(LocalSupabase):
+    """LocalSupabase に応答時間と失敗率を加えたもの（supabase-py の AsyncClient と同じく非同期呼び出し）"""
+
+    def __init__(self, latency: LatencyProfile, tables: dict = None):
+        super().__init__(tables)
+        self.latency = latency
+        self.auth = _FakeAuth(self)
+
+    async def _execute(self, q):
+        await asyncio.sleep(self.latency.sample())
+        if self.latency.should_fail():
+            raise FakeUpstreamError("fake Supabase failure")
+        return await super()._execute(q)
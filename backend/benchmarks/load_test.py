@@ -0,0 +1,227 @@
+"""
+/analyze・/pdf・/webhook の負荷試験（Gemini / Stripe / Supabase はローカル代替）
+
+    python benchmarks/load_test.py [--endpoints analyze,pdf,webhook] [--requests 200] [--concurrency 16]
+        [--gemini 800,0.4,0.01] [--stripe 0,0,0] [--supabase 40,0.3,0]
+        [--hit-ratio 0] [--output results.json] [--compare 前回のresults.json]
+
+--gemini / --stripe / --supabase は "中央値ms[,sigma[,失敗率]]"（対数正規分布, benchmarks/fakes.py）。
+アプリはプロセス内で ASGI 経由で呼び出す（ネットワーク・uvicorn のオーバーヘッドは含まない）。
+エンドポイントごとにスループットと p50/p95/p99 レイテンシを表示し、JSON に保存する。
+"""
+import argparse
+import asyncio
+import datetime
+import hashlib
+import hmac
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+WEBHOOK_SECRET = "whsec_load_test"
+
+NOTES = [
+    "昨日の夜からお腹が痛い。朝起きたら熱が38度あった。吐き気もあって、水しか飲めていない。",
+    "3日前から咳が止まらない。夜になるとひどくなる。痰は黄色。熱はない。喘息の持病あり。",
+    "今朝から右の頭がズキズキ痛む。光がまぶしい。市販の頭痛薬を飲んだが効かない。",
+    "1週間前から腰が痛い。重いものを持ってから。足のしびれはない。高血圧の薬を飲んでいる。",
+]
+
+PDF_TEXT = "\n".join([
+    "■ 主訴", "**3日前**からの発熱（最高**38.5度**）", "",
+    "■ 現病歴", "**3日前**の夜から悪寒を伴う発熱あり。**昨日**より**右下腹部**に痛みが出現し、徐々に増悪。", "",
+    "■ 随伴症状", "- 悪寒", "- 食欲不振", "",
+    "■ 既往歴・服薬・アレルギー", "特記なし",
+])
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    """最近傍順位法"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(p / 100 * len(sorted_values) + 0.5 - 1e-9))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: list, statuses: dict, elapsed: float) -> dict:
+    values = sorted(latencies)
+    ok = sum(n for code, n in statuses.items() if code.startswith("2") or code == "304")
+    return {
+        "requests": len(values),
+        "ok": ok,
+        "errors": len(values) - ok,
+        "statuses": statuses,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(values) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(values) / len(values) * 1000, 1) if values else 0.0,
+            "p50": round(percentile(values, 50) * 1000, 1),
+            "p95": round(percentile(values, 95) * 1000, 1),
+            "p99": round(percentile(values, 99) * 1000, 1),
+            "max": round(values[-1] * 1000, 1) if values else 0.0,
+        },
+    }
+
+
+def sign_webhook(body: str) -> dict:
+    t = int(time.time())
+    sig = hmac.new(WEBHOOK_SECRET.encode(), f"{t}.{body}".encode(), hashlib.sha256).hexdigest()
+    return {"stripe-signature": f"t={t},v1={sig}", "content-type": "application/json"}
+
+
+def make_request(endpoint: str, i: int, hit_ratio: float, run_id: str):
+    """(method, path, kwargs) を返す。hit_ratio の割合で同じ内容を繰り返してキャッシュに当てる"""
+    repeat = (i % 100) < hit_ratio * 100
+    variant = "" if repeat else f"\n（{run_id}-{i}）"
+    if endpoint == "analyze":
+        return "POST", "/analyze", {"json": {"text": NOTES[i % len(NOTES)] + variant, "language": "Japanese"}}
+    if endpoint == "pdf":
+        return "POST", "/pdf", {"json": {"text": PDF_TEXT + variant, "pdf_size": "A4"}}
+    if endpoint == "webhook":
+        event_id = f"evt_load_{run_id}_{0 if repeat else i}"
+        body = json.dumps({
+            "id": event_id, "object": "event", "type": "checkout.session.completed",
+            "data": {"object": {"client_reference_id": f"user_{i % 50}", "customer": f"cus_{i % 50}",
+                                "metadata": {"plan_type": "pro_monthly"}}},
+        })
+        return "POST", "/webhook", {"content": body, "headers": sign_webhook(body)}
+    raise ValueError(f"unknown endpoint: {endpoint}")
+
+
+async def drive(client, endpoint: str, requests: int, concurrency: int, hit_ratio: float, run_id: str) -> dict:
+    latencies, statuses = [], {}
+    counter = iter(range(requests))
+
+    async def worker():
+        for i in counter:
+            method, path, kwargs = make_request(endpoint, i, hit_ratio, run_id)
+            started = time.perf_counter()
+            try:
+                status = str((await client.request(method, path, **kwargs)).status_code)
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return summarize(latencies, statuses, time.perf_counter() - started)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True).stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+
+async def run(args) -> dict:
+    import httpx
+    import main
+    from fakes import FakeGenerativeModel, FakeStripe, FakeSupabase, LatencyProfile
+
+    gemini = FakeGenerativeModel(LatencyProfile.parse(args.gemini, seed=args.seed))
+    stripe = FakeStripe(LatencyProfile.parse(args.stripe, seed=args.seed))
+    supabase = FakeSupabase(LatencyProfile.parse(args.supabase, seed=args.seed))
+    main.gemini_model.set(gemini)
+    main.stripe_sdk.set(stripe)
+    main.supabase_client.set(supabase)
+
+    run_id = datetime.datetime.now().strftime("%H%M%S%f")
+    results = {}
+    async with main.app.router.lifespan_context(main.app):
+        await asyncio.to_thread(main.pdf_pool.start)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=60) as client:
+            for endpoint in args.endpoints.split(","):
+                endpoint = endpoint.strip()
+                results[endpoint] = await drive(client, endpoint, args.requests, args.concurrency,
+                                                args.hit_ratio, run_id)
+        if "webhook" in results:
+            # キューに入ったジョブが処理し終わるまで待つ（Supabase代替の遅延・失敗を含む）
+            deadline = time.perf_counter() + 30
+            while time.perf_counter() < deadline:
+                stats = main.webhook_queue.stats()
+                if not stats.get("pending", 0) and not stats.get("running", 0):
+                    break
+                await asyncio.sleep(0.1)
+            results["webhook"]["queue"] = main.webhook_queue.stats()
+
+    return {
+        "revision": git_revision(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "hit_ratio": args.hit_ratio,
+            "gemini": gemini.latency.describe(),
+            "stripe": stripe.latency.describe(),
+            "supabase": supabase.latency.describe(),
+        },
+        "upstream_calls": {"gemini": gemini.calls, "stripe": stripe.calls, "supabase": supabase.calls},
+        "endpoints": results,
+    }
+
+
+def print_report(report: dict, baseline: dict = None):
+    print(f"revision {report['revision']}  requests {report['config']['requests']}  "
+          f"concurrency {report['config']['concurrency']}")
+    print(f"{'endpoint':10s} {'rps':>8s} {'p50':>9s} {'p95':>9s} {'p99':>9s} {'errors':>7s}")
+    for endpoint, r in report["endpoints"].items():
+        lat = r["latency_ms"]
+        line = (f"{endpoint:10s} {r['throughput_rps']:8.1f} {lat['p50']:7.1f}ms {lat['p95']:7.1f}ms "
+                f"{lat['p99']:7.1f}ms {r['errors']:7d}")
+        before = (baseline or {}).get("endpoints", {}).get(endpoint)
+        if before:
+            line += (f"   vs {baseline['revision']}: rps {r['throughput_rps'] - before['throughput_rps']:+.1f}"
+                     f"  p95 {lat['p95'] - before['latency_ms']['p95']:+.1f}ms")
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--endpoints", default="analyze,pdf,webhook")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--gemini", default="800,0.4,0.01")
+    parser.add_argument("--stripe", default="0,0,0")
+    parser.add_argument("--supabase", default="40,0.3,0")
+    parser.add_argument("--hit-ratio", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", default=None)
+    args = parser.parse_args()
+
+    # main の import 前に、ローカル専用の設定にしておく
+    os.environ.setdefault("WEBHOOK_DB_PATH", os.path.join(tempfile.mkdtemp(), "webhook_jobs.sqlite3"))
+    os.environ.setdefault("STRIPE_WEBHOOK_SECRET", WEBHOOK_SECRET)
+    os.environ.setdefault("WARMUP_IN_BACKGROUND", "0")
+    # 全リクエストが同じ送信元になるため、利用者ごとのレート制限は外す
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    report = asyncio.run(run(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    output = args.output or os.path.join(
+        BACKEND_DIR, "benchmarks", "results", f"load_{report['revision']}_{datetime.datetime.now():%Y%m%d_%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"saved {output}")
+
+
+if __name__ == "__main__":
+    main()
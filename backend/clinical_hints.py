@@ -0,0 +1,169 @@
+import re
+from typing import List, NamedTuple
+
+# ==========================================
+# 数値・期間・部位・用語のローカル抽出
+# ==========================================
+# 以前は「数値・期間・部位を見つけて **太字** にする」「熱がある→発熱 のように言い換える」を
+# すべて Gemini に任せていたため、その分の指示文・出力トークン（** 記号）・待ち時間がかかっていた。
+# ここでは mask_pii 後のテキストから規則と辞書で抽出し、
+#   - 用語の言い換えは短いヒントとしてプロンプトに付ける（指示文から言い換えの例・太字の指示を外せる）
+#   - 太字は生成後のサマリーにこちらで付ける（emphasize。Gemini には付けさせない）
+# どちらも正規表現1本で1回だけ走査する。
+
+# --- 全角 → 半角 ---
+_WIDTH_TABLE = str.maketrans("０１２３４５６７８９．％／：", "0123456789.%/:")
+_WIDE_RE = re.compile("[０-９．％／：]")
+
+
+def normalize_width(text: str) -> str:
+    """全角の数字・小数点・％・／を半角にする（「３８．５度」→「38.5度」）"""
+    # translate は非ASCIIの文字列だと1文字ずつ処理するため、対象の文字がなければそのまま返す
+    return text.translate(_WIDTH_TABLE) if _WIDE_RE.search(text) else text
+
+
+# --- 辞書 ---
+
+# 患者の表現 → カルテ用語（長い表現から順に照合する）
+LAY_TERMS = {
+    "熱がある": "発熱", "熱が出た": "発熱", "熱が出る": "発熱", "熱っぽい": "微熱感",
+    "寒気": "悪寒", "さむけ": "悪寒",
+    "お腹が痛い": "腹痛", "おなかが痛い": "腹痛", "お腹が痛む": "腹痛", "腹が痛い": "腹痛",
+    "頭が痛い": "頭痛", "頭が痛む": "頭痛", "頭がズキズキ": "拍動性頭痛",
+    "喉が痛い": "咽頭痛", "のどが痛い": "咽頭痛",
+    "胸が痛い": "胸痛", "胸が苦しい": "胸部圧迫感", "胸がドキドキ": "動悸", "ドキドキする": "動悸",
+    "腰が痛い": "腰痛", "背中が痛い": "背部痛",
+    "咳が出る": "咳嗽", "咳が止まらない": "遷延する咳嗽", "痰が出る": "喀痰",
+    "息苦しい": "呼吸困難感", "息が苦しい": "呼吸困難感", "息切れ": "労作時息切れ",
+    "鼻水": "鼻汁", "鼻づまり": "鼻閉",
+    "吐き気": "嘔気", "むかむか": "嘔気", "ムカムカ": "嘔気",
+    "吐いた": "嘔吐", "戻した": "嘔吐",
+    "お腹を下した": "下痢", "下した": "下痢", "便が出ない": "便秘",
+    "めまいがする": "めまい", "ふらふらする": "ふらつき", "フラフラする": "ふらつき",
+    "しびれ": "しびれ（感覚障害）", "むくみ": "浮腫", "かゆい": "瘙痒感", "痒い": "瘙痒感",
+    "だるい": "倦怠感", "だるさ": "倦怠感", "食欲がない": "食欲不振",
+    "眠れない": "不眠", "まぶしい": "羞明", "光がまぶしい": "羞明", "耳鳴り": "耳鳴",
+    "おしっこが痛い": "排尿時痛", "トイレが近い": "頻尿",
+}
+
+# 部位（左右などが付いていれば左右を含めて1つの部位にする）
+SITES = (
+    "右下腹部", "左下腹部", "右上腹部", "左上腹部", "右季肋部", "左季肋部", "心窩部", "臍周囲",
+    "下腹部", "上腹部", "側腹部", "腹部", "みぞおち", "へその周り",
+    "前頭部", "側頭部", "後頭部", "頭頂部", "こめかみ", "胸骨の裏", "前胸部", "胸部",
+    "頸部", "首", "肩", "背部", "背中", "腰部", "腰", "脇腹",
+    "目", "耳", "喉", "のど", "歯", "胸", "腕", "肘", "手首", "手", "指",
+    "股関節", "太もも", "膝", "すね", "ふくらはぎ", "足首", "足", "かかと",
+)
+# 単独でも部位として扱う語（「腹部」「胸」などは左右がなければ用語の一部とみなして抽出しない）
+_STANDALONE_SITES = ("右下腹部", "左下腹部", "右上腹部", "左上腹部", "右季肋部", "左季肋部", "心窩部", "臍周囲",
+                     "前頭部", "側頭部", "後頭部", "頭頂部", "こめかみ", "みぞおち", "胸骨の裏")
+_SIDE = "(?:右|左|両側?|左右)の?"
+
+_NUM = r"\d+(?:\.\d+)?"
+_KANJI_NUM = "[一二三四五六七八九十数]+"
+
+
+def _alternation(words) -> str:
+    return "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+
+
+# 候補の先頭になりうる文字。先頭で先読みしておくと、それ以外の文字（大半のひらがな・漢字）を
+# 正規表現エンジンのC実装側で読み飛ばせる（4000文字で約3倍速い）
+_FIRST_CHARS = "".join(sorted(
+    set("0123456789一二三四五六七八九十数血脈心Sサ酸昨今先去右左両")
+    | {w[0] for w in _STANDALONE_SITES} | {w[0] for w in LAY_TERMS}
+))
+
+# 各グループが1種類の抽出に対応する。太字にするのはグループ全体
+HINT_REGEX = re.compile(
+    f"(?=[{re.escape(_FIRST_CHARS)}])(?:"
+    # --- バイタル ---
+    r"(?P<TEMPERATURE>(?:3[4-9]|4[0-2])(?:\.\d)?\s*(?:度|℃|°C))"
+    r"|(?P<BLOOD_PRESSURE>(?:血圧\s*(?:は|が)?\s*)\d{2,3}\s*/\s*\d{2,3}(?:\s*mmHg)?|\d{2,3}\s*/\s*\d{2,3}\s*mmHg)"
+    r"|(?P<PULSE>(?:脈拍|心拍数?|脈)\s*(?:は|が)?\s*\d{2,3}(?:\s*(?:回/分|/分|bpm))?|\d{2,3}\s*(?:回/分|bpm))"
+    r"|(?P<SPO2>(?:SpO2|サチュレーション|酸素飽和度)\s*(?:は|が)?\s*\d{2,3}\s*%)"
+    # --- 期間（「3日前」「2週間」「昨日の夜」。後ろの「から」は含めない）---
+    f"|(?P<DURATION>(?:{_NUM}|{_KANJI_NUM})\\s*(?:日|週間|週|か月|ヶ月|カ月|ヵ月|年|時間|分)(?:ほど|くらい|ぐらい)?(?:前|間)"
+    f"|(?:一昨日|昨日|昨夜|昨晩|今朝|今日|先週|先月|今週|昨年|去年)(?:の(?:朝|昼|夕方|夜|午前|午後|夜中))?(?=から|より|ごろ|頃)"
+    f"|(?:{_NUM}|{_KANJI_NUM})\\s*(?:日|週間|か月|ヶ月|カ月|ヵ月|年|時間)(?=から|続|ほど|くらい|ぐらい))"
+    # --- 回数・量 ---
+    f"|(?P<COUNT>{_NUM}\\s*(?:回|錠|mg|g|kg|ml|mL|cc|cm|mm|杯|本))"
+    # --- 部位 ---
+    f"|(?P<SITE>{_SIDE}(?:{_alternation(SITES)})|{_alternation(_STANDALONE_SITES)})"
+    # --- 患者の表現（ヒントにだけ使う。太字にはしない）---
+    f"|(?P<TERM>{_alternation(LAY_TERMS)})"
+    f")"
+)
+
+_VITALS = ("TEMPERATURE", "BLOOD_PRESSURE", "PULSE", "SPO2")
+_BOLD_GROUPS = frozenset(_VITALS + ("DURATION", "COUNT", "SITE"))
+_BOLD_RE = re.compile(r"\*\*.+?\*\*", re.DOTALL)
+
+
+class Hint(NamedTuple):
+    kind: str    # vital / duration / count / site / term
+    text: str    # 入力中の表記
+    value: str   # term ならカルテ用語、それ以外は text と同じ
+
+
+_KIND = {**{g: "vital" for g in _VITALS}, "DURATION": "duration", "COUNT": "count", "SITE": "site", "TERM": "term"}
+_LABELS = (("vital", "バイタル"), ("duration", "期間"), ("count", "回数・量"), ("site", "部位"), ("term", "用語"))
+
+
+def extract(text: str) -> List[Hint]:
+    """normalize_width 済みのテキストから数値・期間・部位・用語を抽出する（出現順・重複なし）"""
+    hints, seen = [], set()
+    for m in HINT_REGEX.finditer(text):
+        kind = _KIND[m.lastgroup]
+        surface = m.group()
+        if (kind, surface) in seen:
+            continue
+        seen.add((kind, surface))
+        hints.append(Hint(kind, surface, LAY_TERMS[surface] if kind == "term" else surface))
+    return hints
+
+
+def format_hints(hints: List[Hint], kinds=("term",)) -> str:
+    """
+    プロンプトに付けるヒント（種類ごとに1行。抽出なしなら空文字）
+    既定は用語の言い換えだけ（数値・期間・部位は対象テキストにそのまま書かれており、太字は生成後に付けるため）
+    """
+    lines = []
+    for kind, label in _LABELS:
+        if kind not in kinds:
+            continue
+        values = [f"{h.text}→{h.value}" if kind == "term" else h.text for h in hints if h.kind == kind]
+        if values:
+            lines.append(f"【{label}】{'、'.join(values)}")
+    return "\n".join(lines)
+
+
+# --- 生成後の太字付け ---
+
+def _bold(m) -> str:
+    return f"**{m.group()}**" if m.lastgroup in _BOLD_GROUPS else m.group()
+
+
+def emphasize_text(text: str) -> str:
+    """数値・期間・部位を **太字** にする（すでに太字の部分には触らない）"""
+    if not text:
+        return text
+    text = normalize_width(text)
+    parts, last = [], 0
+    for m in _BOLD_RE.finditer(text):
+        parts.append(HINT_REGEX.sub(_bold, text[last:m.start()]))
+        parts.append(m.group())
+        last = m.end()
+    parts.append(HINT_REGEX.sub(_bold, text[last:]))
+    return "".join(parts)
+
+
+def emphasize(result: dict) -> dict:
+    """解析結果の summary の各項目に emphasize_text をかける（result をそのまま書き換えて返す）"""
+    summary = result.get("summary")
+    if isinstance(summary, dict):
+        for key, value in summary.items():
+            if isinstance(value, str):
+                summary[key] = emphasize_text(value)
+    return result
@@ -0,0 +1,102 @@
+import difflib
+import json
+
+from batch_analysis import estimate_tokens
+
+# ==========================================
+# 再解析の差分（インクリメンタル解析）
+# ==========================================
+# 症状を1行書き足して解析し直すたびに全文を送り直すと、入力トークンも生成時間も初回と同じだけかかる。
+# 前回の入力（マスク済み）との差分を取り、変更が小さければ「前回の結果 + 変更箇所」だけを送って
+# 影響する項目だけを更新させる。変更が大きいときは呼び出し側が通常の解析に切り替える。
+
+# 追加・変更箇所の位置を伝えるため、直前の文脈を何文字まで添えるか
+CONTEXT_CHARS = 30
+
+
+class Edit:
+    """
+    op: "insert" / "delete" / "replace"
+    before: 削除・置き換えられた部分、after: 追加・置き換え後の部分
+    context: 変更箇所の直前にある（変更されていない）文字列。先頭の変更なら空文字
+    """
+    __slots__ = ("op", "before", "after", "context")
+
+    def __init__(self, op: str, before: str, after: str, context: str):
+        self.op = op
+        self.before = before
+        self.after = after
+        self.context = context
+
+    @property
+    def size(self) -> int:
+        return max(len(self.before), len(self.after))
+
+    def __repr__(self):
+        return f"Edit({self.op!r}, {self.before!r}, {self.after!r})"
+
+
+def _common_affixes(a: str, b: str):
+    """共通の接頭辞・接尾辞の長さ（重ならないように）"""
+    limit = min(len(a), len(b))
+    head = 0
+    while head < limit and a[head] == b[head]:
+        head += 1
+    tail = 0
+    while tail < limit - head and a[len(a) - 1 - tail] == b[len(b) - 1 - tail]:
+        tail += 1
+    return head, tail
+
+
+def diff_text(old: str, new: str) -> list:
+    """
+    行単位で差分を取り、置き換えられた行はさらに共通部分を削って変更箇所だけにする
+    （文字単位の SequenceMatcher は長い入力で遅いため、行で絞ってから詰める）
+    """
+    if old == new:
+        return []
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    edits = []
+    new_offset = 0  # new の中で、処理済みの位置（文脈の切り出しに使う）
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        before = "".join(old_lines[i1:i2])
+        after = "".join(new_lines[j1:j2])
+        start = new_offset
+        new_offset += len(after)
+        if tag == "equal":
+            continue
+        # 末尾に追記すると元の最終行に改行が付いて「置き換え」になるので、共通部分を削って追加だけにする
+        head, tail = _common_affixes(before, after)
+        start += head
+        before = before[head:len(before) - tail]
+        after = after[head:len(after) - tail]
+        if not before and not after:
+            continue
+        op = "insert" if not before else "delete" if not after else "replace"
+        edits.append(Edit(op, before, after, new[max(0, start - CONTEXT_CHARS):start]))
+    return edits
+
+
+def plan_edits(old: str, new: str, max_ratio: float, max_chars: int):
+    """
+    差分で更新してよいかを判定する
+    戻り値: 変更箇所の一覧（変更なしなら空リスト）。変更が大きすぎる場合は None（通常の解析に切り替える）
+    """
+    edits = diff_text(old, new)
+    changed = sum(e.size for e in edits)
+    if changed > max_chars or changed > max_ratio * max(len(new), 1):
+        return None
+    return edits
+
+
+def estimate_costs(full_prompt: str, update_prompt: str, previous: dict):
+    """
+    (全文解析, 差分更新) の入力 + 出力トークンの見積もり（system_instruction は共通なので除く）
+    全文解析は全項目を出力し直す。差分更新で書き直すのは多くても1〜2項目なので、最も長い項目1つ分とみなす
+    """
+    fields = list(previous["summary"].values()) + [previous["explanation"], "".join(previous["departments"])]
+    full = estimate_tokens(full_prompt) + estimate_tokens(json.dumps(previous, ensure_ascii=False))
+    update = estimate_tokens(update_prompt) + max(estimate_tokens(f) for f in fields)
+    return full, update
@@ -0,0 +1,137 @@
+import json
+
+# ストリーミング時にクライアントへ先出しするフィールド
+SUMMARY_FIELD_PATHS = (
+    ("summary", "chief_complaint"),
+    ("summary", "history"),
+    ("summary", "symptoms"),
+    ("summary", "background"),
+    ("departments",),
+)
+
+
+class _Container:
+    __slots__ = ("kind", "key", "expect_key")
+
+    def __init__(self, kind: str):
+        self.kind = kind          # "obj" or "arr"
+        self.key = None           # objの場合、現在処理中のキー
+        self.expect_key = kind == "obj"
+
+
+class IncrementalFieldParser:
+    """
+    チャンク単位で届くJSONテキストを逐次スキャンし、
+    対象パスの値が「閉じた」時点でその値を返すパーサ。
+
+        parser = IncrementalFieldParser()
+        for chunk in stream:
+            for path, value in parser.feed(chunk):
+                ...  # ("summary", "history"), "..." など
+
+    全体の文字列は text に溜めてあるので、最後に parser.result() で
+    従来どおりの完全なオブジェクトを得られる。
+    """
+
+    def __init__(self, targets=SUMMARY_FIELD_PATHS):
+        self.targets = set(targets)
+        self.text = ""
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._string_is_key = False
+        self._capture = None  # (path, start, depth)
+        self._started = False
+        self._root_start = 0
+        self._root_end = None
+
+    def _path(self):
+        return tuple(c.key for c in self._stack if c.kind == "obj")
+
+    def _value_begin(self, index: int):
+        if self._capture is not None:
+            return
+        path = self._path()
+        if path in self.targets:
+            self._capture = (path, index, len(self._stack))
+
+    def _value_end(self, end: int, out: list):
+        if self._capture is None:
+            return
+        path, start, depth = self._capture
+        if len(self._stack) != depth:
+            return
+        self._capture = None
+        try:
+            out.append((path, json.loads(self.text[start:end])))
+        except ValueError:
+            pass
+
+    def feed(self, chunk: str) -> list:
+        out = []
+        self.text += chunk
+        text = self.text
+        i = self._pos
+        n = len(text)
+        while i < n:
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._string_is_key:
+                        top = self._stack[-1]
+                        try:
+                            top.key = json.loads(text[self._string_start:i + 1])
+                        except ValueError:
+                            top.key = None
+                        top.expect_key = False
+                    else:
+                        self._value_end(i + 1, out)
+                i += 1
+                continue
+
+            if not self._started:
+                # ```json などの前置きは読み飛ばす
+                if ch == "{":
+                    self._started = True
+                    self._root_start = i
+                else:
+                    i += 1
+                    continue
+
+            if ch == "{" or ch == "[":
+                self._value_begin(i)
+                self._stack.append(_Container("obj" if ch == "{" else "arr"))
+            elif ch == "}" or ch == "]":
+                if self._stack:
+                    self._stack.pop()
+                    if not self._stack:
+                        self._root_end = i + 1
+                self._value_end(i + 1, out)
+            elif ch == '"':
+                top = self._stack[-1] if self._stack else None
+                self._string_is_key = bool(top and top.kind == "obj" and top.expect_key)
+                if not self._string_is_key:
+                    self._value_begin(i)
+                self._in_string = True
+                self._string_start = i
+            elif ch == ",":
+                if self._stack and self._stack[-1].kind == "obj":
+                    self._stack[-1].expect_key = True
+            i += 1
+        self._pos = i
+        return out
+
+    @property
+    def complete(self) -> bool:
+        return self._root_end is not None
+
+    def result(self):
+        """ルートオブジェクト全体をパースして返す（前後の余計な文字は除く）"""
+        return json.loads(self.text[self._root_start:self._root_end])
@@ -0,0 +1,58 @@
+import asyncio
+import threading
+import time
+
+
+class LazyResource:
+    """
+    重いライブラリ・クライアントを初回利用時に1回だけ初期化する
+    （複数スレッドから同時に get() されても init は1回）
+
+        gemini = LazyResource("gemini", lambda: build_model())
+        gemini.get().generate_content_async(...)
+    """
+
+    registry = []
+
+    def __init__(self, name: str, init):
+        self.name = name
+        self._init = init
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.load_seconds = None
+        LazyResource.registry.append(self)
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def get(self):
+        if self._loaded:
+            return self._value
+        with self._lock:
+            if not self._loaded:
+                started = time.perf_counter()
+                self._value = self._init()
+                self.load_seconds = time.perf_counter() - started
+                self._loaded = True
+        return self._value
+
+    async def aget(self):
+        """イベントループを止めないよう、未初期化ならスレッドで初期化する"""
+        if self._loaded:
+            return self._value
+        return await asyncio.to_thread(self.get)
+
+    def set(self, value):
+        """初期化済みの値を差し込む（テスト・ローカル代替用）"""
+        with self._lock:
+            self._value = value
+            self._loaded = True
+
+    @classmethod
+    def status(cls) -> dict:
+        return {
+            r.name: round(r.load_seconds, 3) if r.load_seconds is not None else ("injected" if r.loaded else None)
+            for r in cls.registry
+        }
@@ -0,0 +1,82 @@
+import asyncio
+import contextlib
+import time
+
+
+class SchedulerBusy(Exception):
+    """待ち行列が満杯（→ 429 Too Many Requests）"""
+
+
+class SchedulerTimeout(Exception):
+    """待ち時間 or 生成時間の上限超過（→ 503 Service Unavailable）"""
+
+
+class LLMScheduler:
+    """
+    Gemini呼び出しの同時実行数を制限するスケジューラ
+    - 同時に走るLLM呼び出しは max_concurrency 件まで
+    - 空きを待てるのは max_queue 件まで（それ以上は即 SchedulerBusy）
+    - queue_timeout 秒待っても順番が来なければ SchedulerTimeout
+    - call_timeout 秒以内に応答がなければ SchedulerTimeout
+    """
+
+    def __init__(self, max_concurrency: int = 8, max_queue: int = 32,
+                 queue_timeout: float = 10.0, call_timeout: float = 60.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.call_timeout = call_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """
+        実行枠を1つ確保するコンテキストマネージャ
+        （ストリーミング生成のように、枠を握ったまま逐次処理したい場合に使う）
+        """
+        if self.in_flight + self.waiting >= self.max_concurrency + self.max_queue:
+            self.rejected += 1
+            raise SchedulerBusy("LLM queue is full")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise SchedulerTimeout("Timed out waiting for an LLM slot")
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def run(self, make_call):
+        """
+        make_call: 呼ぶたびに新しいコルーチンを返す関数
+        （例: lambda: model.generate_content_async(prompt)）
+        """
+        async with self.slot():
+            started = time.monotonic()
+            try:
+                return await asyncio.wait_for(make_call(), timeout=self.call_timeout)
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                raise SchedulerTimeout(f"LLM call exceeded {time.monotonic() - started:.1f}s")
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
@@ -0,0 +1,110 @@
+import copy
+import threading
+
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    """supabase-py のクエリビルダのうち、このバックエンドで使う部分だけを再現する"""
+
+    def __init__(self, db, table: str):
+        self._db = db
+        self._table = table
+        self._op = "select"
+        self._values = None
+        self._columns = None
+        self._filters = []
+        self._order = None
+        self._limit = None
+
+    # --- 操作 ---
+    def select(self, columns: str = "*"):
+        self._op = "select"
+        self._columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        return self
+
+    def update(self, values: dict):
+        self._op, self._values = "update", values
+        return self
+
+    def insert(self, values):
+        self._op, self._values = "insert", values if isinstance(values, list) else [values]
+        return self
+
+    # --- 条件 ---
+    def eq(self, column, value):
+        self._filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def neq(self, column, value):
+        self._filters.append(lambda row: row.get(column) != value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self._filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def lt(self, column, value):
+        self._filters.append(lambda row: row.get(column) is not None and row.get(column) < value)
+        return self
+
+    def gt(self, column, value):
+        self._filters.append(lambda row: row.get(column) is not None and row.get(column) > value)
+        return self
+
+    def order(self, column, desc: bool = False):
+        self._order = (column, desc)
+        return self
+
+    def limit(self, n: int):
+        self._limit = n
+        return self
+
+    async def execute(self) -> _Result:
+        return await self._db._execute(self)
+
+
+class LocalSupabase:
+    """
+    Supabase 非同期クライアント（supabase.AsyncClient）のローカル代替（インメモリ）
+    テスト・ベンチマーク・オフライン開発で `supabase` の代わりに差し込む
+
+        db = LocalSupabase({"profiles": [{"id": "u1", "plan_type": "free"}]})
+        await db.table("profiles").update({"plan_type": "pro_monthly"}).eq("id", "u1").execute()
+    """
+
+    def __init__(self, tables: dict = None):
+        self.tables = {name: [dict(r) for r in rows] for name, rows in (tables or {}).items()}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    async def _execute(self, q: _Query) -> _Result:
+        with self._lock:
+            self.calls += 1
+            rows = self.tables.setdefault(q._table, [])
+            if q._op == "insert":
+                inserted = [dict(v) for v in q._values]
+                rows.extend(inserted)
+                return _Result(copy.deepcopy(inserted))
+
+            matched = [r for r in rows if all(f(r) for f in q._filters)]
+            if q._op == "update":
+                for r in matched:
+                    r.update(q._values)
+                return _Result(copy.deepcopy(matched))
+
+            if q._order:
+                column, desc = q._order
+                matched.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+            if q._limit is not None:
+                matched = matched[:q._limit]
+            if q._columns:
+                matched = [{c: r.get(c) for c in q._columns} for r in matched]
+            return _Result(copy.deepcopy(matched))
@@ -1,8 +1,11 @@
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 import os
-import io
-import re
+import asyncio
 import json
 import html
+import hashlib
 # html-sanitizer推奨だが、なければ標準ライブラリで代用するロジック
 try:
     from html_sanitizer import Sanitizer
@@ -10,25 +13,48 @@ try:
 except ImportError:
     sanitizer = None
 
-import google.generativeai as genai
-import stripe
-from supabase import create_client, Client
 from fastapi import FastAPI, HTTPException, Request, Header
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
+from typing import List, Optional
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
-# --- PDF Generation Libraries ---
-from reportlab.lib.pagesizes import A4, B5
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.units import mm
+from llm_scheduler import LLMScheduler, SchedulerBusy, SchedulerTimeout
+from model_router import AllModelsUnavailable, ModelRouter
+from json_stream import IncrementalFieldParser
+from analysis_cache import create_analysis_cache, make_cache_key
+from analysis_result import (AnalysisParseError, RepairedJson, apply_update, finalize, merge_missing,
+                             normalize_analysis, repair_json)
+from batch_analysis import run_batch
+from clinical_hints import emphasize, emphasize_text, normalize_width
+from incremental import estimate_costs, plan_edits
+from pii import mask_pii
+from prompts import (SYSTEM_INSTRUCTION, analysis_template, annotate, batch_template, build_batch_prompt,
+                     fill_missing_prompt, incremental_prompt, trim_to_budget)
+from webhook_jobs import WebhookJobQueue, default_queue_path
+from local_supabase import LocalSupabase
+from lazy import LazyResource
+from metrics import MetricsRegistry, RequestMetricsMiddleware
+from responses import (CompressionMiddleware, EncodedBody, EncodedBodyCache, FastJSONResponse, choose_encoding,
+                       encoded_response, encoding_etag, json_response)
+from service_clients import ServiceClient, ServiceLimits
+from stripe_api import STRIPE_API_BASE, StripeApi
+from rate_limit import (MISSING, PlanLimits, ProfileCache, RateLimited, RateLimiter, SharedInvalidations, TTLCache,
+                        effective_plan, parse_plan_limits, per_worker_limits)
+
+# --- PDF Generation ---
+from pdf_renderer import PdfRenderPool, normalize_pdf_size, summary_to_text
+from pdf_cache import PdfCache, pdf_cache_key
+from ogp import PAGE_CARDS, OgpRenderer, ogp_cache_key
+from summary_store import create_summary_store, history_cursor, parse_history_cursor, parse_json_field
 
 load_dotenv()
 
+# STARTUP_PROFILE=1 で起動時間の内訳を表示する（benchmarks/cold_start.py も参照）
+STARTUP_PROFILE = os.getenv("STARTUP_PROFILE") == "1"
+
 # --- Config & Security ---
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
@@ -37,27 +63,64 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
 # Initialize Clients
+# google.generativeai / stripe / supabase は import だけで数百ms〜秒単位かかるため、
+# 初回利用時（またはサーバー起動後のバックグラウンドウォームアップ）に読み込む
 if not GEMINI_API_KEY:
     print("WARNING: GEMINI_API_KEY is not set.")
-else:
-    genai.configure(api_key=GEMINI_API_KEY)
-
-if STRIPE_SECRET_KEY:
-    stripe.api_key = STRIPE_SECRET_KEY
-else:
+if not STRIPE_SECRET_KEY:
     print("WARNING: STRIPE_SECRET_KEY is not set.")
+if not (SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY) and os.getenv("USE_LOCAL_SUPABASE") != "1":
+    print("WARNING: Supabase credentials not set. Subscription updates will fail.")
+
+# --- Outbound HTTP (Stripe / Supabase) ---
+# 外部サービスへの通信はサービスごとに1つの非同期クライアントを共有する（service_clients.py）
+# 接続数・keep-alive・タイムアウト・同時実行数は {SUPABASE,STRIPE}_HTTP_<項目名> で変更できる
+# （例: SUPABASE_HTTP_TIMEOUT=5, STRIPE_HTTP_MAX_CONCURRENCY=4）
+supabase_http = ServiceClient("supabase", ServiceLimits.from_env("SUPABASE_HTTP", ServiceLimits(
+    timeout=10.0, connect_timeout=3.0, max_connections=32, max_keepalive=32, keepalive_expiry=30.0,
+    max_concurrency=32,
+)))
+stripe_http = ServiceClient("stripe", ServiceLimits.from_env("STRIPE_HTTP", ServiceLimits(
+    timeout=30.0, connect_timeout=5.0, max_connections=8, max_keepalive=8, keepalive_expiry=30.0,
+    max_concurrency=8,
+)), base_url=STRIPE_API_BASE)
+# Checkout セッションの作成（Webhook の署名検証は stripe_sdk のまま。ネットワークを使わない）
+stripe_api = StripeApi(stripe_http, STRIPE_SECRET_KEY)
+
+def _init_stripe():
+    import stripe
+    if STRIPE_SECRET_KEY:
+        stripe.api_key = STRIPE_SECRET_KEY
+    return stripe
 
-# Supabase Admin Client
-supabase: Client = None
-if SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY:
+# Supabase Admin Client（非同期クライアント。通信は supabase_http の共有プール経由）
+def _init_supabase():
+    if os.getenv("USE_LOCAL_SUPABASE") == "1":
+        # ローカル開発・動作確認用のインメモリ代替
+        return LocalSupabase()
+    if not (SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY):
+        return None
     try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        from supabase import AsyncClient, AsyncClientOptions
+        # service_role キーで認証する（acreate_client と違いセッションを取りに行かない。自動更新もしない）
+        options = AsyncClientOptions(
+            httpx_client=supabase_http.client,
+            auto_refresh_token=False,
+            persist_session=False,
+        )
+        return AsyncClient(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY, options)
     except Exception as e:
         print(f"Supabase Init Error: {e}")
-else:
-    print("WARNING: Supabase credentials not set. Subscription updates will fail.")
+        return None
+
+stripe_sdk = LazyResource("stripe", _init_stripe)
+supabase_client = LazyResource("supabase", _init_supabase)
 
-app = FastAPI()
+# 保存済みサマリーの読み込み元（SUMMARY_STORE_PATH でローカルSQLiteに差し替え可能）
+summary_store = LazyResource("summary_store", lambda: create_summary_store(supabase_client.get()))
+
+# dict を返すエンドポイントも orjson で直列化する（responses.py）
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # CORS
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
@@ -71,16 +134,69 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Font Loading
-try:
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    font_path = os.path.join(current_dir, "ipaexg.ttf")
-    if os.path.exists(font_path):
-        pdfmetrics.registerFont(TTFont('IPAexGothic', font_path))
-    else:
-        print("Warning: ipaexg.ttf not found. Fallback to Helvetica.")
-except Exception as e:
-    print(f"Font Load Error: {e}")
+# --- Metrics (/metrics, Prometheus形式) ---
+metrics = MetricsRegistry()
+HTTP_LATENCY = metrics.histogram(
+    "http_request_duration_seconds", "Request latency by route.", ("method", "route", "status"))
+HTTP_IN_FLIGHT = metrics.gauge("http_requests_in_flight", "Requests currently being handled.")
+STAGE_LATENCY = metrics.histogram(
+    "stage_duration_seconds", "Time spent in each stage of an operation.", ("operation", "stage"))
+LLM_CALLS = metrics.counter("llm_calls_total", "Gemini calls by outcome.", ("outcome",))
+LLM_TOKENS = metrics.counter("llm_tokens_total", "Gemini tokens from usage_metadata.", ("kind",))
+PROMPT_TRIMS = metrics.counter("prompt_input_trimmed_total", "Inputs shortened to fit the token budget.", ("method",))
+ANALYSIS_REPAIRS = metrics.counter("analysis_result_repairs_total",
+                                   "Analysis JSON repairs and missing-field regenerations, by kind.", ("kind",))
+INCREMENTAL_ANALYSES = metrics.counter("analysis_incremental_total",
+                                      "Re-analysis requests by path taken (incremental update or full analysis).",
+                                      ("outcome",))
+PDF_BYTES = metrics.counter("pdf_bytes_total", "PDF bytes returned, by source.", ("source",))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # 設定時は Authorization: Bearer <token> が必要
+
+# 圧縮はメトリクスの内側（処理時間に圧縮も含める）
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(RequestMetricsMiddleware, latency=HTTP_LATENCY, in_flight=HTTP_IN_FLIGHT)
+
+# PDF Rendering
+# ReportLabのビルドはCPUを占有するため、フォント登録済みのプロセスプールで実行する
+# （PDF_RENDER_WORKERS=0 ならスレッド実行）
+pdf_pool = PdfRenderPool()
+
+# 同じ内容のPDFは再レンダリングしない（PDF_CACHE_DIR を指定するとディスクにも保存）
+pdf_cache = PdfCache(
+    max_bytes=int(os.getenv("PDF_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    directory=os.getenv("PDF_CACHE_DIR") or None,
+)
+
+@app.on_event("startup")
+async def warm_up_in_background():
+    """
+    接続の受付を始めてから、重いサブシステムをバックグラウンドで読み込む
+    （WARMUP_IN_BACKGROUND=0 なら完全に初回利用時まで遅延）
+    """
+    if os.getenv("WARMUP_IN_BACKGROUND", "1") != "1":
+        return
+
+    def warm():
+        started = time.perf_counter()
+        for step in (pdf_pool.start, gemini_model.get, stripe_sdk.get, supabase_client.get):
+            try:
+                step()
+            except Exception as e:
+                print(f"Warm-up Error: {e}")
+        if STARTUP_PROFILE:
+            print(f"[startup] background warm-up {time.perf_counter() - started:.2f}s {LazyResource.status()}")
+
+    asyncio.get_running_loop().run_in_executor(None, warm)
+
+@app.on_event("shutdown")
+def stop_pdf_pool():
+    pdf_pool.shutdown()
+
+@app.on_event("shutdown")
+async def close_service_clients():
+    """外部サービスとの keep-alive 接続を閉じる"""
+    for service in (supabase_http, stripe_http):
+        await service.aclose()
 
 # --- ★ Plan Configuration (Secure & Scalable) ---
 # 環境変数からPrice IDを読み込む
@@ -94,40 +210,402 @@ PLAN_KEY_TO_ID = {
 }
 
 # --- AI Settings ---
-system_instruction = """
-あなたは救急・総合診療の経験豊富な「医療秘書AI」です。
-患者（ユーザー）の入力した症状から、医師が診断に必要な情報（OPQRST、既往歴、リスク因子）を抽出し、
-電子カルテにそのまま貼り付けられる「医学的サマリー」を作成してください。
-
-【重要：法的制約】
-1. あなたは医師ではありません。「診断（病名の断定）」は絶対に行わないでください。
-2. 「○○病の疑いがあります」といった病名の示唆も避けてください。
-3. 診療科の提案を行う場合は、あくまで「一般的に考えられる可能性」として提示し、断定的な表現を避けてください。
-
-【出力品質の基準】
-- 医師が短時間で状況を把握できる「専門的かつ簡潔」な表現を用いること。
-- 患者が「言ったこと」と「言わなかったこと（陰性所見）」を明確に区別すること。
-"""
-model = genai.GenerativeModel('gemini-2.5-flash', system_instruction=system_instruction)
+# 優先順のモデル一覧（使えるモデルは check_models.py で確認できる）。先頭が通常使うモデル
+GEMINI_MODELS = [m.strip() for m in os.getenv("GEMINI_MODELS", "gemini-2.5-flash,gemini-2.5-flash-lite").split(",") if m.strip()]
+MODEL_NAME = GEMINI_MODELS[0]
+# プロンプトを変更したら更新すること（解析結果キャッシュのキーに含まれる）
+PROMPT_VERSION = "2026-10-v3"
+# 患者テキストの最大文字数（リクエストの検証に使う）
+MAX_INPUT_CHARS = 4000
+# 患者テキストの見積もりトークン数の上限（超える入力は詰めてから送る。0 で無効）
+# 日本語は約1文字=1トークンなので、既定値は入力上限の全文（マスク後の置換で少し伸びる分も含む）が収まる大きさにする
+PROMPT_INPUT_TOKEN_BUDGET = int(os.getenv("PROMPT_INPUT_TOKEN_BUDGET", "4500"))
+# 再解析で、前回の入力からの変更がこの割合（新しい入力の文字数比）・文字数以内なら差分だけで更新する（0 で無効）
+INCREMENTAL_MAX_CHANGE_RATIO = float(os.getenv("INCREMENTAL_MAX_CHANGE_RATIO", "0.3"))
+INCREMENTAL_MAX_CHANGED_CHARS = int(os.getenv("INCREMENTAL_MAX_CHANGED_CHARS", "800"))
+
+class GeminiModels:
+    """
+    (モデル名, system_instruction（言語ごとのプロンプトテンプレート）) ごとに GenerativeModel を使い回す
+    指示文・スキーマは system_instruction 側に置き、リクエストでは患者テキストだけを送る
+    """
+
+    def __init__(self, genai, max_models: int = 128):
+        self._genai = genai
+        self._models = {}
+        self._max_models = max_models
+
+    def for_system(self, system: str, model_name: str = MODEL_NAME):
+        key = (model_name, system)
+        model = self._models.get(key)
+        if model is None:
+            if len(self._models) >= self._max_models:
+                self._models.clear()
+            model = self._models[key] = self._genai.GenerativeModel(model_name, system_instruction=system)
+        return model
+
+def _init_gemini():
+    import google.generativeai as genai
+    if GEMINI_API_KEY:
+        genai.configure(api_key=GEMINI_API_KEY)
+    return GeminiModels(genai)
+
+gemini_model = LazyResource("gemini", _init_gemini)
+
+# --- Model Routing ---
+# 先頭のモデルが直近 p95 を過ぎても応答しなければ次のモデルにも同じリクエストを送り（ヘッジ）、
+# エラー時は次のモデルに切り替える。連続して失敗したモデルはしばらく使わない（サーキットブレーカー）
+model_router = ModelRouter(
+    GEMINI_MODELS,
+    hedge=os.getenv("LLM_HEDGE", "1") == "1",
+    hedge_percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "95")),
+    default_hedge_delay=float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "8")),
+    failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+    reset_timeout=float(os.getenv("LLM_BREAKER_RESET", "30")),
+    # 入力自体が不正なエラーは、他のモデルに送っても同じなので切り替えない
+    non_retryable=lambda e: type(e).__name__ == "InvalidArgument",
+)
+
+metrics.gauge("llm_model_calls", "Gemini calls per model since start.", ("model", "outcome"),
+              callback=lambda: {(m, outcome): n for m, counts in model_router.calls.items() for outcome, n in counts.items()})
+metrics.gauge("llm_model_circuit_open", "1 while the model's circuit breaker is open.", ("model",),
+              callback=lambda: {(m,): int(b.state == "open") for m, b in model_router.breakers.items()})
+metrics.gauge("llm_hedged_requests", "Hedged duplicate Gemini requests since start.",
+              callback=lambda: model_router.hedges)
+
+# --- LLM Concurrency ---
+# Gemini呼び出しはイベントループを止めないよう非同期API経由で行い、
+# 同時実行数・待ち行列をスケジューラで制限する（超過時は 429 / 503 を返す）
+llm_scheduler = LLMScheduler(
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("LLM_MAX_QUEUE", "32")),
+    queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "10")),
+    call_timeout=float(os.getenv("LLM_CALL_TIMEOUT", "60")),
+)
+
+# バッチ解析: 1回のプロンプトに詰める量の上限
+BATCH_TOKEN_BUDGET = int(os.getenv("BATCH_TOKEN_BUDGET", "6000"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "10"))
+
+# --- Analysis Result Cache ---
+# 再送・ダブルクリックによる同一リクエストはキャッシュから返す（ANALYSIS_CACHE_BACKEND=off で無効）
+analysis_cache = create_analysis_cache()
+
+metrics.gauge("llm_requests_in_flight", "Gemini calls holding a scheduler slot.",
+              callback=lambda: llm_scheduler.in_flight)
+metrics.gauge("llm_requests_waiting", "Gemini calls waiting for a scheduler slot.",
+              callback=lambda: llm_scheduler.waiting)
+
+def upstream_stat(stat: str) -> dict:
+    return {(c.name,): c.stats()[stat] for c in (supabase_http, stripe_http)}
+
+metrics.gauge("upstream_http_in_flight", "Outbound Stripe/Supabase requests in flight.", ("service",),
+              callback=lambda: upstream_stat("in_flight"))
+metrics.gauge("upstream_http_waiting", "Outbound requests waiting for a concurrency slot.", ("service",),
+              callback=lambda: upstream_stat("waiting"))
+metrics.gauge("upstream_http_connections", "Pooled connections to Stripe/Supabase.", ("service",),
+              callback=lambda: upstream_stat("connections"))
+metrics.gauge("analysis_cache_hit_ratio", "Analysis cache hit ratio since start.",
+              callback=lambda: analysis_cache.info()["hit_ratio"] if analysis_cache else None)
+metrics.gauge("analysis_cache_requests", "Analysis cache lookups since start.", ("result",),
+              callback=lambda: {("hit",): analysis_cache.stats.hits, ("miss",): analysis_cache.stats.misses}
+              if analysis_cache else {})
+metrics.gauge("pdf_cache_hit_ratio", "PDF cache hit ratio since start.",
+              callback=lambda: pdf_cache.hits / max(pdf_cache.hits + pdf_cache.misses, 1))
+metrics.gauge("pdf_cache_bytes", "Bytes held in the in-memory PDF cache.", callback=lambda: pdf_cache.current_bytes)
+
+# 直列化・圧縮済みのレスポンス本文（キャッシュに当たった解析結果・PDFをそのまま書き出す）
+encoded_bodies = EncodedBodyCache(
+    max_bytes=int(os.getenv("RESPONSE_CACHE_BYTES", str(32 * 1024 * 1024))),
+    ttl=float(os.getenv("ANALYSIS_CACHE_TTL", "3600")),
+)
+metrics.gauge("response_cache_bytes", "Bytes held in the pre-encoded response cache.",
+              callback=lambda: encoded_bodies.current_bytes)
+metrics.gauge("response_cache_hit_ratio", "Pre-encoded response cache hit ratio since start.",
+              callback=lambda: encoded_bodies.hits / max(encoded_bodies.hits + encoded_bodies.misses, 1))
+
+# --- Rate Limiting ---
+# 利用者（ログイン中はユーザーID、未ログインはIPアドレス）ごとに、プランに応じた件数・同時実行数を制限する
+# プランは profiles 行のプロセス内キャッシュから引き、決済Webhookで更新したら即座に捨てる
+# prefork（RATE_LIMIT_WORKERS=ワーカー数）では、バケツはワーカーごとなので上限をワーカー数で割って持ち、
+# 無効化は PROFILE_INVALIDATION_PATH の SQLite を通して他のワーカーのキャッシュにも反映する
+DEFAULT_PLAN_LIMITS = {
+    "guest": PlanLimits(per_minute=5, burst=5, concurrency=1),
+    "free": PlanLimits(per_minute=10, burst=10, concurrency=2),
+    "pro_monthly": PlanLimits(per_minute=60, burst=20, concurrency=4),
+    "family_monthly": PlanLimits(per_minute=120, burst=40, concurrency=8),
+}
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+# 例: RATE_LIMITS="free=20:10:2,pro_monthly=120:40:6"（件/分:バースト:同時実行数）
+RATE_LIMIT_WORKERS = int(os.getenv("RATE_LIMIT_WORKERS", "1"))
+rate_limiter = RateLimiter(per_worker_limits(parse_plan_limits(os.getenv("RATE_LIMITS"), DEFAULT_PLAN_LIMITS),
+                                             RATE_LIMIT_WORKERS))
+
+PROFILE_COLUMNS = "id, display_name, plan_type, subscription_status, stripe_customer_id"
+
+async def fetch_profile(user_id: str):
+    supabase = await supabase_client.aget()
+    if not supabase:
+        return None
+    rows = (await supabase.table("profiles").select(PROFILE_COLUMNS).eq("id", user_id).limit(1).execute()).data
+    return rows[0] if rows else None
+
+async def fetch_profiles(user_ids) -> list:
+    supabase = await supabase_client.aget()
+    if not supabase:
+        return []
+    return (await supabase.table("profiles").select(PROFILE_COLUMNS).in_("id", list(user_ids)).execute()).data
+
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "300"))
+PROFILE_INVALIDATION_PATH = os.getenv("PROFILE_INVALIDATION_PATH")
+profile_cache = ProfileCache(
+    fetch_profile, ttl=PROFILE_CACHE_TTL, fetch_many=fetch_profiles,
+    shared=SharedInvalidations(PROFILE_INVALIDATION_PATH, retention=PROFILE_CACHE_TTL) if PROFILE_INVALIDATION_PATH else None,
+)
+# アクセストークン → ユーザーID（Supabase Auth への問い合わせを毎回しない）
+token_user_cache = TTLCache(ttl=float(os.getenv("TOKEN_CACHE_TTL", "300")))
+
+metrics.gauge("rate_limit_rejections", "Requests rejected by the per-user rate limiter.", ("reason",),
+              callback=lambda: {(reason,): n for reason, n in rate_limiter.rejected.items()})
+metrics.gauge("profile_cache_hit_ratio", "profiles cache hit ratio since start.",
+              callback=lambda: profile_cache.hits / max(profile_cache.hits + profile_cache.misses, 1))
+
+# 手前にある信頼できるプロキシの数（Render のロードバランサーで 1）。0 なら X-Forwarded-For を使わない
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
+
+def client_ip(request: Request) -> str:
+    """
+    レート制限のキーにするクライアントIP
+    X-Forwarded-For の左側はクライアントが自由に書けるため、信頼できるプロキシが付け足した
+    右から TRUSTED_PROXY_HOPS 番目を使う（足りなければ接続元のアドレス）
+    """
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded and TRUSTED_PROXY_HOPS > 0:
+        hops = [h.strip() for h in forwarded.split(",")]
+        if len(hops) >= TRUSTED_PROXY_HOPS and hops[-TRUSTED_PROXY_HOPS]:
+            return hops[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
+
+async def resolve_plan(authorization: str):
+    """(ユーザーID, プラン)。キャッシュに当たればネットワークを使わない"""
+    if not authorization:
+        return None, "guest"
+    token_key = hashlib.sha256(authorization.encode()).hexdigest()
+    user_id = token_user_cache.get(token_key, MISSING)
+    if user_id is MISSING:
+        user_id = await get_user_id_from_token(authorization)
+        # 無効なトークンは短めにキャッシュする
+        token_user_cache.set(token_key, user_id, ttl=None if user_id else 30)
+    if not user_id:
+        return None, "guest"
+
+    row = profile_cache.peek(user_id)
+    if row is MISSING:
+        try:
+            row = await profile_cache.get(user_id)
+        except Exception as e:
+            print(f"Profile Fetch Error: {e}")
+            row = None
+    return user_id, effective_plan(row)
+
+async def acquire_analysis_lease(request: Request, authorization: str, cost: int = 1):
+    """レート制限の枠を確保する（超過時は 429）。処理後に lease.release() すること"""
+    if not RATE_LIMIT_ENABLED:
+        return None
+    user_id, plan = await resolve_plan(authorization)
+    key = f"user:{user_id}" if user_id else f"ip:{client_ip(request)}"
+    try:
+        return rate_limiter.acquire(key, plan, cost)
+    except RateLimited as e:
+        if e.reason == "cost":
+            raise HTTPException(status_code=413,
+                                detail=f"Too many items for your plan (up to {e.limit} per request).")
+        detail = ("Too many analyses at the same time for your plan." if e.reason == "concurrency"
+                  else "Analysis limit for your plan reached. Please retry shortly.")
+        raise HTTPException(status_code=429, detail=detail,
+                            headers={"Retry-After": str(max(1, round(e.retry_after)))})
+
+def release_lease(lease):
+    if lease is not None:
+        lease.release()
 
 # --- Helper Functions ---
 
-def mask_pii(text: str) -> str:
-    text = re.sub(r'\d{2,4}[-\s]?\d{2,4}[-\s]?\d{3,4}', '[PHONE_HIDDEN]', text)
-    text = re.sub(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}', '[EMAIL_HIDDEN]', text)
-    return text
+def record_token_usage(response):
+    """Geminiレスポンスの usage_metadata をトークン数メトリクスに加算する"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    LLM_TOKENS.inc(getattr(usage, "prompt_token_count", 0) or 0, "prompt")
+    LLM_TOKENS.inc(getattr(usage, "candidates_token_count", 0) or 0, "response")
 
 def sanitize_input(text: str) -> str:
     if sanitizer:
         return sanitizer.sanitize(text)
     return html.escape(text)
 
+async def render_pdf_cached(text: str, pdf_size: str):
+    """
+    (キャッシュキー, EncodedBody) を返す
+    圧縮済みの本文 → PDFキャッシュ → レンダリング の順に探し、見つかった段より前に保存する
+    """
+    pdf_size = normalize_pdf_size(pdf_size)
+    with STAGE_LATENCY.time("pdf", "cache_lookup"):
+        key = pdf_cache_key(text, pdf_size)
+        body = encoded_bodies.get(f"pdf:{key}")
+        if body is not None:
+            PDF_BYTES.inc(len(body.raw), "cache")
+            return key, body
+        # ディスクキャッシュの読み書きはイベントループを止めないようスレッドで行う
+        pdf_bytes = await asyncio.to_thread(pdf_cache.get, key)
+    if pdf_bytes is None:
+        with STAGE_LATENCY.time("pdf", "render"):
+            pdf_bytes = await pdf_pool.render(text, pdf_size)
+        await asyncio.to_thread(pdf_cache.set, key, pdf_bytes)
+        PDF_BYTES.inc(len(pdf_bytes), "render")
+    else:
+        PDF_BYTES.inc(len(pdf_bytes), "cache")
+    with STAGE_LATENCY.time("pdf", "compress"):
+        body = encoded_bodies.set(f"pdf:{key}", EncodedBody(pdf_bytes, "application/pdf"))
+    return key, body
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    If-None-Match は弱い比較（W/ の有無を無視する）
+    エンコーディング別のETag（"<hash>-gzip"・"<hash>-br"）も同じ内容なので一致とみなす
+    """
+    if not if_none_match:
+        return False
+    etag = etag.removeprefix("W/")
+    tag = etag.strip('"')
+    accepted = {etag, encoding_etag(tag, "gzip"), encoding_etag(tag, "br")}
+    candidates = {c.strip().removeprefix("W/") for c in if_none_match.split(",")}
+    return "*" in candidates or not accepted.isdisjoint(candidates)
+
+async def get_user_id_from_token(authorization: str):
+    """Authorization: Bearer <Supabaseのアクセストークン> からユーザーIDを取り出す"""
+    supabase = await supabase_client.aget()
+    if not authorization or not supabase:
+        return None
+    token = authorization.removeprefix("Bearer ").strip()
+    try:
+        return (await supabase.auth.get_user(token)).user.id
+    except Exception as e:
+        print(f"Token Verify Error: {e}")
+        return None
+
+def mask_input(text: str) -> str:
+    """個人情報をマスクし、全角の数字を半角にそろえる（キャッシュキー・プロンプト・抽出はこのテキストを使う）"""
+    return normalize_width(mask_pii(text))
+
+def prepare_analysis_prompt(safe_text: str, language: str):
+    """
+    (system_instruction, リクエストごとのプロンプト)。長すぎる入力はトークン予算内に詰める
+    用語の言い換えはローカルで抽出してプロンプトに付ける（数値・期間・部位の太字は生成後に emphasize で付ける）
+    """
+    template = analysis_template(language)
+    text, trimmed = trim_to_budget(safe_text, PROMPT_INPUT_TOKEN_BUDGET)
+    if trimmed:
+        PROMPT_TRIMS.inc(1, trimmed)
+        if trimmed == "truncate":
+            print(f"Prompt Truncated: {len(safe_text)} chars -> {len(text)} chars (budget {PROMPT_INPUT_TOKEN_BUDGET} tokens)")
+    return template.system, template.render(annotate(text))
+
+async def generate_with_backpressure(prompt, system: str = SYSTEM_INSTRUCTION, **kwargs):
+    """
+    スケジューラ・モデルルーター経由でGeminiを呼び出し、混雑時はHTTPエラーに変換する
+    戻り値: (レスポンス, 応答したモデル名)
+    """
+    try:
+        models = await gemini_model.aget()
+        response, model_name = await llm_scheduler.run(lambda: model_router.generate(
+            lambda name: models.for_system(system, name).generate_content_async(prompt, **kwargs)
+        ))
+        LLM_CALLS.inc(1, "ok")
+        record_token_usage(response)
+        return response, model_name
+    except SchedulerBusy:
+        LLM_CALLS.inc(1, "rejected")
+        raise HTTPException(status_code=429, detail="Too many analyses in progress. Please retry shortly.",
+                            headers={"Retry-After": "5"})
+    except SchedulerTimeout:
+        LLM_CALLS.inc(1, "timeout")
+        raise HTTPException(status_code=503, detail="Analysis service is busy. Please retry later.",
+                            headers={"Retry-After": "10"})
+    except AllModelsUnavailable:
+        LLM_CALLS.inc(1, "unavailable")
+        raise HTTPException(status_code=503, detail="Analysis service is temporarily unavailable.",
+                            headers={"Retry-After": "30"})
+    except Exception:
+        LLM_CALLS.inc(1, "error")
+        raise
+
+def parse_analysis(text: str, language: str, count: bool = True):
+    """(結果, 欠けている項目)。崩れたJSONはその場で直す（count なら種類ごとに ANALYSIS_REPAIRS に数える）"""
+    try:
+        repaired = repair_json(text)
+        kinds = list(repaired.repairs)
+    except AnalysisParseError:
+        repaired, kinds = None, ["unparseable"]
+    result, missing, coerced = normalize_analysis(repaired, language)
+    if count:
+        for kind in kinds + coerced:
+            ANALYSIS_REPAIRS.inc(1, kind)
+    return result, missing
+
+async def complete_analysis(text: str, system: str, prompt: str, language: str):
+    """
+    Gemini の出力を解析結果にする。欠けた・途中で切れた項目だけを1回再生成させる
+    （解析全体はやり直さない）。戻り値: (結果, 再生成で埋めた項目)
+    それでも欠けた項目は空の値で埋めて incomplete に残す。主訴も現病歴もなければ失敗とする
+    """
+    with STAGE_LATENCY.time("analyze", "parse"):
+        result, missing = parse_analysis(text, language)
+    filled = []
+    if missing:
+        ANALYSIS_REPAIRS.inc(1, "fill_request")
+        try:
+            with STAGE_LATENCY.time("analyze", "fill"):
+                response, _ = await generate_with_backpressure(
+                    fill_missing_prompt(prompt, result, missing), system=system,
+                    generation_config={"response_mime_type": "application/json"})
+                fill, _ = parse_analysis(response.text, language, count=False)
+            still_missing = merge_missing(result, fill, missing)
+            filled = [p for p in missing if p not in still_missing]
+            missing = still_missing
+        except Exception as e:
+            print(f"Analysis Fill Error: {e}")
+        ANALYSIS_REPAIRS.inc(1, "fill_incomplete" if missing else "fill_ok")
+    if "summary.chief_complaint" in missing and "summary.history" in missing:
+        raise AnalysisParseError("analysis result has no usable fields")
+    return emphasize(finalize(result, missing)), filled
+
+def is_complete(result: dict) -> bool:
+    """欠けた項目のある結果はキャッシュしない（次のリクエストで作り直す）"""
+    return not result.get("incomplete")
+
 # --- API Models ---
 
+class PreviousAnalysis(BaseModel):
+    # 前回解析した入力。サーバーのキャッシュに結果が残っていればそれを使う
+    text: str = Field(..., max_length=MAX_INPUT_CHARS)
+    # 前回の結果（キャッシュにない場合に使う。クライアントから来た値なのでキャッシュには保存しない）
+    result: Optional[dict] = None
+
 class UserRequest(BaseModel):
-    text: str = Field(..., max_length=4000, description="Patient symptoms")
+    text: str = Field(..., max_length=MAX_INPUT_CHARS, description="Patient symptoms")
     language: str = "Japanese"
     pdf_size: str = "A4"
+    # 再解析のとき前回の入力（と結果）を付けると、変更が小さければ差分だけで更新する
+    previous: Optional[PreviousAnalysis] = None
+
+class BatchRequest(BaseModel):
+    items: List[UserRequest] = Field(..., min_length=1, max_length=100)
+
+class ExportRequest(BaseModel):
+    # 省略時はログイン中ユーザーのサマリーをすべて書き出す
+    summary_ids: Optional[List[str]] = Field(None, min_length=1, max_length=10000)
+    pdf_size: str = "A4"
 
 class CheckoutRequest(BaseModel):
     plan_key: str # 'pro_monthly' or 'family_monthly'
@@ -136,117 +614,642 @@ class CheckoutRequest(BaseModel):
 
 # --- AI & PDF Endpoints ---
 
+async def analyze_masked(safe_text: str, language: str) -> dict:
+    """マスク済みテキストを解析する（キャッシュ・同時リクエストの集約込み）"""
+    async def run_analysis():
+        with STAGE_LATENCY.time("analyze", "prompt"):
+            system, prompt = prepare_analysis_prompt(safe_text, language)
+        with STAGE_LATENCY.time("analyze", "llm"):
+            response, model_name = await generate_with_backpressure(
+                prompt, system=system, generation_config={"response_mime_type": "application/json"})
+        result, _ = await complete_analysis(response.text, system, prompt, language)
+        result["model"] = model_name
+        return result
+
+    if analysis_cache is None:
+        return await run_analysis()
+    cache_key = make_cache_key(safe_text, language, PROMPT_VERSION, MODEL_NAME)
+    return await analysis_cache.get_or_compute(cache_key, run_analysis, cacheable=is_complete)
+
+async def analyze_incremental(safe_text: str, language: str, previous: PreviousAnalysis, cache_key: str):
+    """
+    前回の結果に、入力の変更箇所だけを反映させる（対象テキスト全体は送らない）
+    戻り値: (結果, 値が変わった項目, 共有キャッシュに置いたか)
+    同じ入力の結果がキャッシュにある・前回の結果がない・変更が大きい・出力が使えない場合は None（通常の解析を行う）
+    """
+    # 同じ入力の結果があるかの確認だけ（ヒット/ミスは呼び出し側の get_or_compute で数える）
+    if INCREMENTAL_MAX_CHANGE_RATIO <= 0 or (analysis_cache is not None and analysis_cache.peek(cache_key)):
+        return None
+    previous_text = mask_input(previous.text)
+    base, trusted = None, False
+    if analysis_cache is not None:
+        base = analysis_cache.get(make_cache_key(previous_text, language, PROMPT_VERSION, MODEL_NAME))
+        trusted = base is not None
+    if base is None:
+        base = previous.result
+    if base is not None:
+        base, missing, _ = normalize_analysis(RepairedJson(base), language)
+    if base is None or missing:
+        INCREMENTAL_ANALYSES.inc(1, "full_no_previous")
+        return None
+    base = finalize(base, [])
+    if not trusted:
+        # クライアントから来た結果は、入力と同じくマスクしてから Gemini に送る
+        base["summary"] = {k: mask_pii(v) for k, v in base["summary"].items()}
+        base["explanation"] = mask_pii(base["explanation"])
+
+    edits = plan_edits(previous_text, safe_text, INCREMENTAL_MAX_CHANGE_RATIO, INCREMENTAL_MAX_CHANGED_CHARS)
+    if edits is None:
+        INCREMENTAL_ANALYSES.inc(1, "full_large_change")
+        return None
+    if not edits:
+        # マスク後は同じ入力（電話番号だけ書き換えた等）: 前回の結果をそのまま返す
+        INCREMENTAL_ANALYSES.inc(1, "unchanged")
+        result, changed, model_name = base, [], (previous.result or {}).get("model", MODEL_NAME)
+    else:
+        template = analysis_template(language)
+        prompt = incremental_prompt(base, edits)
+        # 短い入力では前回の結果を送るほうが高くつく（全文を送り直したほうが安い）
+        full_cost, update_cost = estimate_costs(
+            template.render(annotate(trim_to_budget(safe_text, PROMPT_INPUT_TOKEN_BUDGET)[0])), prompt, base)
+        if update_cost >= full_cost:
+            INCREMENTAL_ANALYSES.inc(1, "full_cheaper")
+            return None
+        with STAGE_LATENCY.time("analyze", "incremental"):
+            response, model_name = await generate_with_backpressure(
+                prompt, system=template.system, generation_config={"response_mime_type": "application/json"})
+        try:
+            result, changed = apply_update(base, repair_json(response.text), language)
+            emphasize(result)
+        except AnalysisParseError as e:
+            print(f"Incremental Analysis Error: {e}")
+            INCREMENTAL_ANALYSES.inc(1, "full_failed")
+            return None
+        INCREMENTAL_ANALYSES.inc(1, "incremental")
+    result["model"] = model_name
+    # 結果の正しさをサーバー側で確かめられた場合（前回の結果がキャッシュにあった）だけ共有キャッシュに置く
+    if trusted:
+        analysis_cache.set(cache_key, result)
+    return result, changed, trusted
+
 @app.post("/analyze")
-async def analyze_symptoms(request: UserRequest):
+async def analyze_symptoms(request: UserRequest, http_request: Request, authorization: str = Header(None)):
+    lease = await acquire_analysis_lease(http_request, authorization)
     try:
-        safe_text = mask_pii(request.text)
-        explanation_instruction = ""
-        if request.language not in ["Japanese", "日本語", "ja"]:
-             explanation_instruction = f"- `explanation`: ユーザーへの説明を{request.language}で記述（AIの理解を伝えるため）。"
+        with STAGE_LATENCY.time("analyze", "mask"):
+            safe_text = mask_input(request.text)
+        cache_key = make_cache_key(safe_text, request.language, PROMPT_VERSION, MODEL_NAME)
+        # 同じ入力の結果は、直列化・圧縮済みの本文をそのまま返す
+        body_key = "analysis:" + cache_key
+        body = encoded_bodies.get(body_key) if analysis_cache is not None else None
+        if body is not None:
+            return encoded_response(http_request, body)
+        updated = None
+        if request.previous is not None:
+            updated = await analyze_incremental(safe_text, request.language, request.previous, cache_key)
+        if updated is not None:
+            result, _, shared = updated
+            if not shared:
+                return json_response(http_request, result)
         else:
-             explanation_instruction = "- `explanation`: 空文字（\"\"）にしてください。"
-
-        prompt = f"""
-        以下の患者の訴えを分析し、以下のJSONフォーマットのみを出力してください。
-        Markdown記号（###など）は含めないでください。純粋なJSON文字列のみを返してください。
-
-        対象テキスト:
-        {safe_text}
-        
-        ユーザーの使用言語: {request.language}
-
-        【出力JSONフォーマット】
-        {{
-            "summary": {{
-                "chief_complaint": "主訴（一番の症状を一言で。期間を含める。例: **3日前**からの発熱）",
-                "history": "現病歴（OPQRSTに基づき、時系列順に記述。重要な陰性所見（例: 呼吸苦はない）もあれば含める）",
-                "symptoms": "随伴症状（主訴に伴うその他の症状。箇条書き推奨）",
-                "background": "既往歴・服薬・アレルギー（入力になければ「特記なし」）"
-            }},
-            "departments": ["診療科1", "診療科2"], 
-            "explanation": "ユーザーへの説明（日本語以外の場合のみ）"
-        }}
-
-        重要指示: 
-        - 医師が読むためのカルテ用語（例: 「熱がある」→「発熱」、「お腹が痛い」→「腹痛」）に変換すること。
-        - **数値**（体温、回数）、**期間**（いつから）、**部位**（右下腹部など）は、医師が見落とさないよう **太字** で囲むこと（例: **38.5度**）。
-        - 否定された症状（「吐き気はない」など）も、鑑別診断に重要なため省略せずに記載すること。
-        - `departments` は、可能性のある診療科を広い範囲で抽出すること。
-        """
-        
-        response = model.generate_content(prompt, generation_config={"response_mime_type": "application/json"})
-        return json.loads(response.text)
+            result = await analyze_masked(safe_text, request.language)
+        if analysis_cache is None or not is_complete(result):
+            return json_response(http_request, result)
+        body = encoded_bodies.set(body_key, EncodedBody.json(result))
+        return encoded_response(http_request, body)
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Analyze Error: {e}")
         raise HTTPException(status_code=500, detail="Analysis failed.")
+    finally:
+        release_lease(lease)
 
-@app.post("/pdf")
-async def create_pdf(request: UserRequest):
+@app.post("/analyze/batch")
+async def analyze_batch(request: BatchRequest, http_request: Request, authorization: str = Header(None)):
+    """
+    複数の症状テキストをまとめて解析する（問診連携向け）
+    トークン予算内で複数件を1回のプロンプトに詰め、グループ単位で並列実行する
+    まとめて解析できなかった項目だけを個別に再試行する
+    レート制限は件数分を消費する（件数がプランのバースト容量を超えるバッチは 413 で断る）
+    """
+    lease = await acquire_analysis_lease(http_request, authorization, cost=len(request.items))
     try:
-        buffer = io.BytesIO()
-        pagesize = A4
-        margin = 20*mm
-        if request.pdf_size == "B5": pagesize = B5
-        elif request.pdf_size == "Receipt": 
-            pagesize = (80*mm, 300*mm); margin = 5*mm
-
-        doc = SimpleDocTemplate(
-            buffer, pagesize=pagesize, 
-            rightMargin=margin, leftMargin=margin, topMargin=margin, bottomMargin=margin
-        )
+        return await run_analyze_batch(request)
+    finally:
+        release_lease(lease)
 
-        styles = getSampleStyleSheet()
-        registered_fonts = pdfmetrics.getRegisteredFontNames()
-        font_name = 'IPAexGothic' if 'IPAexGothic' in registered_fonts else 'Helvetica'
-        
-        base_font_size = 9 if request.pdf_size == "Receipt" else 10
-        title_font_size = 14 if request.pdf_size == "Receipt" else 18
+async def run_analyze_batch(request: BatchRequest) -> dict:
+    results = [None] * len(request.items)
+    pending = {}  # language -> [(index, safe_text), ...]
+    for index, item in enumerate(request.items):
+        safe_text = mask_input(item.text)
+        cached = None
+        if analysis_cache is not None:
+            cached = analysis_cache.get(make_cache_key(safe_text, item.language, PROMPT_VERSION, MODEL_NAME))
+        if cached is not None:
+            results[index] = {"index": index, "ok": True, "result": cached}
+        else:
+            pending.setdefault(item.language, []).append((index, safe_text))
 
-        jp_style = ParagraphStyle(
-            name='JP', parent=styles['Normal'], fontName=font_name, 
-            fontSize=base_font_size, leading=base_font_size * 1.6
-        )
-        title_style = ParagraphStyle(
-            name='Title', parent=styles['Heading1'], fontName=font_name, 
-            fontSize=title_font_size, leading=title_font_size * 1.4, 
-            alignment=1, spaceAfter=5*mm
+    async def run_language(language, items):
+        async def generate(prompt):
+            response, model_name = await generate_with_backpressure(
+                prompt, system=batch_template(language).system,
+                generation_config={"response_mime_type": "application/json"})
+            return response.text, model_name
+
+        async def analyze_single(safe_text):
+            return await analyze_masked(safe_text, language)
+
+        return language, dict(items), await run_batch(
+            items, language, build_batch_prompt, generate, analyze_single,
+            token_budget=BATCH_TOKEN_BUDGET, max_items=BATCH_MAX_ITEMS,
         )
 
-        story = []
-        title_text = "Medical Summary" if request.pdf_size == "Receipt" else "Medical Summary / 医師提示用サマリー"
-        story.append(Paragraph(title_text, title_style))
-        story.append(Spacer(1, 5*mm))
-        
-        lines = request.text.split('\n')
-        for line in lines:
-            if not line.strip(): continue
-            safe_line = html.escape(line)
-            formatted_line = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', safe_line)
-            
-            if line.strip().startswith("■"):
-                clean_text = formatted_line.replace("■", "").strip()
-                story.append(Spacer(1, 2*mm))
-                header_size = base_font_size + 2
-                story.append(Paragraph(f"<font size={header_size}><b>■ {clean_text}</b></font>", jp_style))
-            elif line.strip().startswith("- ") or line.strip().startswith("・"):
-                clean_text = formatted_line.replace("- ", "").replace("・", "").strip()
-                story.append(Paragraph(f"• {clean_text}", jp_style))
+    upstream_calls = 0
+    for language, texts, (outcomes, calls) in await asyncio.gather(*[run_language(l, i) for l, i in pending.items()]):
+        upstream_calls += calls
+        for index, outcome in outcomes.items():
+            if isinstance(outcome, Exception):
+                if not isinstance(outcome, HTTPException):
+                    print(f"Batch Item Error: {outcome}")
+                status = outcome.status_code if isinstance(outcome, HTTPException) else 500
+                results[index] = {"index": index, "ok": False, "status": status, "error": "Analysis failed."}
             else:
-                story.append(Paragraph(formatted_line, jp_style))
-            
-            story.append(Spacer(1, 1*mm))
-
-        doc.build(story)
-        buffer.seek(0)
-        return StreamingResponse(
-            buffer, media_type="application/pdf",
-            headers={"Content-Disposition": "attachment; filename=summary.pdf"}
-        )
+                # まとめて解析した結果には太字がまだ付いていないので、すべての結果に付ける
+                # （個別に再試行した結果は付け済みだが、emphasize は太字の部分に触らないので二重にはならない）
+                outcome = emphasize(outcome)
+                if analysis_cache is not None:
+                    analysis_cache.set(make_cache_key(texts[index], language, PROMPT_VERSION, MODEL_NAME), outcome)
+                results[index] = {"index": index, "ok": True, "result": outcome}
+
+    return {"results": results, "upstream_calls": upstream_calls}
+
+@app.post("/analyze/stream")
+async def analyze_symptoms_stream(request: UserRequest, http_request: Request, authorization: str = Header(None)):
+    """
+    /analyze のストリーミング版 (NDJSON)
+    生成中のJSONを逐次パースし、フィールドが確定した順に1行ずつ送る
+        {"event": "field", "path": "summary.history", "value": "..."}
+        {"event": "done", "result": {...}}   ← /analyze と同じオブジェクト
+        {"event": "error", "detail": "..."}
+    previous 付きで差分だけで更新できた場合は、全項目を送ってから
+        {"event": "done", "result": {...}, "updated": ["summary.history", ...]}
+    """
+    safe_text = mask_input(request.text)
+    system, prompt = prepare_analysis_prompt(safe_text, request.language)
+    cache_key = make_cache_key(safe_text, request.language, PROMPT_VERSION, MODEL_NAME)
+    lease = await acquire_analysis_lease(http_request, authorization)
+
+    async def event_stream():
+        try:
+            async for chunk in stream_analysis():
+                yield chunk
+        finally:
+            release_lease(lease)
+
+    async def stream_analysis():
+        def line(obj):
+            return json.dumps(obj, ensure_ascii=False) + "\n"
+
+        def result_lines(result, **done):
+            for key, value in result.get("summary", {}).items():
+                yield line({"event": "field", "path": f"summary.{key}", "value": value})
+            if "departments" in result:
+                yield line({"event": "field", "path": "departments", "value": result["departments"]})
+            yield line({"event": "done", "result": result, **done})
+
+        cached = analysis_cache.get(cache_key) if analysis_cache else None
+        if cached is not None:
+            for chunk in result_lines(cached):
+                yield chunk
+            return
+
+        try:
+            if request.previous is not None:
+                updated = await analyze_incremental(safe_text, request.language, request.previous, cache_key)
+                if updated is not None:
+                    result, changed, _ = updated
+                    for chunk in result_lines(result, updated=changed):
+                        yield chunk
+                    return
+            models = await gemini_model.aget()
+            async with llm_scheduler.slot():
+                # ストリーミングはヘッジできないため、最初のフィールドを送る前のエラーだけ次のモデルに切り替える
+                emitted = False
+                last_error = AllModelsUnavailable("All Gemini models are temporarily unavailable")
+                for model_name in model_router.candidates():
+                    # half-open のモデルは試行枠を取れたときだけ送る（取れなければ次のモデルへ）
+                    if not model_router.acquire(model_name):
+                        continue
+                    try:
+                        parser = IncrementalFieldParser()
+                        started = time.monotonic()
+                        try:
+                            response = await models.for_system(system, model_name).generate_content_async(
+                                prompt, generation_config={"response_mime_type": "application/json"}, stream=True
+                            )
+                            async for chunk in response:
+                                for path, value in parser.feed(chunk.text):
+                                    emitted = True
+                                    if path[0] == "summary" and isinstance(value, str):
+                                        value = emphasize_text(value)
+                                    yield line({"event": "field", "path": ".".join(path), "value": value})
+                        except Exception as e:
+                            model_router.record(model_name, False)
+                            if emitted or model_router.non_retryable(e):
+                                raise
+                            print(f"Gemini Error ({model_name}): {e}")
+                            last_error = e
+                            continue
+                        model_router.record(model_name, True, time.monotonic() - started)
+                        break
+                    finally:
+                        # 結果を記録せずに抜けた場合（クライアントの切断など）も試行枠を返す
+                        model_router.release(model_name)
+                else:
+                    raise last_error
+            LLM_CALLS.inc(1, "ok")
+            record_token_usage(response)
+            result, filled = await complete_analysis(parser.text, system, prompt, request.language)
+            # 再生成で埋めた項目は、まだ送っていないのでここで送る
+            for path in filled:
+                value = result["summary"][path[8:]] if path.startswith("summary.") else result[path]
+                yield line({"event": "field", "path": path, "value": value})
+            result["model"] = model_name
+            if analysis_cache is not None and is_complete(result):
+                analysis_cache.set(cache_key, result)
+            yield line({"event": "done", "result": result})
+        except SchedulerBusy:
+            yield line({"event": "error", "status": 429, "detail": "Too many analyses in progress. Please retry shortly."})
+        except SchedulerTimeout:
+            yield line({"event": "error", "status": 503, "detail": "Analysis service is busy. Please retry later."})
+        except AllModelsUnavailable:
+            yield line({"event": "error", "status": 503, "detail": "Analysis service is temporarily unavailable."})
+        except HTTPException as e:
+            yield line({"event": "error", "status": e.status_code, "detail": e.detail})
+        except Exception as e:
+            print(f"Analyze Stream Error: {e}")
+            yield line({"event": "error", "status": 500, "detail": "Analysis failed."})
+
+    return StreamingResponse(
+        event_stream(), media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # 本文を送り始める前に切断された場合も枠を返す
+        background=BackgroundTask(release_lease, lease),
+    )
+
+@app.get("/metrics")
+async def get_metrics(authorization: str = Header(None)):
+    """Prometheus テキスト形式のメトリクス（METRICS_TOKEN 設定時は Bearer トークンが必要）"""
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/healthz")
+async def healthz():
+    """死活監視・起動完了確認用（重いサブシステムには触れない）"""
+    return {"status": "ok", "loaded": LazyResource.status()}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """解析結果キャッシュのヒット/ミス/追い出し件数（サイズ調整用）"""
+    if analysis_cache is None:
+        return {"enabled": False, "responses": encoded_bodies.stats(), "ogp": ogp_cache.stats()}
+    return {"enabled": True, **analysis_cache.info(), "responses": encoded_bodies.stats(), "ogp": ogp_cache.stats()}
+
+@app.post("/pdf")
+async def create_pdf(request: UserRequest, http_request: Request):
+    try:
+        _, body = await render_pdf_cached(request.text, request.pdf_size)
+        return encoded_response(http_request, body, headers={"Content-Disposition": "attachment; filename=summary.pdf"})
     except Exception as e:
         print(f"PDF Error: {e}")
         raise HTTPException(status_code=500, detail="PDF generation failed.")
 
+@app.get("/api/pdf/{summary_id}")
+async def get_summary_pdf(summary_id: str, request: Request, size: str = "A4",
+                          if_none_match: str = Header(None), authorization: str = Header(None)):
+    """
+    保存済みサマリーのPDF（履歴詳細ページ用）
+    内容ハッシュをETagとして返し、If-None-Match が一致すれば 304 を返す
+    （圧縮の有無で本文のバイト列が変わるため、エンコーディングごとに別の強いETag）
+    非公開(is_private)のサマリーは本人のアクセストークンが必要
+    """
+    store = await summary_store.aget()
+    if store is None:
+        raise HTTPException(status_code=503, detail="Summary store is not configured.")
+    try:
+        row = await store.get(summary_id)
+    except Exception as e:
+        print(f"Summary Fetch Error: {e}")
+        raise HTTPException(status_code=500, detail="Failed to load summary.")
+    if not row:
+        raise HTTPException(status_code=404, detail="Summary not found.")
+    if row.get("is_private"):
+        user_id = await get_user_id_from_token(authorization)
+        if not user_id or user_id != row.get("user_id"):
+            raise HTTPException(status_code=403, detail="This summary is private.")
+
+    text = summary_to_text(parse_json_field(row.get("content"), {}))
+    tag = pdf_cache_key(text, normalize_pdf_size(size))
+    headers = {"Cache-Control": "private, max-age=0, must-revalidate", "Vary": "Accept-Encoding"}
+    if etag_matches(if_none_match, encoding_etag(tag)):
+        # 304 には、いま送るとしたら付けるETag（PDFは常に圧縮対象）
+        encoding = choose_encoding(request.headers.get("accept-encoding"))
+        return Response(status_code=304, headers={**headers, "ETag": encoding_etag(tag, encoding)})
+
+    try:
+        _, body = await render_pdf_cached(text, size)
+    except Exception as e:
+        print(f"PDF Error: {e}")
+        raise HTTPException(status_code=500, detail="PDF generation failed.")
+    headers["Content-Disposition"] = f"inline; filename=summary-{summary_id}.pdf"
+    return encoded_response(request, body, headers=headers, etag=tag)
+
+# --- OGP Images (SNSシェア用カード) ---
+# 内容ハッシュをキーにディスクへ保存し、クローラーの集中アクセスはキャッシュと 304 で返す。
+# 同じカードの同時リクエストは1回のレンダリングにまとめる（single-flight）。
+ogp_renderer = OgpRenderer()
+ogp_cache = PdfCache(
+    max_bytes=int(os.getenv("OGP_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+    directory=os.getenv("OGP_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "ogp_cache")),
+    suffix=".png",
+)
+# サマリーID → カードの文言（None = 出せない）。公開設定の変更は最大 OGP_CARD_TTL 秒遅れて反映
+ogp_cards = TTLCache(ttl=float(os.getenv("OGP_CARD_TTL", "300")))
+_ogp_inflight = {}
+OGP_CACHE_CONTROL = "public, max-age=86400, s-maxage=604800, stale-while-revalidate=86400"
+# 日本語フォントがなく代替フォントで描いた画像は、CDN・クローラーに長く残さない
+OGP_FALLBACK_CACHE_CONTROL = "public, max-age=300"
+
+async def render_ogp_cached(title: str, subtitle: str):
+    """(キャッシュキー, PNGのバイト列) を返す"""
+    key = ogp_cache_key(title, subtitle, ogp_renderer.fallback_font)
+    png = await asyncio.to_thread(ogp_cache.get, key)
+    if png is not None:
+        return key, png
+    pending = _ogp_inflight.get(key)
+    if pending is not None:
+        return key, await asyncio.shield(pending)
+
+    future = asyncio.get_running_loop().create_future()
+    _ogp_inflight[key] = future
+    try:
+        with STAGE_LATENCY.time("ogp", "render"):
+            png = await asyncio.to_thread(ogp_renderer.render, title, subtitle)
+        if not ogp_renderer.fallback_font:
+            await asyncio.to_thread(ogp_cache.set, key, png)
+        future.set_result(png)
+        return key, png
+    except BaseException as e:
+        future.set_exception(e)
+        future.exception()
+        raise
+    finally:
+        del _ogp_inflight[key]
+
+async def ogp_response(title: str, subtitle: str, if_none_match: str) -> Response:
+    fallback = ogp_renderer.fallback_font
+    etag = f'"{ogp_cache_key(title, subtitle, fallback)}"'
+    headers = {"ETag": etag, "Cache-Control": OGP_FALLBACK_CACHE_CONTROL if fallback else OGP_CACHE_CONTROL}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    try:
+        _, png = await render_ogp_cached(title, subtitle)
+    except Exception as e:
+        print(f"OGP Error: {e}")
+        raise HTTPException(status_code=500, detail="OGP image generation failed.")
+    return Response(content=png, media_type="image/png", headers=headers)
+
+def summary_ogp_card(row):
+    """
+    サマリー用カードの文言。クローラーは誰でも取得できるため、症状などの本文は載せず作成日だけにする
+    非公開(is_private)のサマリーは None
+    """
+    if not row or row.get("is_private"):
+        return None
+    created = str(row.get("created_at") or "")[:10]
+    try:
+        year, month, day = (int(v) for v in created.split("-"))
+        subtitle = f"{year}年{month}月{day}日に作成 ｜ Karutto で共有されたサマリー"
+    except ValueError:
+        subtitle = "Karutto で共有されたサマリー"
+    return ("医師提示用サマリー", subtitle)
+
+@app.get("/api/ogp/page/{page}.png")
+async def get_page_ogp(page: str, if_none_match: str = Header(None)):
+    """固定ページ（トップ・料金プラン等）のOGP画像"""
+    card = PAGE_CARDS.get(page)
+    if card is None:
+        raise HTTPException(status_code=404, detail="Unknown page.")
+    return await ogp_response(*card, if_none_match)
+
+@app.get("/api/ogp/summary/{summary_id}.png")
+async def get_summary_ogp(summary_id: str, if_none_match: str = Header(None)):
+    """共有されたサマリーのOGP画像（履歴詳細ページの og:image）"""
+    card = ogp_cards.get(summary_id, MISSING)
+    if card is MISSING:
+        store = await summary_store.aget()
+        if store is None:
+            raise HTTPException(status_code=503, detail="Summary store is not configured.")
+        try:
+            row = await store.get(summary_id)
+        except Exception as e:
+            print(f"Summary Fetch Error: {e}")
+            raise HTTPException(status_code=500, detail="Failed to load summary.")
+        card = summary_ogp_card(row)
+        ogp_cards.set(summary_id, card)
+    if card is None:
+        raise HTTPException(status_code=404, detail="Summary not found.")
+    return await ogp_response(*card, if_none_match)
+
+# --- History API (履歴一覧) ---
+# 以前はブラウザが summaries を全件取得し、profiles と突き合わせていた。
+# ここでは家族の範囲・非公開の除外・診療科の絞り込み・表示名の結合をサーバー側で行い、1ページ分だけ返す。
+HISTORY_PAGE_MAX = 50
+HISTORY_PREVIEW_CHARS = 120
+# 家族の構成はフロントエンドから直接変更されるため、短めのTTLで持つ
+family_cache = TTLCache(ttl=float(os.getenv("FAMILY_CACHE_TTL", "60")))
+
+async def fetch_family_member_ids(user_id: str) -> list:
+    """本人を含む、同じ家族のユーザーID（家族に入っていなければ本人のみ）"""
+    supabase = await supabase_client.aget()
+    if not supabase:
+        return [user_id]
+    rows = (await supabase.table("family_members").select("family_id").eq("user_id", user_id).limit(1).execute()).data
+    if not rows:
+        return [user_id]
+    members = (await supabase.table("family_members").select("user_id")
+               .eq("family_id", rows[0]["family_id"]).execute()).data
+    return sorted({m["user_id"] for m in members} | {user_id})
+
+async def family_member_ids(user_id: str) -> list:
+    member_ids = family_cache.get(user_id, MISSING)
+    if member_ids is MISSING:
+        member_ids = await fetch_family_member_ids(user_id)
+        family_cache.set(user_id, member_ids)
+    return member_ids
+
+def history_item(row: dict, viewer_id: str, profiles: dict) -> dict:
+    """一覧表示に必要な項目だけにする（本文は冒頭のみ）"""
+    content = parse_json_field(row.get("content"), {})
+    if not isinstance(content, dict):
+        content = {}
+    departments = parse_json_field(row.get("departments"), [])
+    history = content.get("history") or ""
+    profile = profiles.get(row.get("user_id")) or {}
+    return {
+        "id": row["id"],
+        "user_id": row.get("user_id"),
+        "created_at": row.get("created_at"),
+        "is_private": bool(row.get("is_private")),
+        "chief_complaint": content.get("chief_complaint") or "",
+        "preview": history[:HISTORY_PREVIEW_CHARS],
+        "departments": departments if isinstance(departments, list) else [],
+        "display_name": profile.get("display_name") or "名無し",
+        "is_me": row.get("user_id") == viewer_id,
+    }
+
+@app.get("/api/history")
+async def get_history(request: Request, scope: str = "all", department: str = None, before: str = None,
+                      limit: int = 20, authorization: str = Header(None)):
+    """
+    履歴一覧（新しい順）
+    scope: all = 家族全員（他人の非公開サマリーは除く） / me = 本人のみ
+    before: 前のレスポンスの next_cursor（(created_at, id) によるキーセット方式。同じ時刻の行も取りこぼさない）
+    """
+    user_id, _ = await resolve_plan(authorization)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Login required.")
+    store = await summary_store.aget()
+    if store is None:
+        raise HTTPException(status_code=503, detail="Summary store is not configured.")
+    limit = max(1, min(limit, HISTORY_PAGE_MAX))
+    try:
+        cursor = parse_history_cursor(before)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+    try:
+        owner_ids = [user_id] if scope == "me" else await family_member_ids(user_id)
+        with STAGE_LATENCY.time("history", "query"):
+            # 1件多く取得して次のページの有無を判定する
+            rows = await store.list_history(owner_ids, user_id, cursor, limit + 1, department)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        profiles = await profile_cache.get_many([r["user_id"] for r in rows]) if rows else {}
+    except Exception as e:
+        print(f"History Fetch Error: {e}")
+        raise HTTPException(status_code=500, detail="Failed to load history.")
+
+    return json_response(request, {
+        "items": [history_item(r, user_id, profiles) for r in rows],
+        "next_cursor": history_cursor(rows[-1]) if has_more else None,
+    }, headers={"Cache-Control": "private, no-cache"})
+
+# --- PDF Export (複数サマリーの一括書き出し) ---
+# 行を EXPORT_PAGE_SIZE 件ずつ取得 → 1つのPDFに描き足す → 描き終えたページをすぐ送る、を繰り返す。
+# 5件でも5,000件でも、メモリに載るのは1ページ分の行とそのPDFだけ。
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "20"))
+# エクスポートは重いので、利用者ごとに同時1件・1分あたり数回まで
+export_limiter = RateLimiter(per_worker_limits({"free": PlanLimits(per_minute=6, burst=3, concurrency=1)}, RATE_LIMIT_WORKERS))
+
+def export_entry(row) -> tuple:
+    """(見出し, サマリーテキスト)"""
+    created_at = str(row.get("created_at") or "")[:16].replace("T", " ")
+    return f"作成日: {created_at}", summary_to_text(parse_json_field(row.get("content"), {}))
+
+async def iter_export_pages(store, user_id: str, summary_ids=None):
+    """エクスポート対象の行を最大 EXPORT_PAGE_SIZE 件ずつ返す（他人の非公開サマリーは除く）"""
+    if summary_ids is None:
+        after = None
+        while True:
+            with STAGE_LATENCY.time("pdf_export", "fetch"):
+                rows = await store.list_page(user_id, after, EXPORT_PAGE_SIZE)
+            if rows:
+                yield rows
+            if len(rows) < EXPORT_PAGE_SIZE:
+                return
+            after = (rows[-1]["created_at"], rows[-1]["id"])
+
+    ids = list(dict.fromkeys(summary_ids))
+    for i in range(0, len(ids), EXPORT_PAGE_SIZE):
+        chunk = ids[i:i + EXPORT_PAGE_SIZE]
+        with STAGE_LATENCY.time("pdf_export", "fetch"):
+            rows = await store.get_many(chunk)
+        visible = {r["id"]: r for r in rows if not r.get("is_private") or r.get("user_id") == user_id}
+        # 指定された順に並べる
+        rows = [visible[summary_id] for summary_id in chunk if summary_id in visible]
+        if rows:
+            yield rows
+
+async def stream_export_pdf(pages, first_rows, pdf_size: str, lease):
+    """1ページ分ずつ1つのPDFに描き足して送る。次のページの取得はレンダリングと並行して行う"""
+    prefetch = None
+    try:
+        writer = await pdf_pool.open_export(pdf_size, "Medical Summary Export")
+        yield writer.start()
+        rows = first_rows
+        while rows:
+            prefetch = asyncio.ensure_future(anext(pages, None))
+            with STAGE_LATENCY.time("pdf_export", "render"):
+                chunk = await pdf_pool.render_into(writer, [export_entry(r) for r in rows])
+            PDF_BYTES.inc(len(chunk), "export")
+            yield chunk
+            rows = await prefetch
+        yield await pdf_pool.finish_export(writer)
+    except Exception as e:
+        # 送信途中なのでステータスは変えられない。接続ごと打ち切り、壊れたPDFを正常終了させない
+        print(f"PDF Export Error: {e}")
+        raise
+    finally:
+        if prefetch is not None and not prefetch.done():
+            prefetch.cancel()
+        release_lease(lease)
+
+@app.post("/api/pdf/export")
+async def export_summaries_pdf(request: ExportRequest, authorization: str = Header(None)):
+    """
+    履歴のサマリーをまとめて1つのPDFとして書き出す（ストリーミング）
+    summary_ids を省略すると本人のサマリーすべて（作成日順）、指定時はその順で
+    他人の非公開サマリーは含めない
+    """
+    user_id, _ = await resolve_plan(authorization)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Login required.")
+    store = await summary_store.aget()
+    if store is None:
+        raise HTTPException(status_code=503, detail="Summary store is not configured.")
+
+    lease = None
+    if RATE_LIMIT_ENABLED:
+        try:
+            lease = export_limiter.acquire(f"user:{user_id}", "free")
+        except RateLimited as e:
+            raise HTTPException(status_code=429, detail="An export is already in progress or the limit was reached.",
+                                headers={"Retry-After": str(max(1, round(e.retry_after)))})
+
+    # 最初のページだけ先に取得し、対象がなければ 404 を返す（送信開始後はステータスを変えられない）
+    pages = iter_export_pages(store, user_id, request.summary_ids)
+    try:
+        first_rows = await anext(pages, None)
+    except Exception as e:
+        release_lease(lease)
+        print(f"Summary Fetch Error: {e}")
+        raise HTTPException(status_code=500, detail="Failed to load summaries.")
+    if not first_rows:
+        release_lease(lease)
+        raise HTTPException(status_code=404, detail="No summaries to export.")
+
+    return StreamingResponse(
+        stream_export_pdf(pages, first_rows, request.pdf_size, lease), media_type="application/pdf",
+        headers={"Content-Disposition": "attachment; filename=summaries.pdf", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(release_lease, lease),
+    )
+
 # --- Stripe Payment Endpoints ---
 
 @app.post("/create-checkout-session")
@@ -268,8 +1271,8 @@ async def create_checkout_session(request: CheckoutRequest):
             print(f"Error: Price ID not found for key: {request.plan_key}")
             raise HTTPException(status_code=400, detail=f"Price ID configuration error for {request.plan_key}")
 
-        # 2. セッション作成
-        checkout_session = stripe.checkout.Session.create(
+        # 2. セッション作成（共有の接続プール経由の非同期呼び出し）
+        checkout_session = await stripe_api.create_checkout_session(
             payment_method_types=['card'],
             line_items=[
                 {
@@ -286,7 +1289,7 @@ async def create_checkout_session(request: CheckoutRequest):
                 "plan_type": request.plan_key # わかりやすいキーを保存
             }
         )
-        return {"url": checkout_session.url}
+        return {"url": checkout_session["url"]}
     except Exception as e:
         print(f"Stripe Error: {e}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -294,19 +1297,41 @@ async def create_checkout_session(request: CheckoutRequest):
 
 @app.post("/webhook")
 async def stripe_webhook(request: Request, stripe_signature: str = Header(None)):
+    """
+    署名を検証してイベントIDをキューに保存し、すぐに200を返す
+    Supabaseの更新はバックグラウンドワーカーが行う（Stripeの再送は event id で重複排除）
+    """
     payload = await request.body()
+    stripe = await stripe_sdk.aget()
     try:
-        event = stripe.Webhook.construct_event(
+        stripe.Webhook.construct_event(
             payload, stripe_signature, STRIPE_WEBHOOK_SECRET
         )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    if event['type'] == 'checkout.session.completed':
-        session = event['data']['object']
-        await handle_checkout_completed(session)
+    # 検証済みの生JSONを保存する（StripeObjectはそのままJSON化できないため）
+    event = json.loads(payload)
+    if event["type"] not in WEBHOOK_HANDLERS:
+        return {"status": "ignored"}
+
+    queued = webhook_queue.enqueue(event["id"], event["type"], event["data"]["object"])
+    return {"status": "success" if queued else "duplicate"}
 
-    return {"status": "success"}
+# --- Webhook Handlers (バックグラウンドワーカーから呼ばれる。失敗時は例外を投げて再試行させる) ---
+
+PRICE_ID_TO_PLAN_KEY = {price_id: key for key, price_id in PLAN_KEY_TO_ID.items() if price_id}
+
+async def update_profiles(column: str, value: str, values: dict):
+    supabase = await supabase_client.aget()
+    if not supabase:
+        raise RuntimeError("Supabase client is not configured.")
+    await supabase.table("profiles").update(values).eq(column, value).execute()
+    # プラン変更をレート制限に即座に反映する（次の解析リクエストで profiles を引き直す）
+    if column == "id":
+        profile_cache.invalidate(value)
+    else:
+        profile_cache.invalidate_where(column, value)
 
 async def handle_checkout_completed(session):
     """
@@ -316,19 +1341,66 @@ async def handle_checkout_completed(session):
     customer_id = session.get("customer")
     
     # Metadataからプラン情報を取得（create_checkout_sessionで埋め込んだもの）
-    metadata = session.get("metadata", {})
+    metadata = session.get("metadata") or {}
     plan_type = metadata.get("plan_type", "free")
     
-    if not user_id or not supabase:
-        print("Webhook Warning: No user_id or Supabase client.")
+    if not user_id:
+        print("Webhook Warning: No user_id in checkout session.")
         return
 
-    try:
-        supabase.table("profiles").update({
-            "stripe_customer_id": customer_id,
-            "subscription_status": "active",
-            "plan_type": plan_type
-        }).eq("id", user_id).execute()
-        print(f"User {user_id} upgraded to {plan_type}.")
-    except Exception as e:
-        print(f"Supabase Update Error: {e}")
\ No newline at end of file
+    await update_profiles("id", user_id, {
+        "stripe_customer_id": customer_id,
+        "subscription_status": "active",
+        "plan_type": plan_type
+    })
+    print(f"User {user_id} upgraded to {plan_type}.")
+
+async def handle_subscription_updated(subscription):
+    """プラン変更・更新: Stripe上のステータスとプランを反映"""
+    customer_id = subscription.get("customer")
+    values = {"subscription_status": subscription.get("status")}
+    items = (subscription.get("items") or {}).get("data") or []
+    if items:
+        plan_type = PRICE_ID_TO_PLAN_KEY.get((items[0].get("price") or {}).get("id"))
+        if plan_type:
+            values["plan_type"] = plan_type
+    await update_profiles("stripe_customer_id", customer_id, values)
+    print(f"Customer {customer_id} subscription updated: {values}")
+
+async def handle_subscription_deleted(subscription):
+    """解約: 無料プランに戻す"""
+    customer_id = subscription.get("customer")
+    await update_profiles("stripe_customer_id", customer_id, {"subscription_status": "canceled", "plan_type": "free"})
+    print(f"Customer {customer_id} subscription canceled.")
+
+async def handle_payment_failed(invoice):
+    """支払い失敗: 支払い遅延状態にする（プランはStripe側の再請求結果を待つ）"""
+    customer_id = invoice.get("customer")
+    await update_profiles("stripe_customer_id", customer_id, {"subscription_status": "past_due"})
+    print(f"Customer {customer_id} payment failed.")
+
+WEBHOOK_HANDLERS = {
+    "checkout.session.completed": handle_checkout_completed,
+    "customer.subscription.updated": handle_subscription_updated,
+    "customer.subscription.deleted": handle_subscription_deleted,
+    "invoice.payment_failed": handle_payment_failed,
+}
+
+webhook_queue = WebhookJobQueue(
+    default_queue_path(), WEBHOOK_HANDLERS,
+    max_attempts=int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "6")),
+    base_delay=float(os.getenv("WEBHOOK_RETRY_BASE_DELAY", "2")),
+    # 処理中のまま落ちたワーカーのジョブを、ほかのワーカーが取り直すまでの秒数
+    lease_timeout=float(os.getenv("WEBHOOK_LEASE_TIMEOUT", "300")),
+)
+
+@app.on_event("startup")
+async def start_webhook_worker():
+    webhook_queue.start()
+
+@app.on_event("shutdown")
+async def stop_webhook_worker():
+    await webhook_queue.stop()
+
+if STARTUP_PROFILE:
+    print(f"[startup] import main {time.perf_counter() - _IMPORT_STARTED:.2f}s")
@@ -0,0 +1,222 @@
+import asyncio
+import time
+from collections import deque
+
+
+class AllModelsUnavailable(Exception):
+    """すべてのモデルのサーキットブレーカーが開いている（→ 503 Service Unavailable）"""
+
+
+class CircuitBreaker:
+    """
+    連続 failure_threshold 回失敗したらそのモデルを reset_timeout 秒間使わない（open）
+    経過後は1件だけ試し（half-open）、成功すれば元に戻す
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def available(self) -> bool:
+        """allow() が True を返す状態か（試行枠は取らない）"""
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self._probing)
+
+    def allow(self) -> bool:
+        """試行してよいか。half-open では1件分の試行枠を取る（record_* か release で返すこと）"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def release(self):
+        """試行が結果を出さずに取り消された（ヘッジ負け）場合"""
+        self._probing = False
+
+
+class LatencyTracker:
+    """直近 window 件の成功時レイテンシ（秒）"""
+
+    def __init__(self, window: int = 256):
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, p: float) -> float:
+        values = sorted(self._samples)
+        return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class ModelRouter:
+    """
+    優先順のモデル一覧から Gemini の呼び出し先を選ぶ
+    - 1番目（使えるもののうち先頭）に送り、その時点の p{hedge_percentile} を過ぎても応答がなければ
+      次のモデル（1つしかなければ同じモデル）に同じリクエストを重ねて送り、先に返った方を使う
+    - エラーになったら待たずに次のモデルへ切り替える
+    - モデルごとのサーキットブレーカーで、落ちているモデルを飛ばす
+
+        response, model_name = await router.generate(lambda name: call(name))
+    """
+
+    def __init__(self, models, hedge: bool = True, hedge_percentile: float = 95.0,
+                 default_hedge_delay: float = 8.0, min_hedge_delay: float = 0.5, min_samples: int = 20,
+                 max_attempts: int = None, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 non_retryable=None):
+        self.models = list(models)
+        if not self.models:
+            raise ValueError("ModelRouter needs at least one model")
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.min_samples = min_samples
+        self.max_attempts = max_attempts or max(2, len(self.models))
+        self.non_retryable = non_retryable or (lambda e: False)
+        self.breakers = {m: CircuitBreaker(failure_threshold, reset_timeout) for m in self.models}
+        self.latency = {m: LatencyTracker() for m in self.models}
+        self.calls = {m: {"ok": 0, "error": 0, "cancelled": 0} for m in self.models}
+        self.hedges = 0
+        self.fallbacks = 0
+
+    @property
+    def primary(self) -> str:
+        return self.models[0]
+
+    def hedge_delay(self, model: str) -> float:
+        tracker = self.latency[model]
+        if len(tracker) < self.min_samples:
+            return self.default_hedge_delay
+        return max(self.min_hedge_delay, tracker.percentile(self.hedge_percentile))
+
+    def _targets(self):
+        """
+        試す順のモデル（ブレーカーが閉じているもの）。1つしかなければヘッジ用に同じモデルを繰り返す
+        ここでは試行枠を取らない（half-open の枠は実際に送るときに acquire で取る）
+        """
+        healthy = [m for m in self.models if self.breakers[m].available()]
+        if not healthy:
+            raise AllModelsUnavailable("All Gemini models are temporarily unavailable")
+        if len(healthy) == 1:
+            healthy = healthy * self.max_attempts
+        return healthy[:self.max_attempts]
+
+    def acquire(self, model: str) -> bool:
+        """model に送ってよいか（half-open なら試行枠を取る）。True なら record か release を必ず呼ぶこと"""
+        return self.breakers[model].allow()
+
+    def release(self, model: str):
+        """acquire した試行を、結果を記録せずに取り消す（記録済みなら何もしない）"""
+        self.breakers[model].release()
+
+    def record(self, model: str, ok: bool, seconds: float = None):
+        """ルーターを通さない呼び出し（ストリーミング等）の結果を反映する"""
+        if ok:
+            self.breakers[model].record_success()
+            if seconds is not None:
+                self.latency[model].record(seconds)
+        else:
+            self.breakers[model].record_failure()
+        self.calls[model]["ok" if ok else "error"] += 1
+
+    def candidates(self) -> list:
+        """フォールバック順のモデル（ブレーカーが閉じているもの）。送る直前に acquire すること"""
+        return list(dict.fromkeys(self._targets()))
+
+    async def generate(self, make_call):
+        """
+        make_call(model_name) -> コルーチン
+        戻り値: (レスポンス, 応答したモデル名)
+        """
+        targets = self._targets()
+        pending = {}  # task -> (model, 開始時刻)
+        last_error = None
+
+        def launch():
+            """次に送れるモデルに送る（送れるモデルがなければ None）"""
+            while targets:
+                model = targets.pop(0)
+                if self.acquire(model):
+                    pending[asyncio.ensure_future(make_call(model))] = (model, time.monotonic())
+                    return model
+            return None
+
+        if launch() is None:
+            raise AllModelsUnavailable("All Gemini models are temporarily unavailable")
+        try:
+            while pending:
+                timeout = None
+                if targets and self.hedge:
+                    newest_model, newest_started = list(pending.values())[-1]
+                    timeout = max(0.0, self.hedge_delay(newest_model) - (time.monotonic() - newest_started))
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # 応答が遅い → 次のモデルにも同じリクエストを送る
+                    self.hedges += 1
+                    launch()
+                    continue
+                for task in done:
+                    model, started = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        self.record(model, True, time.monotonic() - started)
+                        return task.result(), model
+                    last_error = error
+                    if self.non_retryable(error):
+                        # リクエスト自体の誤り（4xx）でモデルの障害ではない: 失敗に数えず試行枠だけ返す
+                        self.release(model)
+                        self.calls[model]["error"] += 1
+                        raise error
+                    self.record(model, False)
+                    print(f"Gemini Error ({model}): {error}")
+                if targets and not pending:
+                    self.fallbacks += 1
+                    launch()
+            raise last_error
+        finally:
+            for task, (model, _) in pending.items():
+                task.cancel()
+                self.breakers[model].release()
+                self.calls[model]["cancelled"] += 1
+
+    def stats(self) -> dict:
+        return {
+            "models": {
+                m: {
+                    "state": self.breakers[m].state,
+                    "hedge_delay": round(self.hedge_delay(m), 3),
+                    **self.calls[m],
+                }
+                for m in self.models
+            },
+            "hedges": self.hedges,
+            "fallbacks": self.fallbacks,
+        }
@@ -0,0 +1,147 @@
+import hashlib
+import io
+import os
+import threading
+
+# ==========================================
+# OGP画像（SNSシェア用カード）のレンダリング
+# ==========================================
+# 背景・左の帯・アイコン・ロゴ文字など毎回同じ部分は最初に1回だけ描いて保持し、
+# 1枚ごとの処理はそのコピーにタイトル・サブタイトルを書くだけにする。
+# Pillow は初回レンダリング時にだけ import する（起動を軽くするため）
+
+OGP_SIZE = (1200, 630)
+THEME_COLOR = "#0D9488"  # Teal-600
+BG_COLOR = "#F0FDFA"     # Teal-50
+TEXT_COLOR = "#115E59"   # Teal-900
+SUB_TEXT_COLOR = "#0F766E"
+FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ipaexg.ttf")
+
+# レイアウトを変えたら上げる（キャッシュキーが変わり、古い画像は使われなくなる）
+TEMPLATE_VERSION = "1"
+
+TITLE_FONT_SIZE = 64
+SUBTITLE_FONT_SIZE = 36
+TEXT_LEFT = 100
+TEXT_WIDTH = 1000
+
+# 固定ページのカード（ページ名 → (タイトル, サブタイトル)）
+PAGE_CARDS = {
+    "home": ("医師に伝える、家族と備える。", "AIが通院時の症状説明をサポートする医療サマリーアプリ"),
+    "about": ("Karutto について", "通院時の「伝え忘れ」を防ぐ、家族で共有できる医療サマリー"),
+    "plans": ("料金プラン", "家族みんなの医療サマリーを、もっと便利に"),
+    "family": ("家族で見守る", "離れて暮らす家族の体調記録を共有できます"),
+    "history": ("サマリー履歴", "これまでに作成した医療サマリーを振り返る"),
+    "privacy": ("プライバシーポリシー", "Karutto (カルット)"),
+    "terms": ("利用規約", "Karutto (カルット)"),
+}
+
+
+def ogp_cache_key(title: str, subtitle: str, fallback_font: bool = False) -> str:
+    """
+    カードの内容から決まるキー（ETag・ディスクキャッシュのファイル名にも使う）
+    代替フォント（日本語が豆腐になる）で描いた画像は、フォントを置いた後の画像と別のキーにする
+    """
+    font = "fallback" if fallback_font else "ipaexg"
+    return hashlib.sha256(f"{TEMPLATE_VERSION}\0{font}\0{title}\0{subtitle}".encode("utf-8")).hexdigest()
+
+
+def _wrap(draw, text: str, font, width: int, max_lines: int) -> list:
+    """1文字ずつ幅を測って折り返す（日本語は空白で区切れないため）。溢れた分は … で切る"""
+    lines, line = [], ""
+    for ch in text:
+        if ch == "\n" or draw.textlength(line + ch, font=font) > width:
+            lines.append(line)
+            line = "" if ch == "\n" else ch
+            if len(lines) == max_lines:
+                break
+        else:
+            line += ch
+    else:
+        if line:
+            lines.append(line)
+        return lines
+    last = lines[-1]
+    while last and draw.textlength(last + "…", font=font) > width:
+        last = last[:-1]
+    lines[-1] = last + "…"
+    return lines
+
+
+class OgpRenderer:
+    """OGPカードを PNG にする。共通部分（背景・帯・アイコン）とフォントは1回だけ用意する"""
+
+    def __init__(self, font_path: str = FONT_PATH):
+        self.font_path = font_path
+        # 日本語フォントが使えない（代替フォントで描く）か。ファイルがあっても読めなければ _font で True にする
+        self.fallback_font = not os.path.isfile(font_path)
+        self._base = None
+        self._fonts = None
+        self._lock = threading.Lock()
+
+    def _font(self, size: int):
+        from PIL import ImageFont
+        try:
+            return ImageFont.truetype(self.font_path, size)
+        except OSError:
+            self.fallback_font = True
+            return ImageFont.load_default(size)
+
+    def prepare(self):
+        """共通部分とフォントを用意する（初回の render で自動的に呼ばれる。prefork では fork 前に呼ぶ）"""
+        with self._lock:
+            if self._base is not None:
+                return
+            from PIL import Image, ImageDraw
+
+            if not os.path.exists(self.font_path):
+                print("Warning: ipaexg.ttf not found. OGP text falls back to the default font.")
+            fonts = {
+                "brand": self._font(52),
+                "title": self._font(TITLE_FONT_SIZE),
+                "subtitle": self._font(SUBTITLE_FONT_SIZE),
+                "footer": self._font(28),
+            }
+
+            img = Image.new("RGB", OGP_SIZE, color=BG_COLOR)
+            draw = ImageDraw.Draw(img)
+            # 左側の帯
+            draw.rectangle([(0, 0), (40, OGP_SIZE[1])], fill=THEME_COLOR)
+            # アイコン（角丸の枠 + 十字）
+            icon_x, icon_y, icon_size = TEXT_LEFT, 70, 96
+            draw.rounded_rectangle(
+                [(icon_x, icon_y), (icon_x + icon_size, icon_y + icon_size)],
+                radius=18, fill=THEME_COLOR
+            )
+            draw.rectangle([(icon_x + 32, icon_y + 16), (icon_x + 64, icon_y + 80)], fill="white")
+            draw.rectangle([(icon_x + 16, icon_y + 32), (icon_x + 80, icon_y + 64)], fill="white")
+            # ロゴ文字・区切り線・フッター
+            draw.text((icon_x + icon_size + 28, icon_y + icon_size // 2), "Karutto",
+                      font=fonts["brand"], fill=TEXT_COLOR, anchor="lm")
+            draw.line([(TEXT_LEFT, 210), (TEXT_LEFT + TEXT_WIDTH, 210)], fill=THEME_COLOR, width=3)
+            draw.text((TEXT_LEFT + TEXT_WIDTH, OGP_SIZE[1] - 50), "karteno.jp",
+                      font=fonts["footer"], fill=SUB_TEXT_COLOR, anchor="rs")
+
+            self._fonts = fonts
+            self._base = img
+
+    def render(self, title: str, subtitle: str = "") -> bytes:
+        """タイトル（最大2行）とサブタイトル（最大2行）を書いた PNG を返す"""
+        self.prepare()
+        from PIL import ImageDraw
+
+        img = self._base.copy()
+        draw = ImageDraw.Draw(img)
+        y = 260
+        for line in _wrap(draw, title, self._fonts["title"], TEXT_WIDTH, 2):
+            draw.text((TEXT_LEFT, y), line, font=self._fonts["title"], fill=TEXT_COLOR)
+            y += int(TITLE_FONT_SIZE * 1.35)
+        y += 16
+        for line in _wrap(draw, subtitle, self._fonts["subtitle"], TEXT_WIDTH, 2):
+            draw.text((TEXT_LEFT, y), line, font=self._fonts["subtitle"], fill=SUB_TEXT_COLOR)
+            y += int(SUBTITLE_FONT_SIZE * 1.4)
+
+        buffer = io.BytesIO()
+        # optimize=True は数倍遅い。単色の多いカードなので既定の圧縮でも十分小さい
+        img.save(buffer, format="PNG")
+        return buffer.getvalue()
@@ -0,0 +1,83 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+
+def pdf_cache_key(text: str, pdf_size: str) -> str:
+    """PDFの中身（テキスト + 用紙サイズ）から決まるキー。ETag にもそのまま使う"""
+    return hashlib.sha256(f"{pdf_size}\0{text}".encode("utf-8")).hexdigest()
+
+
+class PdfCache:
+    """
+    content-addressed なPDFバイト列キャッシュ（suffix を変えれば OGP画像などにも使う）
+    - メモリ: 合計 max_bytes までの LRU
+    - ディスク: directory を指定した場合のみ（再起動・ワーカー間で共有）
+    キーが内容のハッシュなので、無効化は不要（内容が変われば別キーになる）
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, directory: str = None, suffix: str = ".pdf"):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.suffix = suffix
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{self.suffix}")
+
+    def get(self, key: str):
+        with self._lock:
+            data = self._data.get(key)
+            if data is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return data
+        if self.directory:
+            try:
+                with open(self._path(key), "rb") as f:
+                    data = f.read()
+                self._put_memory(key, data)
+                self.hits += 1
+                return data
+            except FileNotFoundError:
+                pass
+        self.misses += 1
+        return None
+
+    def _put_memory(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.current_bytes -= len(old)
+            self._data[key] = data
+            self.current_bytes += len(data)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+    def set(self, key: str, data: bytes):
+        self._put_memory(key, data)
+        if self.directory:
+            # 書き込み途中のファイルを他ワーカーが読まないよう、一時ファイル経由で置き換える
+            tmp = f"{self._path(key)}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._data),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+        }
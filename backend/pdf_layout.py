@@ -0,0 +1,139 @@
+import html
+import io
+import os
+import re
+
+from reportlab.lib.pagesizes import A4, B5
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
+from reportlab.lib.units import mm
+
+from pdf_renderer import PDF_SIZES
+
+# ReportLab に依存する部分（レイアウト・スタイル・ビルド）
+# 起動を軽くするため、pdf_renderer からは初回レンダリング時にだけ import される
+
+FONT_NAME = "IPAexGothic"
+FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ipaexg.ttf")
+
+_BOLD_RE = re.compile(r'\*\*(.*?)\*\*')
+
+
+class PdfProfile:
+    """pdf_size ごとに事前計算したページ設定・スタイル"""
+
+    def __init__(self, pdf_size: str, font_name: str, base_styles):
+        receipt = pdf_size == "Receipt"
+        self.pdf_size = pdf_size
+        self.pagesize = B5 if pdf_size == "B5" else (80*mm, 300*mm) if receipt else A4
+        self.margin = 5*mm if receipt else 20*mm
+        self.base_font_size = 9 if receipt else 10
+        self.title_font_size = 14 if receipt else 18
+        self.header_size = self.base_font_size + 2
+        self.title_text = "Medical Summary" if receipt else "Medical Summary / 医師提示用サマリー"
+        self.jp_style = ParagraphStyle(
+            name='JP', parent=base_styles['Normal'], fontName=font_name,
+            fontSize=self.base_font_size, leading=self.base_font_size * 1.6
+        )
+        self.title_style = ParagraphStyle(
+            name='Title', parent=base_styles['Heading1'], fontName=font_name,
+            fontSize=self.title_font_size, leading=self.title_font_size * 1.4,
+            alignment=1, spaceAfter=5*mm
+        )
+
+    def new_doc(self, buffer) -> SimpleDocTemplate:
+        m = self.margin
+        return SimpleDocTemplate(
+            buffer, pagesize=self.pagesize,
+            rightMargin=m, leftMargin=m, topMargin=m, bottomMargin=m
+        )
+
+
+_font_name = None
+_profiles = {}
+
+
+def register_fonts() -> str:
+    """IPAexGothic を登録（プロセスごとに1回）。使えるフォント名を返す"""
+    global _font_name
+    if _font_name is not None:
+        return _font_name
+    _font_name = "Helvetica"
+    try:
+        if FONT_NAME in pdfmetrics.getRegisteredFontNames():
+            _font_name = FONT_NAME
+        elif os.path.exists(FONT_PATH):
+            pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH))
+            _font_name = FONT_NAME
+        else:
+            print("Warning: ipaexg.ttf not found. Fallback to Helvetica.")
+    except Exception as e:
+        print(f"Font Load Error: {e}")
+    return _font_name
+
+
+def get_profile(pdf_size: str) -> PdfProfile:
+    profile = _profiles.get(pdf_size)
+    if profile is None:
+        if not _profiles:
+            font_name = register_fonts()
+            base_styles = getSampleStyleSheet()
+            for size in PDF_SIZES:
+                _profiles[size] = PdfProfile(size, font_name, base_styles)
+        # 未知のサイズは従来どおり A4 扱い
+        profile = _profiles.get(pdf_size, _profiles["A4"])
+    return profile
+
+
+def warm_up() -> str:
+    """フォント登録とスタイル事前計算を済ませる（ワーカー初期化用）"""
+    get_profile("A4")
+    return _font_name
+
+
+def build_story(text: str, profile: PdfProfile, subtitle: str = None) -> list:
+    story = [Paragraph(profile.title_text, profile.title_style)]
+    if subtitle:
+        story.append(Paragraph(html.escape(subtitle), profile.jp_style))
+    story.append(Spacer(1, 5*mm))
+    jp_style = profile.jp_style
+    for line in text.split('\n'):
+        stripped = line.strip()
+        if not stripped: continue
+        formatted_line = _BOLD_RE.sub(r'<b>\1</b>', html.escape(line))
+
+        if stripped.startswith("■"):
+            clean_text = formatted_line.replace("■", "").strip()
+            story.append(Spacer(1, 2*mm))
+            story.append(Paragraph(f"<font size={profile.header_size}><b>■ {clean_text}</b></font>", jp_style))
+        elif stripped.startswith("- ") or stripped.startswith("・"):
+            clean_text = formatted_line.replace("- ", "").replace("・", "").strip()
+            story.append(Paragraph(f"• {clean_text}", jp_style))
+        else:
+            story.append(Paragraph(formatted_line, jp_style))
+
+        story.append(Spacer(1, 1*mm))
+    return story
+
+
+def render_pdf(text: str, pdf_size: str = "A4") -> bytes:
+    """サマリーテキストをPDFバイト列に変換する（同期・CPUバウンド）"""
+    profile = get_profile(pdf_size)
+    buffer = io.BytesIO()
+    profile.new_doc(buffer).build(build_story(text, profile))
+    return buffer.getvalue()
+
+
+def build_summaries_story(entries, profile: PdfProfile) -> list:
+    """
+    entries: [(見出し, サマリーテキスト), ...] を1件ずつ改ページして並べる
+    （エクスポート用。件数の多い書き出しは pdf_stream で1つのキャンバスに数件ずつ描き足す）
+    """
+    story = []
+    for subtitle, text in entries:
+        if story:
+            story.append(PageBreak())
+        story.extend(build_story(text, profile, subtitle))
+    return story
@@ -0,0 +1,110 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+PDF_SIZES = ("A4", "B5", "Receipt")
+
+
+def normalize_pdf_size(pdf_size: str) -> str:
+    """未知のサイズは A4 で描くので、キャッシュキー・ETag も A4 と同じにする"""
+    return pdf_size if pdf_size in PDF_SIZES else "A4"
+
+
+def render_pdf(text: str, pdf_size: str = "A4") -> bytes:
+    """サマリーテキストをPDFバイト列に変換する（同期・CPUバウンド。ReportLabは初回に読み込む）"""
+    import pdf_layout
+    return pdf_layout.render_pdf(text, pdf_size)
+
+
+def open_export_writer(pdf_size: str = "A4", title: str = "Medical Summary"):
+    """一括エクスポート用の pdf_stream.PdfExportWriter（ReportLabは初回に読み込む）"""
+    import pdf_stream
+    return pdf_stream.PdfExportWriter(pdf_size, title)
+
+
+def warm_up() -> str:
+    """フォント登録とスタイル事前計算を済ませる（ワーカー初期化用）"""
+    import pdf_layout
+    return pdf_layout.warm_up()
+
+
+SUMMARY_SECTIONS = (
+    ("chief_complaint", "主訴"),
+    ("history", "現病歴"),
+    ("symptoms", "随伴症状"),
+    ("background", "既往歴・服薬"),
+)
+
+
+def summary_to_text(summary: dict) -> str:
+    """保存済みサマリー(dict)を、フロントエンドと同じ「■ 見出し」形式のテキストにする"""
+    blocks = []
+    for key, header in SUMMARY_SECTIONS:
+        value = summary.get(key) or ""
+        if isinstance(value, list):
+            value = "\n".join(f"- {v}" for v in value)
+        blocks.append(f"■ {header}\n{value}")
+    return "\n\n".join(blocks)
+
+
+class PdfRenderPool:
+    """
+    PDFのビルドをイベントループ外（プロセスプール）で実行する
+    各ワーカーは起動時にフォント登録・スタイル計算を済ませておく
+    workers=0 の場合はスレッドで実行する（開発環境・メモリの少ないインスタンス向け）
+    """
+
+    def __init__(self, workers: int = None):
+        if workers is None:
+            workers = int(os.getenv("PDF_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self.workers = workers
+        self._executor = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.workers <= 0 or self._executor is not None or self._closed:
+                warm_up()
+                return
+            executor = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_up)
+            # 全ワーカーを先に起動させておく（初回リクエストでの起動待ちを避ける）
+            for future in [executor.submit(time.sleep, 0.05) for _ in range(self.workers)]:
+                future.result()
+            self._executor = executor
+
+    def shutdown(self):
+        """
+        プールを止める。起動中（バックグラウンドのウォームアップ）なら起動を待ってから止め、以降は起動しない
+        （起動直後に SIGTERM を受けても、ワーカーがリスニングソケットを持ったまま残らないように）
+        """
+        with self._lock:
+            self._closed = True
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    async def _run(self, fn, *args):
+        if self._executor is None and self.workers > 0:
+            # 起動時のウォームアップが無効・未完了なら、ここでプールを起動する
+            await asyncio.to_thread(self.start)
+        if self._executor is None:
+            return await asyncio.to_thread(fn, *args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def render(self, text: str, pdf_size: str = "A4") -> bytes:
+        return await self._run(render_pdf, text, pdf_size)
+
+    # 一括エクスポートは1文書の状態（キャンバス）を書き出しの間ずっと持つため、
+    # プロセスプールには渡さずスレッドで1つずつ順に描画する
+    async def open_export(self, pdf_size: str = "A4", title: str = "Medical Summary"):
+        return await asyncio.to_thread(open_export_writer, pdf_size, title)
+
+    async def render_into(self, writer, entries) -> bytes:
+        return await asyncio.to_thread(writer.add, entries)
+
+    async def finish_export(self, writer) -> bytes:
+        return await asyncio.to_thread(writer.finish)
@@ -0,0 +1,136 @@
+import io
+
+from reportlab.pdfbase import pdfdoc
+from reportlab.pdfgen.canvas import Canvas
+
+from pdf_layout import build_summaries_story, get_profile
+
+# ==========================================
+# 複数サマリーの逐次PDF書き出し（ストリーミング出力用）
+# ==========================================
+# ReportLab は1文書を丸ごとメモリ上で組み立ててから書き出すため、数千件のサマリーを1回で
+# ビルドするとメモリが件数に比例して増える。そこで1つのキャンバスに数十件ずつ描き足し、
+# 描き終えたページ（ページ辞書と内容ストリーム）はその場で書き出してメモリから外す。
+# フォント（サブセット）・ページツリー・カタログは文書全体で1つだけ、最後に書く。
+# 保持するのはページごとの参照名と書き出し位置だけなので、件数が増えてもほぼ一定。
+# ReportLab ではこの部分だけ（ReportLab 本体と同じく）初回の書き出し時に import される。
+
+
+class _Flushed(pdfdoc.PDFObject):
+    """書き出し済みのオブジェクトの代わり（参照に使う名前だけを残す）"""
+    __RefOnly__ = 1
+
+    def __init__(self, name: str):
+        setattr(self, pdfdoc.__InternalName__, name)
+
+
+class _IncrementalDocument(pdfdoc.PDFDocument):
+    """
+    描き終えたページから順に書き出せる PDFDocument
+    format() は PDFDocument.format() から「書き出し済みのオブジェクトを飛ばす」ようにしたもの
+    """
+
+    def begin(self):
+        self._file = pdfdoc.PDFFile(self._pdfVersion)   # ヘッダーを含む
+        self._scanned = 0         # flush_pages() で確認済みのオブジェクト番号
+        self._flushed_pages = 0   # 書き出し済みのページ数（Pages.pages の先頭から）
+
+    def take(self) -> bytes:
+        """まだ返していない出力を返す"""
+        data = b"".join(self._file.strings)
+        self._file.strings.clear()
+        return data
+
+    def _write(self, name: str):
+        obj = self.idToObject[name]
+        self.idToOffset[name] = self._file.add(pdfdoc.PDFIndirectObject(name, obj).format(self))
+        self.idToObject[name] = _Flushed(name)
+
+    def flush_pages(self) -> bytes:
+        """追加済みのページとその内容ストリームを書き出す（フォント等は最後まで残す）"""
+        pages = self.Pages.pages
+        while self._scanned < self.objectcounter:
+            self._scanned += 1
+            name = self.numberToId[self._scanned]
+            page = self.idToObject[name]
+            if not isinstance(page, pdfdoc.PDFPage):
+                continue
+            self._write(name)   # ここで内容ストリームが登録される
+            self._write(getattr(page.Contents, pdfdoc.__InternalName__))
+            pages[self._flushed_pages] = self.idToObject[name]
+            self._flushed_pages += 1
+        return self.take()
+
+    def format(self) -> bytes:
+        """残りのオブジェクト（フォント・ページツリー・カタログ・文書情報）と xref 表を書く"""
+        self.encrypt.prepare(self)
+        cat = self.Catalog
+        info = self.info
+        self.Reference(cat)
+        self.Reference(info)
+        ids = []
+        counter = 0
+        while True:
+            counter += 1
+            if counter not in self.numberToId:
+                break
+            name = self.numberToId[counter]
+            ids.append(name)
+            if not isinstance(self.idToObject[name], _Flushed):
+                self._write(name)
+        xref = pdfdoc.PDFCrossReferenceTable()
+        xref.addsection(0, ids)
+        xref_offset = self._file.add(xref.format(self))
+        trailer = pdfdoc.PDFTrailer(
+            startxref=xref_offset, Size=len(ids) + 1,
+            Root=self.Reference(cat), Info=self.Reference(info), ID=self.ID(),
+        )
+        self._file.add(trailer.format(self))
+        return self.take()
+
+
+class _IncrementalCanvas(Canvas):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Canvas が作った PDFDocument を、ページを逐次書き出せるものに差し替える
+        self._doc.__class__ = _IncrementalDocument
+        self._doc.begin()
+
+
+class PdfExportWriter:
+    """
+    サマリーを数件ずつ1つのPDFに描き足し、書き出すバイト列を少しずつ返す
+    1文書の状態（キャンバス）を持ち続けるので、同じ writer の呼び出しは1つずつ順に行うこと
+
+        writer = PdfExportWriter("A4", "Medical Summary Export")
+        yield writer.start()
+        for entries in pages:
+            yield writer.add(entries)
+        yield writer.finish()
+    """
+
+    def __init__(self, pdf_size: str = "A4", title: str = "Medical Summary"):
+        self.profile = get_profile(pdf_size)
+        self.title = title
+        self._buffer = io.BytesIO()   # finish() の末尾（canvas.save() の書き出し先）
+        self._canvas = _IncrementalCanvas(self._buffer, pagesize=self.profile.pagesize)
+
+    @property
+    def page_count(self) -> int:
+        return self._canvas.getPageNumber() - 1
+
+    def start(self) -> bytes:
+        return self._canvas._doc.take()
+
+    def add(self, entries) -> bytes:
+        """[(見出し, サマリーテキスト), ...] を1件ずつ改ページして描き足し、描き終えたページを返す"""
+        doc = self.profile.new_doc(self._buffer)
+        doc._doSave = 0   # 保存は finish() で1回だけ
+        doc.build(build_summaries_story(entries, self.profile), canvasmaker=lambda *args, **kwargs: self._canvas)
+        return self._canvas._doc.flush_pages()
+
+    def finish(self) -> bytes:
+        """フォント・ページツリー・カタログ・xref表を書いて閉じる"""
+        self._canvas.setTitle(self.title)
+        self._canvas.save()
+        return self._buffer.getvalue()
@@ -0,0 +1,146 @@
+import re
+from typing import List, NamedTuple
+
+# ==========================================
+# 個人情報マスキング（1パス）
+# ==========================================
+# すべてのルールを1本の正規表現にまとめ、テキストを1回だけ走査する。
+# 速度のための工夫:
+#   - 先頭を1文字の文字クラスにして、候補にならない文字（ひらがな・大半の漢字）を
+#     正規表現エンジンのC実装側で読み飛ばさせる
+#   - 先頭文字の種類（数字 / ASCII / 〒 など）で分岐し、該当するルールだけを試す
+#   - 数字系のルールは「数字列の先頭」でだけ判定する（途中の桁では即座に失敗）
+
+_D = "[0-9０-９]"
+_NOT_D = "(?![0-9０-９])"
+_SEP = "[-‐－ー ]"
+_HYPHEN = "[-‐－]"
+_EMAIL_CH = "A-Za-z0-9._%+\\-"
+_URL_BODY = r"[^\s　<>\"'、。）)]+"
+
+PREFECTURES = (
+    "北海道", "青森県", "岩手県", "宮城県", "秋田県", "山形県", "福島県", "茨城県", "栃木県", "群馬県",
+    "埼玉県", "千葉県", "東京都", "神奈川県", "新潟県", "富山県", "石川県", "福井県", "山梨県", "長野県",
+    "岐阜県", "静岡県", "愛知県", "三重県", "滋賀県", "京都府", "大阪府", "兵庫県", "奈良県", "和歌山県",
+    "鳥取県", "島根県", "岡山県", "広島県", "山口県", "徳島県", "香川県", "愛媛県", "高知県", "福岡県",
+    "佐賀県", "長崎県", "熊本県", "大分県", "宮崎県", "鹿児島県", "沖縄県",
+)
+_PREF_FIRST = "".join(sorted({p[0] for p in PREFECTURES}))
+_PREF_REST = "|".join(sorted({p[1:] for p in PREFECTURES}, key=len, reverse=True))
+
+# 電話番号: 0 / +81 始まりで合計10〜11桁のみ（「2024 10 17」「38.5」などの日付・体温は対象外）
+_PHONE_TAIL = f"(?:{_D}{_SEP}?){{8,9}}{_D}{_NOT_D}"
+# 括弧付きの表記: 「(03)1234-5678」（市外局番を括弧で囲む）・「03(1234)5678」（市内局番を括弧で囲む）
+_OPEN = "[(（]"
+_CLOSE = "[)）]"
+_PHONE_LOCAL = f"{_D}{{1,4}}{_SEP}?{_D}{{4}}{_NOT_D}"
+_EMAIL_TAIL = f"[{_EMAIL_CH}]*@[A-Za-z0-9.-]+\\.[A-Za-z]{{2,}}"
+_ADDRESS_TAIL = (
+    f"[一-龥ぁ-んァ-ヶ]{{1,12}}?[市区町村郡][^\\s、。,，]{{0,20}}?"
+    f"{_D}+(?:丁目|番地?|{_HYPHEN}){_D}*(?:(?:番地?|{_HYPHEN}){_D}+)?号?"
+)
+
+PII_REGEX = re.compile(
+    f"[{_EMAIL_CH}０-９＋〒被保(（{_PREF_FIRST}](?:"
+    # --- 数字始まり（数字列の先頭のみ）---
+    f"(?<=[0-9０-９])(?<![0-9０-９][0-9０-９])(?:"
+    f"(?<=[0０])(?:(?P<PHONE>{_PHONE_TAIL})|(?P<PHONE_PAREN>{_D}{{1,3}}{_OPEN}{_D}{{1,4}}{_CLOSE}{_SEP}?{_D}{{4}}{_NOT_D}))"
+    f"|(?P<MY_NUMBER>{_D}{{3}}{_SEP}?{_D}{{4}}{_SEP}?{_D}{{4}}{_NOT_D})"
+    f"|(?P<POSTAL>{_D}{{2}}{_HYPHEN}{_D}{{4}}{_NOT_D})"
+    f"|(?P<ADDRESS_CHOME>{_D}*丁目{_D}+(?:番地?|{_HYPHEN}){_D}+号?)"
+    f"|(?P<EMAIL_DIGIT>{_EMAIL_TAIL})"
+    f")"
+    # --- ASCII始まり（英字列の先頭のみ）---
+    f"|(?<=[A-Za-z._%+\\-])(?<![{_EMAIL_CH}][{_EMAIL_CH}])(?:"
+    f"(?<=h)(?P<URL>ttps?://{_URL_BODY})"
+    f"|(?<=w)(?P<URL_WWW>ww\\.{_URL_BODY})"
+    f"|(?<=\\+)(?P<PHONE_INTL>[8８][1１]{_SEP}?{_PHONE_TAIL})"
+    f"|(?P<EMAIL>{_EMAIL_TAIL})"
+    f")"
+    f"|(?<=[(（])(?P<PHONE_AREA_PAREN>[0０]{_D}{{1,4}}{_CLOSE}{_SEP}?{_PHONE_LOCAL})"
+    f"|(?<=＋)(?P<PHONE_INTL_WIDE>[8８][1１]{_SEP}?{_PHONE_TAIL})"
+    f"|(?<=〒)(?P<POSTAL_MARK>\\s*{_D}{{3}}[-‐－ー]?{_D}{{4}})"
+    # 保険証の記号・番号（キーワード付きのものだけを対象にする）
+    f"|(?<=[被保])(?P<INSURANCE>(?:保険者証?|険者|険証)の?(?:記号番号|記号|番号|No\\.?)は?[\\s:：]*{_D}[0-9０-９\\-‐－・ ]{{2,}}{_D})"
+    # 住所: 都道府県 + 市区町村 + 番地
+    f"|(?<=[{_PREF_FIRST}])(?P<ADDRESS>(?:{_PREF_REST}){_ADDRESS_TAIL})"
+    f")"
+)
+
+# 正規表現のグループ名 → 種別
+_GROUP_KIND = {
+    "PHONE": "PHONE", "PHONE_PAREN": "PHONE", "PHONE_AREA_PAREN": "PHONE",
+    "PHONE_INTL": "PHONE", "PHONE_INTL_WIDE": "PHONE",
+    "MY_NUMBER": "MY_NUMBER",
+    "POSTAL": "POSTAL", "POSTAL_MARK": "POSTAL",
+    "EMAIL": "EMAIL", "EMAIL_DIGIT": "EMAIL",
+    "URL": "URL", "URL_WWW": "URL",
+    "INSURANCE": "INSURANCE",
+    "ADDRESS": "ADDRESS", "ADDRESS_CHOME": "ADDRESS",
+}
+
+PLACEHOLDERS = {
+    "PHONE": "[PHONE_HIDDEN]",
+    "EMAIL": "[EMAIL_HIDDEN]",
+    "URL": "[URL_HIDDEN]",
+    "MY_NUMBER": "[MYNUMBER_HIDDEN]",
+    "INSURANCE": "[INSURANCE_HIDDEN]",
+    "POSTAL": "[POSTAL_HIDDEN]",
+    "ADDRESS": "[ADDRESS_HIDDEN]",
+}
+
+_GROUP_PLACEHOLDER = {group: PLACEHOLDERS[kind] for group, kind in _GROUP_KIND.items()}
+
+
+class PiiSpan(NamedTuple):
+    kind: str
+    start: int          # 元テキスト上の位置
+    end: int
+    masked_start: int   # マスク後テキスト上の位置
+    masked_end: int
+
+
+class MaskResult:
+    """
+    マスク後のテキストと、置き換えた箇所の位置情報
+    spans はアクセスされたときに初めて組み立てる（/analyze の通常経路では text しか使わないため）
+    """
+    __slots__ = ("text", "_matches", "_spans")
+
+    def __init__(self, text: str, matches: list):
+        self.text = text
+        self._matches = matches
+        self._spans = None
+
+    @property
+    def spans(self) -> List[PiiSpan]:
+        if self._spans is None:
+            spans = []
+            shift = 0
+            for m in self._matches:
+                start, end = m.span()
+                kind = _GROUP_KIND[m.lastgroup]
+                size = len(PLACEHOLDERS[kind])
+                spans.append(PiiSpan(kind, start, end, start + shift, start + shift + size))
+                shift += size - (end - start)
+            self._spans = spans
+        return self._spans
+
+    def __repr__(self):
+        return f"MaskResult(text={self.text!r}, spans={self.spans!r})"
+
+
+def mask(text: str) -> MaskResult:
+    """テキストを1回だけ走査して個人情報を置き換える"""
+    matches = []
+    record = matches.append
+
+    def replace(m):
+        record(m)
+        return _GROUP_PLACEHOLDER[m.lastgroup]
+
+    return MaskResult(PII_REGEX.sub(replace, text), matches)
+
+
+def mask_pii(text: str) -> str:
+    return mask(text).text
@@ -0,0 +1,240 @@
+"""
+pre-fork 方式のマルチワーカー起動（1インスタンスで複数コアを使う）
+
+    python prefork.py --workers 4 --port 8000
+
+- 親プロセスで main を import し、フォント登録・スタイル・正規表現・OGPの共通画像・
+  Gemini / Stripe クライアントを用意してから fork する。ワーカーは親のメモリを
+  copy-on-write で共有するので、各ワーカーでの初期化と重複したメモリを持たない
+- キャッシュはワーカー間で共有できるローカルストアに置く
+  （解析結果: SQLite、PDF・OGP画像: ディスク。既に環境変数で指定されていればそちらを使う）
+- ワーカーは --max-requests 件（+ ゆらぎ）処理したら処理中のリクエストを終えてから終了し、
+  親が新しいワーカーを fork し直す。落ちたワーカーも同じように補充する
+- シグナル: SIGTERM / SIGINT = 全ワーカーを穏やかに停止、SIGHUP = 1つずつ入れ替え
+- レート制限のバケツはワーカーごと。上限はワーカー数で割って持つ（RATE_LIMIT_WORKERS）。
+  プラン変更によるキャッシュの無効化は共有SQLiteを通して全ワーカーに反映する
+- /metrics はワーカーごとの値（全体を集計するものではない）
+"""
+import argparse
+import gc
+import os
+import random
+import signal
+import socket
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def configure_shared_state(state_dir: str = None, workers: int = 1):
+    """ワーカー間で共有するキャッシュの置き場所・ワーカーごとの設定を決める（main の import より前に呼ぶ）"""
+    state_dir = state_dir or os.getenv("PREFORK_STATE_DIR", os.path.join(BACKEND_DIR, "shared_state"))
+    os.makedirs(state_dir, exist_ok=True)
+    os.environ.setdefault("ANALYSIS_CACHE_BACKEND", "sqlite")
+    os.environ.setdefault("ANALYSIS_CACHE_PATH", os.path.join(state_dir, "analysis_cache.sqlite3"))
+    os.environ.setdefault("PDF_CACHE_DIR", os.path.join(state_dir, "pdf"))
+    os.environ.setdefault("OGP_CACHE_DIR", os.path.join(state_dir, "ogp"))
+    os.environ.setdefault("PROFILE_INVALIDATION_PATH", os.path.join(state_dir, "profile_invalidations.sqlite3"))
+    os.environ.setdefault("RATE_LIMIT_WORKERS", str(workers))
+    # ワーカー自体が複数あるので、PDFのプロセスプールはワーカーあたり1つで足りる
+    os.environ.setdefault("PDF_RENDER_WORKERS", "1")
+
+
+def warm_up():
+    """
+    fork 前に親プロセスで読み込んでおくもの（ワーカーが copy-on-write で共有する）
+    ソケット・スレッドを持つもの（Supabase クライアント・PDFのプロセスプール）はここでは作らず、
+    各ワーカーの起動時に作る
+    """
+    started = time.perf_counter()
+    import main
+    import pdf_renderer
+
+    font = pdf_renderer.warm_up()
+    main.ogp_renderer.prepare()
+    for resource in (main.gemini_model, main.stripe_sdk):
+        try:
+            resource.get()
+        except Exception as e:
+            print(f"Warm-up Error: {e}")
+    try:
+        import supabase  # noqa: F401  import だけ済ませる（クライアントはワーカーごと）
+    except ImportError:
+        pass
+    print(f"[prefork] parent warmed in {time.perf_counter() - started:.2f}s (font: {font})")
+    return main.app
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Supervisor:
+    """ワーカーの fork・補充・入れ替え・停止を行う親プロセス側の処理"""
+
+    def __init__(self, app, sock: socket.socket, workers: int, max_requests: int = 0,
+                 max_requests_jitter: int = 0, graceful_timeout: float = 30.0):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.children = {}        # pid -> 起動時刻
+        self.retiring = set()     # 入れ替えのため停止を指示した pid
+        self.stopping = False
+        self.reload_requested = False
+        self._recent_failures = 0
+
+    # --- ワーカー ---
+
+    def spawn(self) -> int:
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.monotonic()
+            return pid
+        # ---- 子プロセス ----
+        code = 0
+        try:
+            self._run_worker()
+        except BaseException as e:
+            print(f"[prefork] worker {os.getpid()} crashed: {e}")
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def _run_worker(self):
+        import uvicorn
+
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD):
+            signal.signal(sig, signal.SIG_DFL)
+        random.seed()
+        limit = None
+        if self.max_requests > 0:
+            # 全ワーカーが同時に入れ替わらないよう、上限をずらす
+            limit = self.max_requests + random.randint(0, self.max_requests_jitter)
+        config = uvicorn.Config(
+            self.app, lifespan="on", limit_max_requests=limit,
+            timeout_graceful_shutdown=int(self.graceful_timeout), log_level="warning",
+        )
+        uvicorn.Server(config).run(sockets=[self.sock])
+
+    def reap(self):
+        """終了したワーカーを回収し、必要なら補充する"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            started = self.children.pop(pid, None)
+            retired = pid in self.retiring
+            self.retiring.discard(pid)
+            if started is None or self.stopping or retired:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if code != 0 and time.monotonic() - started < 5:
+                # 起動直後に落ち続ける場合は間隔をあける（設定ミスで fork し続けないように）
+                self._recent_failures += 1
+                time.sleep(min(30.0, 0.5 * 2 ** self._recent_failures))
+            else:
+                self._recent_failures = 0
+            if code != 0:
+                print(f"[prefork] worker {pid} exited with {code}, respawning")
+            self.spawn()
+
+    def rolling_restart(self):
+        """新しいワーカーを起動してから古いワーカーを1つずつ止める（処理能力を落とさない）"""
+        for pid in [p for p in self.children if p not in self.retiring]:
+            self.spawn()
+            self.retiring.add(pid)
+            self._signal(pid, signal.SIGTERM)
+
+    def _signal(self, pid: int, sig):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    # --- 親プロセスのループ ---
+
+    def run(self):
+        def on_stop(signum, frame):
+            self.stopping = True
+
+        def on_hup(signum, frame):
+            self.reload_requested = True
+
+        signal.signal(signal.SIGTERM, on_stop)
+        signal.signal(signal.SIGINT, on_stop)
+        signal.signal(signal.SIGHUP, on_hup)
+
+        # 親で作ったオブジェクトを GC の対象から外す（参照カウント以外でページを書き換えず、共有を保つ）
+        gc.collect()
+        gc.freeze()
+        for _ in range(self.workers):
+            self.spawn()
+        print(f"[prefork] parent {os.getpid()} serving with {self.workers} workers")
+
+        while not self.stopping:
+            if self.reload_requested:
+                self.reload_requested = False
+                self.rolling_restart()
+            self.reap()
+            time.sleep(0.2)
+        self.shutdown()
+
+    def shutdown(self):
+        for pid in list(self.children):
+            self._signal(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self.children and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in list(self.children):
+            print(f"[prefork] worker {pid} did not stop in time, killing")
+            self._signal(pid, signal.SIGKILL)
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.children.clear()
+        self.sock.close()
+
+
+def serve(app, host: str = "0.0.0.0", port: int = 8000, workers: int = None, max_requests: int = 0,
+          max_requests_jitter: int = 0, graceful_timeout: float = 30.0):
+    workers = workers or os.cpu_count() or 1
+    sock = bind_socket(host, port)
+    Supervisor(app, sock, workers, max_requests, max_requests_jitter, graceful_timeout).run()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "0")) or None)
+    parser.add_argument("--max-requests", type=int, default=int(os.getenv("MAX_REQUESTS", "10000")),
+                        help="この件数を処理したワーカーを入れ替える（0 で無効）")
+    parser.add_argument("--max-requests-jitter", type=int, default=int(os.getenv("MAX_REQUESTS_JITTER", "1000")))
+    parser.add_argument("--graceful-timeout", type=float, default=float(os.getenv("GRACEFUL_TIMEOUT", "30")))
+    args = parser.parse_args()
+
+    workers = args.workers or os.cpu_count() or 1
+    configure_shared_state(workers=workers)
+    app = warm_up()
+    serve(app, args.host, args.port, workers, args.max_requests, args.max_requests_jitter, args.graceful_timeout)
+
+
+if __name__ == "__main__":
+    main()
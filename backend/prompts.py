@@ -0,0 +1,200 @@
+import json
+import re
+from functools import lru_cache
+
+from analysis_result import JAPANESE_LANGUAGES
+from batch_analysis import estimate_tokens
+from clinical_hints import extract, format_hints
+
+# ==========================================
+# プロンプトテンプレート
+# ==========================================
+# 指示文・JSONスキーマなど毎回同じ部分は、言語ごとに1回だけ組み立てて system_instruction として送る。
+# リクエストごとに送るのは患者テキストだけになり、先頭が毎回同一になるため
+# Gemini の暗黙的コンテキストキャッシュ（同じ接頭辞の入力トークンを割引）にも乗りやすい。
+
+SYSTEM_INSTRUCTION = """あなたは救急・総合診療の経験豊富な「医療秘書AI」です。
+患者（ユーザー）の入力した症状から、医師が診断に必要な情報（OPQRST、既往歴、リスク因子）を抽出し、
+電子カルテにそのまま貼り付けられる「医学的サマリー」を作成してください。
+
+【重要：法的制約】
+1. あなたは医師ではありません。「診断（病名の断定）」は絶対に行わないでください。
+2. 「○○病の疑いがあります」といった病名の示唆も避けてください。
+3. 診療科の提案を行う場合は、あくまで「一般的に考えられる可能性」として提示し、断定的な表現を避けてください。
+
+【出力品質の基準】
+- 医師が短時間で状況を把握できる「専門的かつ簡潔」な表現を用いること。
+- 患者が「言ったこと」と「言わなかったこと（陰性所見）」を明確に区別すること。"""
+
+ANALYSIS_JSON_FORMAT = """{
+  "summary": {
+    "chief_complaint": "主訴（一番の症状を一言で。期間を含める。例: 3日前からの発熱）",
+    "history": "現病歴（OPQRSTに基づき、時系列順に記述。重要な陰性所見（例: 呼吸苦はない）もあれば含める）",
+    "symptoms": "随伴症状（主訴に伴うその他の症状。箇条書き推奨）",
+    "background": "既往歴・服薬・アレルギー（入力になければ「特記なし」）"
+  },
+  "departments": ["診療科1", "診療科2"],
+  "explanation": "ユーザーへの説明（日本語以外の場合のみ）"
+}"""
+
+# 数値・期間・部位の太字は生成後に clinical_hints.emphasize で付け、用語の言い換えは対象テキストの後に【用語】として付ける
+ANALYSIS_RULES = """重要指示:
+- 医師が読むためのカルテ用語に変換すること（【用語】の言い換えはそのまま使う）。数値・期間・部位は省略せず、太字などの記号は付けないこと。
+- 否定された症状（「吐き気はない」など）も、鑑別診断に重要なため省略せずに記載すること。
+- `departments` は、可能性のある診療科を広い範囲で抽出すること。"""
+
+def explanation_instruction(language: str) -> str:
+    if language not in JAPANESE_LANGUAGES:
+        return f"- `explanation`: ユーザーへの説明を{language}で記述（AIの理解を伝えるため）。"
+    return "- `explanation`: 空文字（\"\"）にしてください。"
+
+
+class PromptTemplate:
+    """system: 毎回同じ部分（system_instruction として送る）、render(): リクエストごとの部分"""
+    __slots__ = ("system", "_header")
+
+    def __init__(self, system: str, header: str):
+        self.system = system
+        self._header = header
+
+    def render(self, body: str) -> str:
+        return self._header + body
+
+
+@lru_cache(maxsize=64)
+def analysis_template(language: str) -> PromptTemplate:
+    system = f"""{SYSTEM_INSTRUCTION}
+
+以下の患者の訴えを分析し、以下のJSONフォーマットのみを出力してください。
+Markdown記号（###など）は含めないでください。純粋なJSON文字列のみを返してください。
+ユーザーの使用言語: {language}
+
+【出力JSONフォーマット】
+{ANALYSIS_JSON_FORMAT}
+
+{ANALYSIS_RULES}
+{explanation_instruction(language)}"""
+    return PromptTemplate(system, "対象テキスト:\n")
+
+
+@lru_cache(maxsize=64)
+def batch_template(language: str) -> PromptTemplate:
+    system = f"""{SYSTEM_INSTRUCTION}
+
+以下の複数の患者の訴えを、それぞれ独立に分析してください。
+出力はJSON配列のみとし、各要素は下記フォーマットに "id"（対象テキストのid）を加えたオブジェクトにしてください。
+Markdown記号（###など）は含めないでください。純粋なJSON文字列のみを返してください。
+ユーザーの使用言語: {language}
+
+【各要素のJSONフォーマット】
+{ANALYSIS_JSON_FORMAT}
+
+{ANALYSIS_RULES}
+{explanation_instruction(language)}"""
+    return PromptTemplate(system, "対象テキスト一覧:\n")
+
+
+def annotate(safe_text: str) -> str:
+    """患者テキストの後に、ローカルで抽出した用語の言い換えを付ける（抽出なしならそのまま）"""
+    hints = format_hints(extract(safe_text))
+    return f"{safe_text}\n{hints}" if hints else safe_text
+
+
+def build_analysis_prompt(safe_text: str, language: str) -> str:
+    """リクエストごとに送る部分（患者テキスト + 用語の言い換え）"""
+    return analysis_template(language).render(annotate(safe_text))
+
+
+def build_batch_prompt(items, language: str) -> str:
+    """items: [(id, マスク済みテキスト), ...]"""
+    return batch_template(language).render("\n".join(f"[id={item_id}]\n{annotate(text)}\n" for item_id, text in items))
+
+
+def fill_missing_prompt(prompt: str, partial: dict, missing) -> str:
+    """
+    解析結果の欠けた項目だけを再生成させるプロンプト（元のプロンプト + 作成済みの項目 + 欠けた項目の一覧）
+    system_instruction は元の解析と同じものを使う
+    """
+    return f"""{prompt}
+
+【作成済みの出力】
+{json.dumps(partial, ensure_ascii=False)}
+
+上記の出力は次の項目が欠けているか、途中で切れています: {", ".join(missing)}
+これらの項目だけを、元の出力JSONフォーマットと同じ入れ子構造のJSONで出力してください（作成済みの項目は出力しないこと）。"""
+
+
+def _describe_edit(edit) -> str:
+    if edit.op == "insert":
+        context = " ".join(edit.context.split())
+        where = f"「…{context}」の後" if context else "冒頭"
+        return f"- 追加（{where}）: 「{edit.after}」"
+    if edit.op == "delete":
+        return f"- 削除: 「{edit.before}」"
+    return f"- 変更: 「{edit.before}」→「{edit.after}」"
+
+
+def incremental_prompt(previous: dict, edits) -> str:
+    """
+    入力の一部だけを書き換えた再解析のプロンプト（前回の出力 + 変更箇所。対象テキスト全体は送らない）
+    system_instruction は通常の解析と同じものを使う（暗黙的キャッシュの接頭辞を共有する）
+    """
+    changes = "\n".join(_describe_edit(e) for e in edits)
+    return f"""【前回の出力】
+{json.dumps(previous, ensure_ascii=False)}
+
+患者は上記の出力のもとになった対象テキストを、次のように書き換えました（変更箇所のみ）:
+{changes}
+
+書き換え後の対象テキスト全体に対する出力になるよう、この変更で内容が変わる項目だけを、元の出力JSONフォーマットと同じ入れ子構造のJSONで出力してください。
+- 変わる項目は、その項目の全文を出力すること（追記部分だけにしない）。
+- 変わらない項目は出力しないこと。変わる項目がなければ {{}} を出力すること。"""
+
+
+# ==========================================
+# 入力トークンの上限調整
+# ==========================================
+
+_SPACES_RE = re.compile(r"[ \t　]+")
+_BLANK_LINES_RE = re.compile(r"\n\s*\n+")
+# 同じ記号・長音の連続（「！！！！」「いたーーーい」など）は1つにまとめる
+_REPEATED_MARK_RE = re.compile(r"([^\w\s]|[ー〜~])\1{2,}")
+TRUNCATION_MARK = "\n…（中略）…\n"
+
+
+def compress_text(text: str) -> str:
+    """意味を変えない範囲で空白・記号の繰り返し・重複した行を詰める"""
+    text = _SPACES_RE.sub(" ", text)
+    text = _BLANK_LINES_RE.sub("\n", text)
+    text = _REPEATED_MARK_RE.sub(r"\1", text)
+    # コピー&ペーストで繰り返された同一行は最初の1回だけ残す
+    lines, seen = [], set()
+    for line in text.split("\n"):
+        line = line.strip()
+        if line and line not in seen:
+            seen.add(line)
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def trim_to_budget(text: str, max_tokens: int):
+    """
+    見積もりトークン数が max_tokens を超える入力だけを調整する
+    1. compress_text で詰める  2. それでも超える場合は先頭7割・末尾3割を残して中略
+    戻り値: (テキスト, 方法 None / "compress" / "truncate")
+    """
+    if max_tokens <= 0 or estimate_tokens(text) <= max_tokens:
+        return text, None
+    text = compress_text(text)
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text, "compress"
+
+    compressed = text
+    keep = max(0, int(len(compressed) * (max_tokens - estimate_tokens(TRUNCATION_MARK)) / tokens))
+    while True:
+        head = keep * 7 // 10
+        text = compressed[:head] + TRUNCATION_MARK + compressed[len(compressed) - (keep - head):]
+        if keep == 0 or estimate_tokens(text) <= max_tokens:
+            return text, "truncate"
+        keep -= max(1, keep // 20)
@@ -0,0 +1,350 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+
+class RateLimited(Exception):
+    """
+    上限超過（→ 429 Too Many Requests）
+    reason: rate / concurrency / cost（1リクエストの cost がバースト容量を超えていて、待っても通らない。limit はその容量）
+    """
+
+    def __init__(self, reason: str, retry_after: float, limit: int = None):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+        self.limit = limit
+
+
+# --- TTLキャッシュ ---
+
+MISSING = object()  # キャッシュにない（None を値として保存できるよう区別する）
+
+
+class TTLCache:
+    """スレッドセーフな TTL + 件数上限つきの辞書（Webhookワーカーのスレッドからも無効化される）"""
+
+    def __init__(self, ttl: float, maxsize: int = 10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # key -> (期限, 値)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, MISSING)
+            if entry is MISSING:
+                return default
+            if entry[0] < time.monotonic():
+                del self._data[key]
+                return default
+            return entry[1]
+
+    def set(self, key, value, ttl: float = None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def discard_where(self, predicate) -> int:
+        """predicate(値) が真のエントリを削除し、件数を返す"""
+        with self._lock:
+            keys = [k for k, (_, v) in self._data.items() if predicate(v)]
+            for k in keys:
+                del self._data[k]
+            return len(keys)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SharedInvalidations:
+    """
+    ワーカー間で共有する ProfileCache の無効化の記録（ローカルSQLite）
+    prefork では profiles のキャッシュがワーカーごとにあるため、Webhook を処理したワーカー以外の
+    キャッシュからも捨てられるよう、無効化を (列, 値) として書き残し、各ワーカーが読んで反映する
+    読む側は PRAGMA data_version（他の接続が書き込むと変わる）を見て、変化があったときだけ問い合わせる
+    """
+
+    def __init__(self, path: str, retention: float = 300.0):
+        self.path = path
+        self.retention = retention  # これより古い記録は消す（キャッシュのTTL以上にする）
+        self._lock = threading.Lock()
+        self._connect()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS profile_invalidations ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT, column TEXT NOT NULL, value TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        # 起動前の記録は読まない（このプロセスのキャッシュはまだ空）
+        self._seen = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM profile_invalidations").fetchone()[0]
+        self._version = None
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._pid = os.getpid()
+
+    def _execute(self, sql: str, params=()):
+        if self._pid != os.getpid():
+            # fork 後の子プロセスでは親の接続を使わず開き直す（prefork.py）
+            self._connect()
+        return self._conn.execute(sql, params)
+
+    def publish(self, column: str, value):
+        now = time.time()
+        with self._lock:
+            self._execute("INSERT INTO profile_invalidations (column, value, created_at) VALUES (?, ?, ?)",
+                          (column, str(value), now))
+            self._execute("DELETE FROM profile_invalidations WHERE created_at < ?", (now - self.retention,))
+
+    def poll(self) -> list:
+        """前回から他のワーカーが書いた [(列, 値), ...]"""
+        with self._lock:
+            version = self._execute("PRAGMA data_version").fetchone()[0]
+            if version == self._version:
+                return []
+            self._version = version
+            rows = self._execute(
+                "SELECT seq, column, value FROM profile_invalidations WHERE seq > ? ORDER BY seq", (self._seen,)
+            ).fetchall()
+            if rows:
+                self._seen = rows[-1][0]
+        return [(column, value) for _, column, value in rows]
+
+
+# プランが有効とみなすサブスクリプション状態（past_due はStripeの再請求中なので維持する）
+ACTIVE_STATUSES = {"active", "trialing", "past_due"}
+
+
+class ProfileCache:
+    """
+    profiles 行のプロセス内キャッシュ
+    fetch(user_id) -> 行(dict) または None（Supabaseへの問い合わせ、コルーチン関数）
+    fetch_many(user_ids) -> [行, ...]（コルーチン関数。省略時は fetch を1件ずつ呼ぶ）
+    プラン変更時は invalidate / invalidate_where で即座に捨てる
+    shared を渡すと、他のワーカーで行われた無効化も読むたびに反映する（prefork）
+    """
+
+    def __init__(self, fetch, ttl: float = 300.0, maxsize: int = 10000, fetch_many=None,
+                 shared: SharedInvalidations = None):
+        self._fetch = fetch
+        self._fetch_many = fetch_many
+        self._cache = TTLCache(ttl, maxsize)
+        self._shared = shared
+        self.hits = 0
+        self.misses = 0
+
+    def _sync(self):
+        if self._shared is None:
+            return
+        try:
+            for column, value in self._shared.poll():
+                self._discard(column, value)
+        except sqlite3.Error as e:
+            print(f"Profile Invalidation Sync Error: {e}")
+
+    async def get(self, user_id: str):
+        self._sync()
+        row = self._cache.get(user_id, MISSING)
+        if row is not MISSING:
+            self.hits += 1
+            return row
+        self.misses += 1
+        row = await self._fetch(user_id)
+        self._cache.set(user_id, row)
+        return row
+
+    async def get_many(self, user_ids) -> dict:
+        """{user_id: 行 または None}。キャッシュにないものだけをまとめて問い合わせる"""
+        self._sync()
+        rows, missing = {}, []
+        for user_id in dict.fromkeys(user_ids):
+            row = self._cache.get(user_id, MISSING)
+            if row is MISSING:
+                missing.append(user_id)
+            else:
+                rows[user_id] = row
+        self.hits += len(rows)
+        if missing:
+            self.misses += len(missing)
+            if self._fetch_many is None:
+                fetched = {user_id: await self._fetch(user_id) for user_id in missing}
+            else:
+                fetched = dict.fromkeys(missing)
+                fetched.update((row["id"], row) for row in await self._fetch_many(missing))
+            for user_id, row in fetched.items():
+                self._cache.set(user_id, row)
+            rows.update(fetched)
+        return rows
+
+    def peek(self, user_id: str):
+        """キャッシュにある行だけを返す（問い合わせしない）。なければ MISSING"""
+        self._sync()
+        row = self._cache.get(user_id, MISSING)
+        if row is not MISSING:
+            self.hits += 1
+        return row
+
+    async def plan(self, user_id: str) -> str:
+        return effective_plan(await self.get(user_id))
+
+    def _discard(self, column: str, value) -> int:
+        if column == "id":
+            had = self._cache.get(value, MISSING) is not MISSING
+            self._cache.pop(value)
+            return int(had)
+        return self._cache.discard_where(lambda row: bool(row) and row.get(column) == value)
+
+    def _publish(self, column: str, value):
+        if self._shared is None:
+            return
+        try:
+            self._shared.publish(column, value)
+        except sqlite3.Error as e:
+            print(f"Profile Invalidation Publish Error: {e}")
+
+    def invalidate(self, user_id: str):
+        self._discard("id", user_id)
+        self._publish("id", user_id)
+
+    def invalidate_where(self, column: str, value) -> int:
+        self._publish(column, value)
+        return self._discard(column, value)
+
+    def __len__(self):
+        return len(self._cache)
+
+
+def effective_plan(row) -> str:
+    if not row:
+        return "free"
+    plan = row.get("plan_type") or "free"
+    if plan != "free" and row.get("subscription_status") not in ACTIVE_STATUSES:
+        return "free"
+    return plan
+
+
+# --- レート制限 ---
+
+class PlanLimits(NamedTuple):
+    per_minute: float     # 平均で1分あたりに許可する件数（トークンの補充速度）
+    burst: int            # 連続で送れる件数（バケツの容量）
+    concurrency: int      # 同時に処理できる件数
+
+
+def parse_plan_limits(spec: str, defaults: dict) -> dict:
+    """"free=10:10:2,pro_monthly=60:20:4" 形式（件/分:バースト:同時実行数）で defaults を上書きする"""
+    limits = dict(defaults)
+    for part in filter(None, (p.strip() for p in (spec or "").split(","))):
+        plan, values = part.split("=", 1)
+        per_minute, burst, concurrency = values.split(":")
+        limits[plan.strip()] = PlanLimits(float(per_minute), int(burst), int(concurrency))
+    return limits
+
+
+def per_worker_limits(limits: dict, workers: int) -> dict:
+    """
+    prefork でワーカーごとに持たせる上限（バケツはワーカーごとなので、全体で設定値程度になるよう割る）
+    - 件数/分・バーストはワーカー数で割る（バーストは切り上げ・最低1）
+    - 同時実行数も割って切り上げる（最低1。ワーカー数より小さい設定は、全体では最大でワーカー数まで通る）
+    接続はワーカーに均等に割り振られるとは限らないため、1人の利用者の上限は設定値より厳しくなることがある
+    """
+    if workers <= 1:
+        return dict(limits)
+    return {
+        plan: PlanLimits(l.per_minute / workers, max(1, math.ceil(l.burst / workers)),
+                         max(1, math.ceil(l.concurrency / workers)))
+        for plan, l in limits.items()
+    }
+
+
+class _Bucket:
+    __slots__ = ("plan", "tokens", "updated", "active")
+
+    def __init__(self, plan: str, tokens: float, now: float):
+        self.plan = plan
+        self.tokens = tokens
+        self.updated = now
+        self.active = 0
+
+
+class Lease:
+    """acquire() で確保した同時実行枠。処理が終わったら release() する（2回呼んでもよい）"""
+    __slots__ = ("_limiter", "_key", "_released")
+
+    def __init__(self, limiter, key):
+        self._limiter = limiter
+        self._key = key
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._limiter._release(self._key)
+
+
+class RateLimiter:
+    """
+    利用者ごとのトークンバケット + 同時実行数の上限（プランごとに設定）
+    すべてイベントループ上・ロックなしの辞書操作だけで判定する
+    """
+
+    def __init__(self, limits: dict, max_keys: int = 50000):
+        self.limits = limits
+        self.max_keys = max_keys
+        self._buckets = {}
+        self.rejected = {"rate": 0, "concurrency": 0}
+
+    def acquire(self, key: str, plan: str, cost: int = 1) -> Lease:
+        limits = self.limits.get(plan) or self.limits["free"]
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._prune(now)
+            bucket = self._buckets[key] = _Bucket(plan, limits.burst, now)
+        elif bucket.plan != plan:
+            # プランが変わったら新しいプランの満タンから始める
+            bucket.plan, bucket.tokens, bucket.updated = plan, limits.burst, now
+        else:
+            rate = limits.per_minute / 60
+            bucket.tokens = min(limits.burst, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+
+        if cost > limits.burst:
+            # バースト容量を超える cost を通すとバケツがマイナスになり、1回で何倍も使えてしまう
+            self.rejected["rate"] += 1
+            raise RateLimited("cost", 0.0, limits.burst)
+        if bucket.active >= limits.concurrency:
+            self.rejected["concurrency"] += 1
+            raise RateLimited("concurrency", 1.0)
+        needed = cost - bucket.tokens
+        if needed > 0:
+            self.rejected["rate"] += 1
+            raise RateLimited("rate", needed * 60 / limits.per_minute)
+        bucket.tokens -= cost
+        bucket.active += 1
+        return Lease(self, key)
+
+    def _release(self, key: str):
+        bucket = self._buckets.get(key)
+        if bucket is not None and bucket.active > 0:
+            bucket.active -= 1
+
+    def _prune(self, now: float):
+        """処理中でなく、しばらく使われていない利用者のバケツを捨てる"""
+        idle = [k for k, b in self._buckets.items() if not b.active and now - b.updated > 60]
+        for k in idle:
+            del self._buckets[k]
+
+    def stats(self) -> dict:
+        return {"keys": len(self._buckets), "rejected": dict(self.rejected)}
@@ -0,0 +1,257 @@
+import gzip
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from starlette.responses import JSONResponse, Response
+
+# 高速なJSONエンコーダ・brotli があれば使い、なければ標準ライブラリで代用する
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# ==========================================
+# レスポンスの直列化・圧縮
+# ==========================================
+# - JSON は orjson で直接 bytes にする（FastAPI 既定の jsonable_encoder → json.dumps を通さない）
+# - Accept-Encoding に応じて br / gzip を選ぶ（モバイル回線向け）
+# - キャッシュから返す結果は、直列化・圧縮済みの本文（EncodedBody）をそのまま書き出す
+
+MIN_COMPRESS_BYTES = 512
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # 11 は小さくなるが数十倍遅い。動的レスポンスには 4〜6 が釣り合う
+COMPRESSIBLE_TYPES = ("application/json", "application/pdf", "text/")
+AVAILABLE_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def choose_encoding(accept_encoding: str):
+    """Accept-Encoding から使うエンコーディングを選ぶ（br > gzip。q=0 は不可）。なければ None"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip()] = q
+    for encoding in AVAILABLE_ENCODINGS:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        # mtime=0 にすると同じ本文から常に同じバイト列になる（ETag・キャッシュと相性がよい）
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    return data
+
+
+def is_compressible(media_type: str) -> bool:
+    return bool(media_type) and media_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class EncodedBody:
+    """直列化済みの本文と、エンコーディングごとの圧縮済み版（初回に1回だけ圧縮して保持する）"""
+    __slots__ = ("raw", "media_type", "_variants")
+
+    def __init__(self, raw: bytes, media_type: str = "application/json"):
+        self.raw = raw
+        self.media_type = media_type
+        self._variants = {}
+
+    @classmethod
+    def json(cls, obj) -> "EncodedBody":
+        return cls(dumps(obj))
+
+    def variant(self, encoding) -> bytes:
+        if encoding is None:
+            return self.raw
+        data = self._variants.get(encoding)
+        if data is None:
+            data = self._variants[encoding] = compress(self.raw, encoding)
+        return data
+
+    def prepare(self) -> "EncodedBody":
+        """使いうる全エンコーディングで圧縮しておく（キャッシュに入れる前に呼ぶ）"""
+        if len(self.raw) >= MIN_COMPRESS_BYTES and is_compressible(self.media_type):
+            for encoding in AVAILABLE_ENCODINGS:
+                self.variant(encoding)
+        return self
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.raw) + sum(len(v) for v in self._variants.values())
+
+
+def encoding_etag(tag: str, encoding=None) -> str:
+    """エンコーディングごとの強いETag（"<tag>"・"<tag>-gzip"・"<tag>-br"。本文のバイト列ごとに別の値）"""
+    return f'"{tag}-{encoding}"' if encoding else f'"{tag}"'
+
+
+def encoded_response(request, body: EncodedBody, status_code: int = 200, headers: dict = None,
+                     etag: str = None) -> Response:
+    """
+    EncodedBody からレスポンスを作る。圧縮済みの版があればそのまま使う
+    etag: 内容のハッシュ。指定すると送る本文のエンコーディングに合わせた強いETagを付ける
+    """
+    headers = dict(headers or {})
+    content = body.raw
+    encoding = None
+    if len(content) >= MIN_COMPRESS_BYTES and is_compressible(body.media_type):
+        headers["Vary"] = "Accept-Encoding"
+        encoding = choose_encoding(request.headers.get("accept-encoding"))
+        if encoding is not None:
+            content = body.variant(encoding)
+            headers["Content-Encoding"] = encoding
+    if etag is not None:
+        headers["ETag"] = encoding_etag(etag, encoding)
+    return Response(content=content, status_code=status_code, headers=headers, media_type=body.media_type)
+
+
+def json_response(request, obj, status_code: int = 200, headers: dict = None) -> Response:
+    return encoded_response(request, EncodedBody.json(obj), status_code, headers)
+
+
+class FastJSONResponse(JSONResponse):
+    """FastAPI の default_response_class 用（dict を返すエンドポイントも orjson で書き出す）"""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+class EncodedBodyCache:
+    """EncodedBody の LRU（合計 max_bytes まで、圧縮済みの版も含めて数える）+ TTL"""
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, ttl: float = 3600.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (期限, EncodedBody)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] >= time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def set(self, key: str, body: EncodedBody) -> EncodedBody:
+        body.prepare()
+        size = body.nbytes
+        if size > self.max_bytes:
+            return body
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + self.ttl, body)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                self._remove(next(iter(self._data)))
+        return body
+
+    def _remove(self, key: str):
+        _, body = self._data.pop(key)
+        self.current_bytes -= body.nbytes
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._data),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+class CompressionMiddleware:
+    """
+    ASGIミドルウェア: 1回で送られる本文（通常のレスポンス）を Accept-Encoding に応じて圧縮する
+    - Content-Encoding 付き（encoded_response で圧縮済み）・小さい本文・圧縮しても無駄な形式はそのまま
+    - StreamingResponse（本文が複数回に分かれる）は遅延を増やさないよう圧縮しない
+    """
+
+    def __init__(self, app, minimum_size: int = MIN_COMPRESS_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+
+        async def send_wrapper(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                headers = {k.lower(): v for k, v in message.get("headers", [])}
+                media_type = headers.get(b"content-type", b"").decode("latin-1")
+                if b"content-encoding" in headers or not is_compressible(media_type):
+                    await send(message)
+                else:
+                    start = message  # 本文を見てから決める
+                return
+            if start is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            held, start = start, None
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                await send(held)
+                await send(message)
+                return
+            data = compress(body, encoding)
+            vary = b"Accept-Encoding"
+            headers = []
+            for k, v in held["headers"]:
+                if k.lower() == b"vary":
+                    vary = v + b", " + vary
+                elif k.lower() != b"content-length":
+                    headers.append((k, v))
+            headers += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(data)).encode()),
+                (b"vary", vary),
+            ]
+            await send({**held, "headers": headers})
+            await send({"type": "http.response.body", "body": data})
+
+        await self.app(scope, receive, send_wrapper)
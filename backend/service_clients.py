@@ -0,0 +1,144 @@
+import asyncio
+import os
+from typing import NamedTuple
+
+import httpx
+
+# ==========================================
+# 外部サービス（Stripe / Supabase）への HTTP 接続
+# ==========================================
+# 呼び出しごとに接続を張り直したり、同期クライアントでイベントループを止めたりしないよう、
+# サービスごとに1つの httpx.AsyncClient を共有する（接続プール・keep-alive・タイムアウト・同時実行数の上限）。
+# 同時実行数の上限はトランスポートで掛けるので、SDK（supabase-py）の内部から送られるリクエストにも効く。
+# クライアントは初回利用時に作る（prefork では fork 後の各ワーカーで作られ、ソケットを親と共有しない）。
+
+
+class ServiceLimits(NamedTuple):
+    timeout: float            # 1リクエストの読み書きのタイムアウト（秒）
+    connect_timeout: float    # 接続確立のタイムアウト（秒）
+    max_connections: int      # プールの最大接続数
+    max_keepalive: int        # 使い終わっても保持しておく接続数
+    keepalive_expiry: float   # 保持した接続を閉じるまでの秒数
+    max_concurrency: int      # 同時に送るリクエスト数（超えた分はプールの前で待つ）
+
+    @classmethod
+    def from_env(cls, prefix: str, default: "ServiceLimits") -> "ServiceLimits":
+        """例: SUPABASE_HTTP_TIMEOUT=5 SUPABASE_HTTP_MAX_CONCURRENCY=32（未設定の項目は default）"""
+        values = {}
+        for field, value in default._asdict().items():
+            raw = os.getenv(f"{prefix}_{field.upper()}")
+            values[field] = type(value)(raw) if raw else value
+        return cls(**values)
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """本文を読み終えて閉じたときに同時実行数の枠を返す"""
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+class _LimitedTransport(httpx.AsyncBaseTransport):
+    """同時実行数の上限と件数の集計を行うトランスポート"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, max_concurrency: int):
+        self._transport = transport
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.requests = 0
+        self.errors = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        self.requests += 1
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.in_flight -= 1
+                self._semaphore.release()
+
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            self.errors += 1
+            release()
+            raise
+        if response.status_code >= 500:
+            self.errors += 1
+        response.stream = _ReleasingStream(response.stream, release)
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class ServiceClient:
+    """
+    1つの外部サービス向けの共有 httpx.AsyncClient
+
+        supabase_http = ServiceClient("supabase", ServiceLimits.from_env("SUPABASE_HTTP", defaults))
+        response = await supabase_http.client.get(url)
+    """
+
+    def __init__(self, name: str, limits: ServiceLimits, base_url: str = "", transport=None):
+        self.name = name
+        self.limits = limits
+        self.base_url = base_url
+        self._transport = transport  # テスト・ベンチマーク用（省略時は通常の TCP 接続）
+        self._client = None
+        self._limited = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            limits = httpx.Limits(
+                max_connections=self.limits.max_connections,
+                max_keepalive_connections=self.limits.max_keepalive,
+                keepalive_expiry=self.limits.keepalive_expiry,
+            )
+            transport = self._transport or httpx.AsyncHTTPTransport(limits=limits, retries=1)
+            self._limited = _LimitedTransport(transport, self.limits.max_concurrency)
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.limits.timeout, connect=self.limits.connect_timeout),
+                limits=limits,
+                transport=self._limited,
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            client, self._client = self._client, None
+            await client.aclose()
+
+    def stats(self) -> dict:
+        limited = self._limited
+        pool = getattr(self._transport or (limited and limited._transport), "_pool", None)
+        return {
+            "open": self._client is not None,
+            "in_flight": limited.in_flight if limited else 0,
+            "waiting": limited.waiting if limited else 0,
+            "requests": limited.requests if limited else 0,
+            "errors": limited.errors if limited else 0,
+            "connections": len(pool.connections) if pool is not None else 0,
+        }
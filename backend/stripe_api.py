@@ -0,0 +1,52 @@
+import os
+
+# ==========================================
+# Stripe API（非同期・共有の接続プール経由）
+# ==========================================
+# stripe-python の同期呼び出しは非同期ハンドラの中でイベントループを止め、接続もSDKが別に持つため、
+# バックエンドから送る API 呼び出し（Checkout セッションの作成）は stripe.StripeClient の非同期メソッドを
+# service_clients の共有クライアントの上で使う。APIバージョンの固定・Idempotency-Key（POSTごとに自動）・
+# 429/409/5xx と通信エラーの再試行（指数バックオフ、Stripe-Should-Retry に従う）は SDK に任せる。
+# Webhook の署名検証はローカル処理なので、引き続き stripe-python の stripe.Webhook を使う。
+
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE", "https://api.stripe.com")
+# アカウントの既定バージョンではなく、このコードが前提とするバージョンで呼ぶ
+STRIPE_API_VERSION = os.getenv("STRIPE_API_VERSION", "2026-09-30.endive")
+STRIPE_MAX_NETWORK_RETRIES = int(os.getenv("STRIPE_MAX_NETWORK_RETRIES", "2"))
+
+class StripeApiError(Exception):
+    """Stripe がエラーを返した（message は Stripe のエラーメッセージ）"""
+
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+
+class StripeApi:
+    """
+    service_clients.ServiceClient の接続プールで stripe.StripeClient を使う
+    stripe-python は初回の呼び出し時に読み込む（起動を軽くするため）
+    """
+
+    def __init__(self, http, api_key: str, max_network_retries: int = STRIPE_MAX_NETWORK_RETRIES):
+        self.http = http
+        self.api_key = api_key
+        self.max_network_retries = max_network_retries
+        self._client = None
+
+    def _stripe_client(self):
+        if self._client is None:
+            import stripe
+            from stripe_http import PooledHTTPClient
+            self._client = stripe.StripeClient(
+                self.api_key or "", stripe_version=STRIPE_API_VERSION, base_addresses={"api": STRIPE_API_BASE},
+                max_network_retries=self.max_network_retries, http_client=PooledHTTPClient(self.http),
+            )
+        return self._client
+
+    async def create_checkout_session(self, **params) -> dict:
+        import stripe
+        client = self._stripe_client()
+        try:
+            return await client.v1.checkout.sessions.create_async(params)
+        except stripe.StripeError as e:
+            raise StripeApiError(e.user_message or str(e), e.http_status) from e
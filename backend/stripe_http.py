@@ -0,0 +1,59 @@
+import asyncio
+
+import stripe
+
+# ==========================================
+# stripe-python の HTTP クライアント（共有の接続プールで送る）
+# ==========================================
+# stripe.HTTPXClient はコンストラクタで自前の httpx.AsyncClient を作るため、公開の拡張点である
+# stripe.HTTPClient を継承し、service_clients の共有クライアントで送る（SDK の内部属性には触れない）。
+# 再試行・Idempotency-Key・APIバージョンの付与は HTTPClient / StripeClient 側の処理のまま。
+# stripe-python と同じく、Stripe の API を初めて呼ぶときに import される（stripe_api.py）。
+
+
+class PooledHTTPClient(stripe.HTTPClient):
+    """service_clients.ServiceClient の httpx.AsyncClient で送る（非同期のみ。接続の後始末は ServiceClient が行う）"""
+
+    name = "service_clients"
+
+    def __init__(self, http, **kwargs):
+        super().__init__(**kwargs)
+        self.http = http
+
+    def _connection_error(self, e: Exception):
+        # HTTPXClient と同じく、通信エラーは再試行してよい APIConnectionError にする
+        return stripe.APIConnectionError(
+            f"Unexpected error communicating with Stripe. (Network error: A {type(e).__name__} was raised)",
+            should_retry=True,
+        )
+
+    async def request_async(self, method: str, url: str, headers, post_data=None):
+        try:
+            response = await self.http.client.request(method, url, headers=headers, content=post_data)
+        except Exception as e:
+            raise self._connection_error(e) from e
+        return response.content, response.status_code, response.headers
+
+    async def request_stream_async(self, method: str, url: str, headers, post_data=None):
+        client = self.http.client
+        try:
+            response = await client.send(client.build_request(method, url, headers=headers, content=post_data),
+                                         stream=True)
+        except Exception as e:
+            raise self._connection_error(e) from e
+        return response.aiter_bytes(), response.status_code, response.headers
+
+    def sleep_async(self, secs: float):
+        return asyncio.sleep(secs)
+
+    def request(self, method, url, headers, post_data=None, **kwargs):
+        raise RuntimeError("PooledHTTPClient only supports async requests (use the *_async methods).")
+
+    def request_stream(self, method, url, headers, post_data=None, **kwargs):
+        raise RuntimeError("PooledHTTPClient only supports async requests (use the *_async methods).")
+
+    def close(self):
+        pass
+
+    async def close_async(self):
+        pass
@@ -0,0 +1,238 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+
+SUMMARY_COLUMNS = ("id", "user_id", "created_at", "content", "departments", "is_private")
+
+
+def department_pattern(department: str) -> str:
+    """departments は JSON配列の文字列で保存されるため、"診療科" を含むかで絞り込む"""
+    return '%' + json.dumps(department, ensure_ascii=False) + '%'
+
+
+def history_cursor(row: dict) -> str:
+    """履歴一覧の次ページのカーソル（最後の行の created_at と id。同じ時刻の行も id で順序が決まる）"""
+    return f"{row['created_at']}|{row['id']}"
+
+
+def parse_history_cursor(cursor: str):
+    """
+    history_cursor の逆。(created_at, id) を返す
+    以前の形式（created_at だけ）のカーソルは (created_at, None)
+    クライアントから来た値なので、ISO 8601 の日時と UUID でなければ ValueError（PostgREST のフィルタに埋め込むため）
+    """
+    if not cursor:
+        return None
+    created_at, _, summary_id = cursor.rpartition("|")
+    if not created_at:
+        created_at, summary_id = cursor, None
+    datetime.fromisoformat(created_at)
+    if summary_id is not None:
+        summary_id = str(uuid.UUID(summary_id))
+    return created_at, summary_id
+
+
+def parse_json_field(value, default=None):
+    """content / departments は JSON文字列で保存されている場合と、jsonb の場合がある"""
+    if value is None:
+        return default
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return default if default is not None else value
+    return value
+
+
+class SupabaseSummaryStore:
+    """Supabase の summaries テーブル（supabase.AsyncClient。接続は service_clients の共有プール）"""
+
+    def __init__(self, client):
+        self.client = client
+
+    async def get(self, summary_id: str):
+        rows = (await (
+            self.client.table("summaries")
+            .select(",".join(SUMMARY_COLUMNS))
+            .eq("id", summary_id)
+            .limit(1)
+            .execute()
+        )).data
+        return rows[0] if rows else None
+
+    async def get_many(self, summary_ids) -> list:
+        """ids に該当する行（順不同。呼び出し側で URL が長くなりすぎない件数に分けること）"""
+        if not summary_ids:
+            return []
+        return (await (
+            self.client.table("summaries")
+            .select(",".join(SUMMARY_COLUMNS))
+            .in_("id", list(summary_ids))
+            .execute()
+        )).data
+
+    async def list_page(self, user_id: str, after=None, limit: int = 50) -> list:
+        """
+        user_id のサマリーを (created_at, id) の昇順で limit 件
+        after: 前のページの最後の (created_at, id)。OFFSET を使わないので何ページ目でも同じ速さ
+        """
+        query = (
+            self.client.table("summaries")
+            .select(",".join(SUMMARY_COLUMNS))
+            .eq("user_id", user_id)
+        )
+        if after is not None:
+            created_at, summary_id = after
+            query = query.or_(
+                f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt."{summary_id}")'
+            )
+        return (await query.order("created_at").order("id").limit(limit).execute()).data
+
+    async def list_history(self, owner_ids, viewer_id: str, before=None, limit: int = 20,
+                     department: str = None) -> list:
+        """
+        履歴一覧（(created_at, id) の降順）。owner_ids のサマリーのうち、公開のものと viewer_id 本人のもの
+        before: 前のページの最後の (created_at, id)（キーセット方式。OFFSET を使わない）。id が None なら created_at だけで比べる
+        """
+        query = (
+            self.client.table("summaries")
+            .select(",".join(SUMMARY_COLUMNS))
+            .in_("user_id", list(owner_ids))
+        )
+        visible = f"is_private.eq.false,user_id.eq.{viewer_id}"
+        if before is not None and before[1] is not None:
+            created_at, summary_id = before
+            # 公開範囲の条件と1つの or= にまとめる（同じ時刻の行は id で続きから）
+            query = query.or_(
+                f'and(or({visible}),or(created_at.lt."{created_at}",'
+                f'and(created_at.eq."{created_at}",id.lt."{summary_id}")))'
+            )
+        else:
+            query = query.or_(visible)
+            if before is not None:
+                query = query.lt("created_at", before[0])
+        if department:
+            query = query.ilike("departments", department_pattern(department))
+        return (await query.order("created_at", desc=True).order("id", desc=True).limit(limit).execute()).data
+
+
+class SQLiteSummaryStore:
+    """
+    summaries テーブルのローカル代替（テスト・ベンチマーク・オフライン開発用）
+    Supabase と同じカラム構成の行(dict)を返す。読み出しは SupabaseSummaryStore と同じく非同期（スレッドで実行）
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            " id TEXT PRIMARY KEY, user_id TEXT, created_at TEXT NOT NULL,"
+            " content TEXT, departments TEXT, is_private INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_summaries_created ON summaries(created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_summaries_user ON summaries(user_id, created_at, id)")
+
+    def insert(self, row: dict):
+        content = row.get("content")
+        departments = row.get("departments")
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (id, user_id, created_at, content, departments, is_private)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    row["id"], row.get("user_id"), row["created_at"],
+                    content if isinstance(content, str) else json.dumps(content, ensure_ascii=False),
+                    departments if isinstance(departments, str) else json.dumps(departments or [], ensure_ascii=False),
+                    int(bool(row.get("is_private"))),
+                ),
+            )
+
+    def _row(self, r) -> dict:
+        row = dict(r)
+        row["is_private"] = bool(row["is_private"])
+        return row
+
+    def _get(self, summary_id: str):
+        with self._lock:
+            r = self._conn.execute(
+                f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM summaries WHERE id = ?", (summary_id,)
+            ).fetchone()
+        return self._row(r) if r else None
+
+    def _get_many(self, summary_ids) -> list:
+        summary_ids = list(summary_ids)
+        if not summary_ids:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM summaries"
+                f" WHERE id IN ({', '.join('?' * len(summary_ids))})", summary_ids
+            ).fetchall()
+        return [self._row(r) for r in rows]
+
+    def _list_page(self, user_id: str, after=None, limit: int = 50) -> list:
+        sql = f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM summaries WHERE user_id = ?"
+        params = [user_id]
+        if after is not None:
+            sql += " AND (created_at, id) > (?, ?)"
+            params.extend(after)
+        sql += " ORDER BY created_at, id LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._row(r) for r in rows]
+
+    def _list_history(self, owner_ids, viewer_id: str, before=None, limit: int = 20,
+                     department: str = None) -> list:
+        owner_ids = list(owner_ids)
+        sql = (f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM summaries"
+               f" WHERE user_id IN ({', '.join('?' * len(owner_ids))}) AND (is_private = 0 OR user_id = ?)")
+        params = owner_ids + [viewer_id]
+        if before is not None and before[1] is not None:
+            sql += " AND (created_at, id) < (?, ?)"
+            params.extend(before)
+        elif before is not None:
+            sql += " AND created_at < ?"
+            params.append(before[0])
+        if department:
+            sql += " AND departments LIKE ?"
+            params.append(department_pattern(department))
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._row(r) for r in rows]
+
+
+    async def get(self, summary_id: str):
+        return await asyncio.to_thread(self._get, summary_id)
+
+    async def get_many(self, summary_ids) -> list:
+        return await asyncio.to_thread(self._get_many, summary_ids)
+
+    async def list_page(self, user_id: str, after=None, limit: int = 50) -> list:
+        return await asyncio.to_thread(self._list_page, user_id, after, limit)
+
+    async def list_history(self, owner_ids, viewer_id: str, before=None, limit: int = 20,
+                           department: str = None) -> list:
+        return await asyncio.to_thread(self._list_history, owner_ids, viewer_id, before, limit, department)
+
+
+def create_summary_store(supabase_client=None):
+    """
+    SUMMARY_STORE_PATH が設定されていればローカルSQLite、なければSupabaseを使う
+    どちらも使えない場合は None
+    """
+    path = os.getenv("SUMMARY_STORE_PATH")
+    if path:
+        return SQLiteSummaryStore(path)
+    if supabase_client is not None:
+        return SupabaseSummaryStore(supabase_client)
+    return None
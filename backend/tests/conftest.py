@@ -0,0 +1,35 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# backend/ のモジュールはフラットに import する（from model_router import ... など）
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "benchmarks"))
+
+# main を import するテスト用（起動時のウォームアップ・レート制限なし、Webhookキューは一時ファイル）
+os.environ.setdefault("WARMUP_IN_BACKGROUND", "0")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+os.environ.setdefault("WEBHOOK_DB_PATH", os.path.join(
+    tempfile.mkdtemp(prefix="webhook-test-"), "webhook_jobs.sqlite3"))
+
+
+@pytest.fixture
+def fake_gemini(monkeypatch):
+    """
+    main の Gemini をローカルの代替（benchmarks/fakes.py）に差し替え、解析結果のキャッシュを空にする
+    応答時間は fake_gemini.latency = LatencyProfile(ミリ秒) で変えられる
+    """
+    import main
+    from analysis_cache import AnalysisCache, MemoryLRUCache
+    from fakes import FakeGenerativeModel, LatencyProfile
+    from responses import EncodedBodyCache
+
+    model = FakeGenerativeModel(LatencyProfile())
+    main.gemini_model.set(model)
+    monkeypatch.setattr(main, "analysis_cache", AnalysisCache(MemoryLRUCache()))
+    monkeypatch.setattr(main, "encoded_bodies", EncodedBodyCache())
+    yield model
+    main.gemini_model.set(None)
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from analysis_cache import AnalysisCache, MemoryLRUCache, SQLiteCache
+
+
+def test_peek_does_not_count_lookups():
+    cache = AnalysisCache(MemoryLRUCache())
+    assert cache.peek("k") is None
+    cache.set("k", {"summary": {}})
+    assert cache.peek("k") == {"summary": {}}
+    assert (cache.stats.hits, cache.stats.misses) == (0, 0)
+
+
+def test_reanalysis_falling_back_to_full_counts_one_miss(monkeypatch):
+    import main
+    cache = AnalysisCache(MemoryLRUCache())
+    monkeypatch.setattr(main, "analysis_cache", cache)
+    safe_text = main.mask_input("昨日の夜からお腹が痛い。朝起きたら熱が38度あった。")
+    cache_key = main.make_cache_key(safe_text, "Japanese", main.PROMPT_VERSION, main.MODEL_NAME)
+    # 前回の結果がないので差分更新はできず、通常の解析になる
+    previous = main.PreviousAnalysis(text="昨日の夜からお腹が痛い。")
+
+    async def run():
+        assert await main.analyze_incremental(safe_text, "Japanese", previous, cache_key) is None
+
+        async def compute():
+            return {"summary": {}}
+        await cache.get_or_compute(cache_key, compute)
+
+    asyncio.run(run())
+    # 前回の入力の結果を探した1回 + この入力の1回（存在確認の分は数えない）
+    assert (cache.stats.hits, cache.stats.misses) == (0, 2)
+
+
+def test_concurrent_requests_for_one_key_share_one_computation():
+    cache = AnalysisCache(MemoryLRUCache())
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"summary": {"history": "発熱"}}
+
+    async def run():
+        return await asyncio.gather(*[cache.get_or_compute("k", compute) for _ in range(5)])
+
+    assert asyncio.run(run()) == [{"summary": {"history": "発熱"}}] * 5
+    assert len(calls) == 1
+    assert (cache.stats.misses, cache.stats.coalesced) == (5, 4)
+    # 以後はキャッシュから返す
+    assert asyncio.run(cache.get_or_compute("k", compute)) == {"summary": {"history": "発熱"}}
+    assert (len(calls), cache.stats.hits) == (1, 1)
+
+
+def test_failed_and_incomplete_results_are_not_cached():
+    cache = AnalysisCache(MemoryLRUCache())
+
+    async def broken():
+        raise RuntimeError("upstream down")
+
+    async def incomplete():
+        return {"incomplete": ["summary.history"]}
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.get_or_compute("k", broken))
+    asyncio.run(cache.get_or_compute("k", incomplete, cacheable=lambda r: not r.get("incomplete")))
+    assert cache.peek("k") is None
+
+
+def test_sqlite_backend_is_shared_between_instances_and_expires(tmp_path):
+    path = str(tmp_path / "analysis_cache.sqlite3")
+    writer = SQLiteCache(path, ttl=60)
+    writer.set("k", {"summary": {"history": "発熱"}})
+    # 同じファイルを開いた別のキャッシュ（別ワーカー）から読める
+    assert SQLiteCache(path).get("k") == {"summary": {"history": "発熱"}}
+
+    expired = SQLiteCache(path, ttl=-1)
+    expired.set("old", {"summary": {}})
+    assert expired.get("old") is None
+    assert expired.stats.evictions >= 1
+
+
+def test_analyze_hits_the_cache_for_the_same_masked_input(fake_gemini):
+    from fastapi.testclient import TestClient
+
+    import main
+    client = TestClient(main.app)
+    first = client.post("/analyze", json={"text": "昨日から熱がある。連絡先は090-1234-5678"})
+    # 電話番号だけ違う入力はマスク後に同じになるので、Gemini を呼ばずに同じ結果を返す
+    second = client.post("/analyze", json={"text": "昨日から熱がある。連絡先は080-9876-5432"})
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+    assert fake_gemini.calls == 1
@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+from analysis_result import AnalysisParseError, normalize_analysis, repair_json
+
+COMPLETE = {
+    "summary": {"chief_complaint": "発熱", "history": "3日前から", "symptoms": "咳", "background": "喘息"},
+    "departments": ["内科"],
+    "explanation": "",
+}
+
+
+def test_valid_json_needs_no_repair():
+    repaired = repair_json(json.dumps(COMPLETE, ensure_ascii=False))
+    assert repaired.value == COMPLETE
+    assert repaired.repairs == [] and repaired.cut_paths == set()
+
+
+def test_fenced_json_with_surrounding_text():
+    text = "以下が結果です。\n```json\n" + json.dumps(COMPLETE, ensure_ascii=False) + "\n```\nご確認ください。"
+    repaired = repair_json(text)
+    assert repaired.value == COMPLETE
+    assert repaired.repairs == ["fence"]   # 囲みの外の文は囲みと一緒に外れる
+
+
+def test_trailing_text_and_trailing_comma():
+    text = '{"departments": ["内科", "呼吸器内科",], "explanation": "",} 以上です。'
+    repaired = repair_json(text)
+    assert repaired.value == {"departments": ["内科", "呼吸器内科"], "explanation": ""}
+    assert repaired.repairs == ["trailing_comma", "trailing_text"]
+
+
+def test_truncated_string_is_closed_and_marked_cut():
+    text = '{"summary": {"chief_complaint": "発熱", "history": "3日前の夜から悪寒を伴'
+    repaired = repair_json(text)
+    assert "truncated" in repaired.repairs
+    assert repaired.cut_paths == {"summary.history"}
+    assert repaired.value["summary"]["chief_complaint"] == "発熱"
+
+    result, missing, _ = normalize_analysis(repaired, "Japanese")
+    # 切れた文字列は信用せず再生成の対象にする（後ろの項目もまだ出ていない）
+    assert "summary.history" in missing
+    assert result["summary"]["chief_complaint"] == "発熱"
+    assert "history" not in result["summary"]
+
+
+def test_truncated_inside_escape_sequence():
+    repaired = repair_json('{"explanation": "line1\\')
+    assert repaired.value == {"explanation": "line1"}
+    assert repaired.cut_paths == {"explanation"}
+
+
+def test_no_json_raises():
+    with pytest.raises(AnalysisParseError):
+        repair_json("申し訳ありませんが、お答えできません。")
+
+
+def test_empty_summary_field_is_not_missing():
+    value = json.loads(json.dumps(COMPLETE))
+    value["summary"]["background"] = ""
+    result, missing, _ = normalize_analysis(repair_json(json.dumps(value)), "Japanese")
+    assert missing == []
+    assert result["summary"]["background"] == ""
+
+
+def test_absent_summary_field_is_missing():
+    value = json.loads(json.dumps(COMPLETE))
+    del value["summary"]["background"]
+    _, missing, _ = normalize_analysis(repair_json(json.dumps(value)), "Japanese")
+    assert missing == ["summary.background"]
@@ -0,0 +1,57 @@
+import pytest
+
+from clinical_hints import emphasize, emphasize_text, extract, format_hints, normalize_width
+from prompts import annotate
+
+NOTE = "3日前から右下腹部が痛い。熱は38.5度。嘔吐は2回。血圧は130/85。SpO2は97%。熱がある。"
+
+
+def kinds(text):
+    return [(h.kind, h.text) for h in extract(text)]
+
+
+def test_extracts_vitals_durations_counts_and_sites_in_order():
+    assert kinds(NOTE) == [
+        ("duration", "3日前"),
+        ("site", "右下腹部"),
+        ("vital", "38.5度"),
+        ("count", "2回"),
+        ("vital", "血圧は130/85"),
+        ("vital", "SpO2は97%"),
+        ("term", "熱がある"),
+    ]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("昨日の夜から咳", [("duration", "昨日の夜")]),
+    ("2週間続いている", [("duration", "2週間")]),
+    ("脈拍は110", [("vital", "脈拍は110")]),
+    ("左の膝が腫れた", [("site", "左の膝")]),
+    # 左右のない「腹部」「胸」は用語の一部とみなして抽出しない。35度未満は体温にしない
+    ("腹部の張り", []),
+    ("部屋は20度", []),
+])
+def test_extraction_cases(text, expected):
+    assert kinds(text) == expected
+
+
+def test_full_width_digits_are_normalized_before_extraction():
+    text = normalize_width("３日前から熱は３８．５度")
+    assert text == "3日前から熱は38.5度"
+    assert kinds(text) == [("duration", "3日前"), ("vital", "38.5度")]
+
+
+def test_lay_terms_become_prompt_hints():
+    hints = extract("お腹が痛いし、吐き気もある。熱がある。")
+    assert format_hints(hints) == "【用語】お腹が痛い→腹痛、吐き気→嘔気、熱がある→発熱"
+    assert annotate("お腹が痛い").endswith("\n【用語】お腹が痛い→腹痛")
+    # 用語がなければプロンプトに何も足さない
+    assert annotate("3日前から38度") == "3日前から38度"
+
+
+def test_emphasize_bolds_values_once_and_leaves_terms_alone():
+    text = emphasize_text("3日前から38.5度の熱がある")
+    assert text == "**3日前**から**38.5度**の熱がある"
+    assert emphasize_text(text) == text
+    result = emphasize({"summary": {"history": "右下腹部に痛み", "background": ""}, "departments": ["内科"]})
+    assert result["summary"] == {"history": "**右下腹部**に痛み", "background": ""}
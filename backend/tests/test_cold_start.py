@@ -0,0 +1,21 @@
+import os
+import socket
+
+from cold_start import COLD_START_BUDGET, HEAVY_MODULES, heavy_modules_after_import, time_to_first_ready
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_import_main_does_not_load_heavy_sdks():
+    assert heavy_modules_after_import() == []
+    assert "reportlab" in HEAVY_MODULES
+
+
+def test_time_to_first_ready_within_budget():
+    # 本番と同じ設定（ウォームアップはバックグラウンド）で uvicorn を別プロセスで起動する
+    env = dict(os.environ, WARMUP_IN_BACKGROUND="1")
+    assert time_to_first_ready(free_port(), env=env) <= COLD_START_BUDGET
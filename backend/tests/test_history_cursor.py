@@ -0,0 +1,95 @@
+import asyncio
+import uuid
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from summary_store import SQLiteSummaryStore, SupabaseSummaryStore, history_cursor, parse_history_cursor
+
+SAME_TIME = "2026-01-01T09:00:00+00:00"
+IDS = [str(uuid.UUID(int=i)) for i in range(8)]
+
+
+def history_pages(store, limit: int, before=None) -> list:
+    """/api/history と同じく、1件多く取って next_cursor で最後までたどる"""
+    ids = []
+    while True:
+        rows = asyncio.run(store.list_history(["u1"], "u1", parse_history_cursor(before), limit + 1))
+        ids += [r["id"] for r in rows[:limit]]
+        if len(rows) <= limit:
+            return ids
+        before = history_cursor(rows[limit - 1])
+
+
+def test_rows_with_the_same_created_at_are_not_skipped():
+    store = SQLiteSummaryStore(":memory:")
+    for i in range(7):
+        store.insert({"id": IDS[i], "user_id": "u1", "created_at": SAME_TIME, "content": {}})
+    store.insert({"id": IDS[7], "user_id": "u1", "created_at": "2025-12-31T09:00:00+00:00", "content": {}})
+
+    assert history_pages(store, limit=3) == IDS[6::-1] + [IDS[7]]
+
+
+def test_legacy_created_at_cursor_still_works():
+    store = SQLiteSummaryStore(":memory:")
+    store.insert({"id": IDS[0], "user_id": "u1", "created_at": SAME_TIME, "content": {}})
+    store.insert({"id": IDS[1], "user_id": "u1", "created_at": "2025-12-31T09:00:00+00:00", "content": {}})
+
+    assert parse_history_cursor(SAME_TIME) == (SAME_TIME, None)
+    assert history_pages(store, limit=5, before=SAME_TIME) == [IDS[1]]
+
+
+@pytest.mark.parametrize("cursor", [
+    f'{SAME_TIME}|{IDS[5]}")),is_private.eq.true,or(id.eq."x',   # 引用符・括弧で or= の式を書き換える
+    f'{SAME_TIME}|not-a-uuid',
+    f'2026-01-01"),or(user_id.eq.u2|{IDS[5]}',
+    'yesterday',
+])
+def test_crafted_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        parse_history_cursor(cursor)
+
+
+def test_history_endpoint_rejects_invalid_cursor(monkeypatch):
+    import main
+
+    async def resolve_plan(authorization):
+        return "u1", "free"
+
+    monkeypatch.setattr(main, "resolve_plan", resolve_plan)
+    main.summary_store.set(SQLiteSummaryStore(":memory:"))
+    try:
+        client = TestClient(main.app)
+        r = client.get("/api/history", params={"scope": "me", "before": f'{SAME_TIME}|x")'},
+                       headers={"Authorization": "Bearer t"})
+        assert r.status_code == 400
+        r = client.get("/api/history", params={"scope": "me", "before": f"{SAME_TIME}|{IDS[5]}"},
+                       headers={"Authorization": "Bearer t"})
+        assert r.status_code == 200
+    finally:
+        main.summary_store.set(None)
+
+
+@pytest.mark.parametrize("before, expected", [
+    (None, "or=(is_private.eq.false,user_id.eq.u1)"),
+    ((SAME_TIME, IDS[5]), 'or=(and(or(is_private.eq.false,user_id.eq.u1),or(created_at.lt."%s",'
+                          'and(created_at.eq."%s",id.lt."%s"))))' % (SAME_TIME, SAME_TIME, IDS[5])),
+])
+def test_supabase_history_query_uses_compound_cursor(before, expected):
+    postgrest = pytest.importorskip("postgrest")
+    seen = []
+
+    def handler(request):
+        seen.append(request.url)
+        return httpx.Response(200, json=[])
+
+    async def run():
+        async with httpx.AsyncClient(base_url="http://db/rest/v1", transport=httpx.MockTransport(handler)) as http:
+            client = postgrest.AsyncPostgrestClient("http://db/rest/v1", http_client=http)
+            await SupabaseSummaryStore(client).list_history(["u1"], "u1", before, 4)
+
+    asyncio.run(run())
+    query = httpx.QueryParams(seen[0].query)
+    assert [f"or={v}" for v in query.get_list("or")] == [expected]
+    assert query["order"] == "created_at.desc,id.desc"
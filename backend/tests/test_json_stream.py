@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from json_stream import IncrementalFieldParser
+
+RESULT = {
+    "summary": {
+        "chief_complaint": "発熱",
+        "history": "3日前から \"悪寒\" あり\n夜に悪化",
+        "symptoms": "咳\\痰",
+        "background": "喘息",
+    },
+    "departments": ["内科", "呼吸器内科"],
+    "explanation": "",
+}
+
+
+def feed_all(parser, chunks) -> list:
+    return [event for chunk in chunks for event in parser.feed(chunk)]
+
+
+def test_fields_are_emitted_in_order_and_result_is_complete():
+    parser = IncrementalFieldParser()
+    events = feed_all(parser, ["```json\n", json.dumps(RESULT, ensure_ascii=False), "\n```"])
+    assert events == [
+        (("summary", "chief_complaint"), "発熱"),
+        (("summary", "history"), RESULT["summary"]["history"]),
+        (("summary", "symptoms"), "咳\\痰"),
+        (("summary", "background"), "喘息"),
+        (("departments",), ["内科", "呼吸器内科"]),
+    ]
+    assert parser.complete
+    assert parser.result() == RESULT
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7])
+def test_fields_split_across_chunks(size):
+    text = json.dumps(RESULT, ensure_ascii=False)
+    parser = IncrementalFieldParser()
+    events = feed_all(parser, [text[i:i + size] for i in range(0, len(text), size)])
+    assert dict(events) == {
+        ("summary", "chief_complaint"): "発熱",
+        ("summary", "history"): RESULT["summary"]["history"],
+        ("summary", "symptoms"): "咳\\痰",
+        ("summary", "background"): "喘息",
+        ("departments",): ["内科", "呼吸器内科"],
+    }
+    assert parser.result() == RESULT
+
+
+def test_value_is_emitted_only_once_it_closes():
+    parser = IncrementalFieldParser()
+    assert parser.feed('{"summary": {"chief_complaint": "発') == []
+    assert parser.feed('熱", "hist') == [(("summary", "chief_complaint"), "発熱")]
+    assert parser.feed('ory": "3日') == []
+    assert parser.feed('前"') == [(("summary", "history"), "3日前")]
+
+
+@pytest.mark.parametrize("before, after", [
+    ('{"summary": {"history": "a\\', '"b"}}'),        # \" の途中で切れる（閉じ引用符と誤認しない）
+    ('{"summary": {"history": "a\\', '\\b"}}'),       # \\ の途中で切れる
+    ('{"summary": {"history": "a\\u30', 'a2"}}'),     # \uXXXX の途中で切れる
+])
+def test_escape_sequence_split_at_chunk_boundary(before, after):
+    parser = IncrementalFieldParser()
+    assert parser.feed(before) == []
+    events = parser.feed(after)
+    expected = json.loads(before + after)["summary"]["history"]
+    assert events == [(("summary", "history"), expected)]
+
+
+def test_truncated_input_emits_only_closed_fields():
+    text = json.dumps(RESULT, ensure_ascii=False)
+    cut = text.index("呼吸器")
+    parser = IncrementalFieldParser()
+    events = parser.feed(text[:cut])
+    # departments の配列は閉じていないので出さない
+    assert [path for path, _ in events] == [
+        ("summary", "chief_complaint"), ("summary", "history"), ("summary", "symptoms"), ("summary", "background"),
+    ]
+    assert not parser.complete
+    with pytest.raises(ValueError):
+        parser.result()
@@ -0,0 +1,84 @@
+import asyncio
+
+import httpx
+import pytest
+
+from fakes import LatencyProfile
+from llm_scheduler import LLMScheduler, SchedulerBusy, SchedulerTimeout
+
+
+def test_concurrency_is_bounded_and_waiters_run_in_turn():
+    scheduler = LLMScheduler(max_concurrency=2, max_queue=8)
+    running, peak = 0, 0
+
+    async def call():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return "ok"
+
+    async def run():
+        return await asyncio.gather(*[scheduler.run(call) for _ in range(6)])
+
+    assert asyncio.run(run()) == ["ok"] * 6
+    assert peak == 2
+    assert scheduler.stats()["in_flight"] == scheduler.stats()["waiting"] == 0
+
+
+def test_full_queue_is_rejected_immediately():
+    scheduler = LLMScheduler(max_concurrency=1, max_queue=1)
+
+    async def run():
+        release = asyncio.Event()
+
+        async def held():
+            await release.wait()
+            return "done"
+
+        first = asyncio.ensure_future(scheduler.run(held))
+        second = asyncio.ensure_future(scheduler.run(held))
+        await asyncio.sleep(0.01)
+        assert (scheduler.in_flight, scheduler.waiting) == (1, 1)
+        # 実行中1 + 待ち1 で満杯: 3件目は待たずに断る
+        with pytest.raises(SchedulerBusy):
+            await scheduler.run(held)
+        release.set()
+        return await asyncio.gather(first, second)
+
+    assert asyncio.run(run()) == ["done", "done"]
+    assert scheduler.rejected == 1
+
+
+def test_queue_and_call_timeouts():
+    scheduler = LLMScheduler(max_concurrency=1, max_queue=4, queue_timeout=0.05, call_timeout=0.2)
+
+    async def run():
+        slow = asyncio.ensure_future(scheduler.run(lambda: asyncio.sleep(1)))
+        await asyncio.sleep(0.01)
+        with pytest.raises(SchedulerTimeout):   # 順番が来ない
+            await scheduler.run(lambda: asyncio.sleep(0))
+        with pytest.raises(SchedulerTimeout):   # 生成が終わらない
+            await slow
+
+    asyncio.run(run())
+    assert scheduler.timed_out == 2
+
+
+def test_analyze_returns_429_when_the_llm_queue_is_full(fake_gemini, monkeypatch):
+    import main
+    fake_gemini.latency = LatencyProfile(200)
+    monkeypatch.setattr(main, "llm_scheduler", LLMScheduler(max_concurrency=1, max_queue=0))
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            # 入力が違うのでキャッシュ・同時リクエストの集約には当たらない
+            return await asyncio.gather(
+                client.post("/analyze", json={"text": "昨日から頭が痛い"}),
+                client.post("/analyze", json={"text": "今朝から喉が痛い"}),
+            )
+
+    statuses = sorted(r.status_code for r in asyncio.run(run()))
+    assert statuses == [200, 429]
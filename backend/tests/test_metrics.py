@@ -0,0 +1,60 @@
+from fastapi.testclient import TestClient
+
+from metrics import MetricsRegistry
+
+
+def samples(text: str) -> dict:
+    """Prometheus テキスト形式 → {"名前{ラベル}": 値}"""
+    out = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            out[name] = float(value)
+    return out
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram("op_seconds", "Op latency.", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        latency.observe(value, "llm")
+
+    text = registry.render()
+    assert "# TYPE op_seconds histogram" in text
+    got = samples(text)
+    assert got['op_seconds_bucket{stage="llm",le="0.1"}'] == 1
+    assert got['op_seconds_bucket{stage="llm",le="1.0"}'] == 3
+    assert got['op_seconds_bucket{stage="llm",le="+Inf"}'] == 4
+    assert got['op_seconds_sum{stage="llm"}'] == 4.05
+    assert got['op_seconds_count{stage="llm"}'] == 4
+
+
+def test_analyze_records_stage_latency_and_token_usage(fake_gemini):
+    import main
+    client = TestClient(main.app)
+    before = samples(client.get("/metrics").text)
+
+    assert client.post("/analyze", json={"text": "おとといから咳が止まらない"}).status_code == 200
+    client.get("/no-such-path")
+    after = samples(client.get("/metrics").text)
+
+    def delta(name):
+        return after.get(name, 0) - before.get(name, 0)
+
+    assert delta('stage_duration_seconds_count{operation="analyze",stage="llm"}') == 1
+    assert delta('llm_calls_total{outcome="ok"}') == 1
+    assert delta('llm_tokens_total{kind="prompt"}') > 0
+    assert delta('llm_tokens_total{kind="response"}') > 0
+    # ルートはパステンプレートで、未定義のパスは1つのラベルにまとめる
+    assert delta('http_request_duration_seconds_count{method="POST",route="/analyze",status="200"}') == 1
+    assert delta('http_request_duration_seconds_count{method="GET",route="unmatched",status="404"}') == 1
+
+
+def test_metrics_token_is_required_when_set(monkeypatch):
+    import main
+    monkeypatch.setattr(main, "METRICS_TOKEN", "secret")
+    client = TestClient(main.app)
+    assert client.get("/metrics").status_code == 401
+    r = client.get("/metrics", headers={"Authorization": "Bearer secret"})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain; version=0.0.4")
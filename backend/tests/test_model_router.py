@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import pytest
+
+from model_router import AllModelsUnavailable, ModelRouter
+
+
+def make_call(outcomes):
+    """outcomes: {モデル名: 例外 or 戻り値}"""
+    async def call(model):
+        outcome = outcomes[model]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    return call
+
+
+def open_breaker(router, model):
+    router.record(model, False)
+    assert router.breakers[model].state == "open"
+
+
+def test_unused_half_open_probe_is_not_leaked():
+    router = ModelRouter(["A", "B"], failure_threshold=1, reset_timeout=0.05, hedge=False)
+    open_breaker(router, "B")
+    time.sleep(0.06)
+    assert router.breakers["B"].state == "half_open"
+
+    # A が応答するので B は送られない → B の試行枠は取られたままにならない
+    response, model = asyncio.run(router.generate(make_call({"A": "ok-a", "B": "ok-b"})))
+    assert (response, model) == ("ok-a", "A")
+    assert router.candidates() == ["A", "B"]
+
+    # A が落ちたら half-open の B を1件だけ試す
+    open_breaker(router, "A")
+    response, model = asyncio.run(router.generate(make_call({"A": "ok-a", "B": "ok-b"})))
+    assert (response, model) == ("ok-b", "B")
+    assert router.breakers["B"].state == "closed"
+
+
+def test_candidates_does_not_take_probe_slot():
+    router = ModelRouter(["A", "B"], failure_threshold=1, reset_timeout=0.05)
+    open_breaker(router, "B")
+    time.sleep(0.06)
+    for _ in range(3):
+        assert router.candidates() == ["A", "B"]
+    # 実際に送るときだけ枠を取り、release で返す（ストリーミング経路）
+    assert router.acquire("B")
+    assert not router.acquire("B")
+    router.release("B")
+    assert router.candidates() == ["A", "B"]
+
+
+def test_failed_probe_reopens_and_all_open_raises():
+    router = ModelRouter(["A"], failure_threshold=1, reset_timeout=0.05)
+    open_breaker(router, "A")
+    with pytest.raises(AllModelsUnavailable):
+        asyncio.run(router.generate(make_call({"A": "ok"})))
+    time.sleep(0.06)
+    with pytest.raises(RuntimeError):
+        asyncio.run(router.generate(make_call({"A": RuntimeError("boom")})))
+    assert router.breakers["A"].state == "open"
+
+
+def test_non_retryable_error_releases_half_open_probe():
+    router = ModelRouter(["A"], failure_threshold=1, reset_timeout=0.05,
+                         non_retryable=lambda e: isinstance(e, ValueError))
+    open_breaker(router, "A")
+    time.sleep(0.06)
+
+    # half-open の試行が 4xx 相当のエラー → そのまま返し、次のモデルにも送らない
+    with pytest.raises(ValueError):
+        asyncio.run(router.generate(make_call({"A": ValueError("invalid argument")})))
+    assert router.calls["A"]["error"] == 2
+    # 試行枠は返され、モデルの障害にも数えない（次の呼び出しで A を試せる）
+    assert router.breakers["A"].state == "half_open"
+    response, model = asyncio.run(router.generate(make_call({"A": "ok-a"})))
+    assert (response, model) == ("ok-a", "A")
+    assert router.breakers["A"].state == "closed"
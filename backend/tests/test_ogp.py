@@ -0,0 +1,45 @@
+import pytest
+from fastapi.testclient import TestClient
+
+pytest.importorskip("PIL")
+
+from ogp import PAGE_CARDS, OgpRenderer, ogp_cache_key
+from pdf_cache import PdfCache
+
+
+@pytest.fixture
+def client(monkeypatch):
+    import main
+    monkeypatch.setattr(main, "ogp_cache", PdfCache(suffix=".png"))
+    return TestClient(main.app)
+
+
+def test_fallback_font_card_is_not_cached_long(client, monkeypatch):
+    import main
+    monkeypatch.setattr(main, "ogp_renderer", OgpRenderer(font_path="/nonexistent/ipaexg.ttf"))
+
+    r = client.get("/api/ogp/page/home.png")
+    assert r.status_code == 200 and r.content.startswith(b"\x89PNG")
+    assert r.headers["Cache-Control"] == main.OGP_FALLBACK_CACHE_CONTROL
+    # フォントを置いた後の画像とは別のETag。ディスク・メモリのキャッシュにも残さない
+    assert r.headers["ETag"] == f'"{ogp_cache_key(*PAGE_CARDS["home"], fallback_font=True)}"'
+    assert r.headers["ETag"] != f'"{ogp_cache_key(*PAGE_CARDS["home"])}"'
+    assert len(main.ogp_cache._data) == 0
+
+
+def test_card_with_japanese_font_is_cached(client, monkeypatch):
+    import main
+    from PIL import ImageFont
+    # ipaexg.ttf はリポジトリにないので、読めた扱いにして描画だけ既定のフォントで行う
+    renderer = OgpRenderer(font_path="/nonexistent/ipaexg.ttf")
+    renderer.fallback_font = False
+    monkeypatch.setattr(renderer, "_font", ImageFont.load_default)
+    monkeypatch.setattr(main, "ogp_renderer", renderer)
+
+    r = client.get("/api/ogp/page/about.png")
+    assert r.status_code == 200
+    assert r.headers["Cache-Control"] == main.OGP_CACHE_CONTROL
+    etag = r.headers["ETag"]
+    assert etag == f'"{ogp_cache_key(*PAGE_CARDS["about"])}"'
+    assert main.ogp_cache.get(etag.strip('"')) == r.content
+    assert client.get("/api/ogp/page/about.png", headers={"If-None-Match": etag}).status_code == 304
@@ -0,0 +1,71 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from responses import AVAILABLE_ENCODINGS
+from summary_store import SQLiteSummaryStore
+
+
+@pytest.fixture
+def client():
+    import main
+    store = SQLiteSummaryStore(":memory:")
+    store.insert({"id": "s1", "user_id": "u1", "created_at": "2026-01-01T00:00:00",
+                  "content": {"chief_complaint": "**3日前**からの発熱", "history": "悪寒あり"}})
+    main.summary_store.set(store)
+    yield TestClient(main.app)
+    main.summary_store.set(None)
+
+
+@pytest.mark.parametrize("accept_encoding, suffix", [("identity", ""), ("gzip", "-gzip")]
+                         + ([("br, gzip", "-br")] if "br" in AVAILABLE_ENCODINGS else []))
+def test_pdf_etag_is_strong_per_encoding(client, accept_encoding, suffix):
+    r = client.get("/api/pdf/s1", headers={"Accept-Encoding": accept_encoding})
+    assert r.status_code == 200
+    assert "Accept-Encoding" in r.headers["Vary"]
+    etag = r.headers["ETag"]
+    assert not etag.startswith("W/") and etag.endswith(f'{suffix}"')
+
+    r = client.get("/api/pdf/s1", headers={"Accept-Encoding": accept_encoding, "If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.headers["ETag"] == etag
+    assert "Accept-Encoding" in r.headers["Vary"]
+
+
+def test_any_encoding_etag_revalidates(client):
+    gzip_etag = client.get("/api/pdf/s1", headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+    r = client.get("/api/pdf/s1", headers={"Accept-Encoding": "identity", "If-None-Match": gzip_etag})
+    assert r.status_code == 304
+    assert r.headers["ETag"] == gzip_etag.removesuffix('-gzip"') + '"'
+    # 内容が違えば一致しない
+    r = client.get("/api/pdf/s1?size=B5", headers={"If-None-Match": gzip_etag})
+    assert r.status_code == 200
+
+
+def test_unknown_size_shares_the_a4_cache_entry(client):
+    import main
+    a4 = client.get("/api/pdf/s1").headers["ETag"]
+    assert client.get("/api/pdf/s1?size=Letter").headers["ETag"] == a4
+    r = client.get("/api/pdf/s1?size=whatever", headers={"If-None-Match": a4})
+    assert r.status_code == 304
+    assert client.get("/api/pdf/s1?size=B5").headers["ETag"] != a4
+
+
+def test_pdf_cache_disk_io_runs_off_the_event_loop(client, monkeypatch):
+    import threading
+
+    import main
+    threads = []
+    for name in ("get", "set"):
+        original = getattr(main.pdf_cache, name)
+
+        def record(*args, _original=original):
+            threads.append(threading.current_thread())
+            return _original(*args)
+        monkeypatch.setattr(main.pdf_cache, name, record)
+    # このテストだけの内容（メモリ上のキャッシュに当たらない）
+    main.summary_store.get().insert({"id": "s-io", "user_id": "u1", "created_at": "2026-01-02T00:00:00",
+                                     "content": {"chief_complaint": "ディスクキャッシュの確認"}})
+
+    assert client.get("/api/pdf/s-io").status_code == 200
+    assert len(threads) == 2   # get（ミス）と set
+    assert threading.main_thread() not in threads
@@ -0,0 +1,53 @@
+import asyncio
+import io
+
+import pytest
+
+pypdf = pytest.importorskip("pypdf")
+
+from bench_pdf_export import make_store
+
+
+def export(count: int) -> bytes:
+    import main
+
+    async def run():
+        pages = main.iter_export_pages(make_store(count), "bench-user")
+        first_rows = await anext(pages, None)
+        return b"".join([chunk async for chunk in main.stream_export_pdf(pages, first_rows, "A4", None)])
+
+    return asyncio.run(run())
+
+
+def test_export_is_one_readable_pdf_with_shared_fonts():
+    import main
+    count = main.EXPORT_PAGE_SIZE * 2 + 5   # 3ブロック（最後は端数）
+    reader = pypdf.PdfReader(io.BytesIO(export(count)), strict=True)
+
+    assert len(reader.pages) == count   # 1件1ページ（本文が短いため）
+    assert reader.metadata.title == "Medical Summary Export"
+    assert "2026-01-01 00:00" in reader.pages[0].extract_text()
+    assert "2026-01-01 00:00" in reader.pages[-1].extract_text()
+    # ブロックごとにフォントを埋め込み直さず、全ページが同じフォントオブジェクトを参照する
+    fonts = [
+        sorted(font.idnum for font in page["/Resources"]["/Font"].values())
+        for page in reader.pages
+    ]
+    assert all(f == fonts[0] for f in fonts)
+
+
+def test_export_streams_pages_before_finishing():
+    import main
+    from pdf_stream import PdfExportWriter
+
+    writer = PdfExportWriter("A4", "t")
+    head = writer.start()
+    entries = [main.export_entry(r) for r in asyncio.run(make_store(3).list_page("bench-user", None, 3))]
+    body = writer.add(entries)
+    # 描き終えたページは add() の時点で書き出される（フォント等は finish() で1回だけ）
+    assert head.startswith(b"%PDF-")
+    assert body.count(b"/Type /Page\n") == writer.page_count == 3
+    assert b"/Type /Font" not in body
+    tail = writer.finish()
+    assert tail.count(b"/Type /Font") >= 1
+    assert len(pypdf.PdfReader(io.BytesIO(head + body + tail)).pages) == 3
@@ -0,0 +1,55 @@
+import asyncio
+import io
+
+import pytest
+
+pypdf = pytest.importorskip("pypdf")
+
+from pdf_renderer import PdfRenderPool
+
+TEXT = "Chief complaint\nFever 38.5 since 3 days ago\n\nHistory\nChills at night"
+
+
+def render_while_ticking(pool, text, size="A4"):
+    """レンダリング中もイベントループが止まらない（他のタスクが進む）ことを数える"""
+    async def run():
+        ticks = 0
+        done = False
+
+        async def ticker():
+            nonlocal ticks
+            while not done:
+                ticks += 1
+                await asyncio.sleep(0.001)
+
+        task = asyncio.ensure_future(ticker())
+        try:
+            return await pool.render(text, size), ticks
+        finally:
+            done = True
+            await task
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("workers", [1, 0])   # プロセスプール / スレッド
+def test_render_round_trip_off_the_event_loop(workers):
+    pool = PdfRenderPool(workers=workers)
+    try:
+        pool.start()
+        pdf, ticks = render_while_ticking(pool, TEXT, "B5")
+    finally:
+        pool.shutdown()
+    reader = pypdf.PdfReader(io.BytesIO(pdf))
+    assert "Fever 38.5" in reader.pages[0].extract_text()
+    # B5 (約 499 x 709pt)
+    assert round(float(reader.pages[0].mediabox.width)) == 499
+    assert ticks > 0
+
+
+def test_shut_down_pool_does_not_restart_processes():
+    pool = PdfRenderPool(workers=1)
+    pool.shutdown()
+    pdf, _ = render_while_ticking(pool, TEXT)
+    assert pdf.startswith(b"%PDF-")
+    assert pool._executor is None   # 停止後はスレッドで描画し、プロセスを起動し直さない
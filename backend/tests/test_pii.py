@@ -0,0 +1,31 @@
+import pytest
+
+from pii import mask, mask_pii
+
+
+@pytest.mark.parametrize("text", [
+    "電話は03-1234-5678です",
+    "携帯 090 1234 5678",
+    "+81-90-1234-5678",
+    "電話は(03)1234-5678です",
+    "電話は03(1234)5678です",
+    "(03) 1234 5678",
+    "090(1234)5678",
+    "（０３）１２３４－５６７８",
+    "０３（１２３４）５６７８",
+])
+def test_phone_numbers_are_masked(text):
+    result = mask(text)
+    assert [s.kind for s in result.spans] == ["PHONE"]
+    assert not any(c.isdigit() for c in result.text)
+
+
+@pytest.mark.parametrize("text", [
+    "2024 10 17から咳が続いている",
+    "体温(38.5)度",
+    "2024(10)17",
+    "(3日前)から",
+    "嘔吐(2回)",
+])
+def test_non_phone_numbers_are_kept(text):
+    assert mask_pii(text) == text
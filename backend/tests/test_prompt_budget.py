@@ -0,0 +1,28 @@
+from prompts import TRUNCATION_MARK
+
+
+def max_length_note() -> str:
+    """入力上限ちょうどの、繰り返しのない日本語の経過記録"""
+    import main
+    lines = "".join(f"{i}日目の朝から頭痛があり、夕方には少し軽くなる。体温は三十七度台。\n" for i in range(1, 200))
+    return lines[:main.MAX_INPUT_CHARS]
+
+
+def test_max_length_japanese_input_is_sent_whole(capsys):
+    import main
+    text = main.mask_input(max_length_note())
+    assert len(text) == main.MAX_INPUT_CHARS
+
+    _, prompt = main.prepare_analysis_prompt(text, "Japanese")
+    assert TRUNCATION_MARK not in prompt
+    assert text in prompt
+    assert "Prompt Truncated" not in capsys.readouterr().out
+
+
+def test_truncation_over_budget_is_logged(monkeypatch, capsys):
+    import main
+    monkeypatch.setattr(main, "PROMPT_INPUT_TOKEN_BUDGET", 1000)
+
+    _, prompt = main.prepare_analysis_prompt(max_length_note(), "Japanese")
+    assert TRUNCATION_MARK in prompt
+    assert "Prompt Truncated: 4000 chars" in capsys.readouterr().out
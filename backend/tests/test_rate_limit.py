@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+from rate_limit import MISSING
+
+
+def make_request(forwarded=None, peer="10.0.0.1"):
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded is not None else []
+    return Request({"type": "http", "headers": headers, "client": (peer, 1234)})
+
+
+@pytest.mark.parametrize("hops, forwarded, expected", [
+    (1, "203.0.113.5", "203.0.113.5"),
+    # クライアントが偽の値を先頭に入れても、プロキシが付け足した右端を使う
+    (1, "198.51.100.1, 203.0.113.5", "203.0.113.5"),
+    (2, "198.51.100.1, 203.0.113.5, 10.1.0.7", "203.0.113.5"),
+    # プロキシの数より短い・X-Forwarded-For を信用しない設定なら接続元
+    (2, "203.0.113.5", "10.0.0.1"),
+    (0, "203.0.113.5", "10.0.0.1"),
+    (1, None, "10.0.0.1"),
+])
+def test_client_ip_uses_trusted_hop(monkeypatch, hops, forwarded, expected):
+    import main
+    monkeypatch.setattr(main, "TRUSTED_PROXY_HOPS", hops)
+    assert main.client_ip(make_request(forwarded)) == expected
+
+
+# --- prefork: ワーカーごとのキャッシュ・上限 ---
+
+def make_worker_cache(path, rows, fetched):
+    """1ワーカー分の ProfileCache（同じ SQLite を共有する）"""
+    from rate_limit import ProfileCache, SharedInvalidations
+
+    async def fetch(user_id):
+        fetched.append(user_id)
+        return dict(rows[user_id])
+
+    return ProfileCache(fetch, ttl=300, shared=SharedInvalidations(path))
+
+
+def test_invalidation_reaches_other_workers(tmp_path):
+    path = str(tmp_path / "profile_invalidations.sqlite3")
+    rows = {"u1": {"id": "u1", "plan_type": "free", "subscription_status": None, "stripe_customer_id": "cus_1"}}
+    fetched_a, fetched_b = [], []
+    worker_a = make_worker_cache(path, rows, fetched_a)
+    worker_b = make_worker_cache(path, rows, fetched_b)
+
+    assert asyncio.run(worker_b.plan("u1")) == "free"
+    rows["u1"] = {**rows["u1"], "plan_type": "pro_monthly", "subscription_status": "active"}
+    # Webhook をワーカー A が処理しても、B のキャッシュから捨てられる
+    worker_a.invalidate("u1")
+    assert asyncio.run(worker_b.plan("u1")) == "pro_monthly"
+    assert fetched_b == ["u1", "u1"]
+
+    # stripe_customer_id での無効化も同様
+    rows["u1"] = {**rows["u1"], "subscription_status": "canceled"}
+    worker_a.invalidate_where("stripe_customer_id", "cus_1")
+    assert asyncio.run(worker_b.plan("u1")) == "free"
+    assert worker_b.peek("u1") is not MISSING
+    assert len(fetched_b) == 3
+
+
+def test_limits_are_divided_per_worker():
+    from rate_limit import PlanLimits, RateLimited, RateLimiter, per_worker_limits
+
+    limits = {"free": PlanLimits(per_minute=12, burst=8, concurrency=2)}
+    assert per_worker_limits(limits, 1) == limits
+    assert per_worker_limits(limits, 4)["free"] == PlanLimits(per_minute=3, burst=2, concurrency=1)
+
+    # 4ワーカーに均等に割り振られたとき、全体で通るのは設定したバーストまで
+    workers = [RateLimiter(per_worker_limits(limits, 4)) for _ in range(4)]
+    allowed = 0
+    for i in range(40):
+        try:
+            workers[i % 4].acquire("user:u1", "free").release()
+            allowed += 1
+        except RateLimited:
+            pass
+    assert allowed == 8
+
+
+# --- バッチ: 件数分の cost ---
+
+def test_cost_above_burst_is_rejected_without_draining_the_bucket():
+    from rate_limit import PlanLimits, RateLimited, RateLimiter
+    limiter = RateLimiter({"free": PlanLimits(per_minute=5, burst=5, concurrency=2)})
+
+    with pytest.raises(RateLimited) as e:
+        limiter.acquire("ip:a", "free", cost=100)
+    assert (e.value.reason, e.value.limit) == ("cost", 5)
+    # 断った分は消費しない。バースト容量ちょうどまでは通り、その後は待たせる
+    limiter.acquire("ip:a", "free", cost=5).release()
+    with pytest.raises(RateLimited) as e:
+        limiter.acquire("ip:a", "free", cost=1)
+    assert e.value.reason == "rate"
+
+
+def test_batch_larger_than_plan_burst_returns_413(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+    monkeypatch.setattr(main, "RATE_LIMIT_ENABLED", True)
+    burst = main.rate_limiter.limits["guest"].burst
+    items = [{"text": f"{i}日前から頭痛"} for i in range(burst + 1)]
+
+    r = TestClient(main.app).post("/analyze/batch", json={"items": items},
+                                  headers={"X-Forwarded-For": "198.51.100.77"})
+    assert r.status_code == 413
+    assert f"up to {burst}" in r.json()["detail"]
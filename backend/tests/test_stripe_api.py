@@ -0,0 +1,84 @@
+import asyncio
+from urllib.parse import parse_qs
+
+import httpx
+import pytest
+
+stripe = pytest.importorskip("stripe")
+
+from service_clients import ServiceClient, ServiceLimits
+from stripe_api import STRIPE_API_VERSION, StripeApi, StripeApiError
+
+LIMITS = ServiceLimits(timeout=5.0, connect_timeout=1.0, max_connections=2, max_keepalive=2,
+                       keepalive_expiry=5.0, max_concurrency=2)
+SESSION = {"id": "cs_test_1", "object": "checkout.session", "url": "https://checkout.stripe.test/s"}
+
+
+def make_api(responses, requests):
+    """responses を順に返す Stripe の代替（共有の ServiceClient 経由で送られたリクエストを requests に残す）"""
+    def handler(request: httpx.Request):
+        requests.append(request)
+        status, body, headers = responses.pop(0)
+        return httpx.Response(status, json=body, headers=headers)
+
+    http = ServiceClient("stripe", LIMITS, transport=httpx.MockTransport(handler))
+    return http, StripeApi(http, "sk_test_1")
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(stripe.HTTPClient, "INITIAL_DELAY", 0)
+
+
+def test_checkout_pins_version_and_sends_idempotency_key():
+    requests = []
+    http, api = make_api([(200, SESSION, {})], requests)
+    session = asyncio.run(api.create_checkout_session(
+        mode="subscription", line_items=[{"price": "price_1", "quantity": 1}], metadata={"user_id": "u1"}))
+
+    assert session["url"] == SESSION["url"]
+    assert http.stats()["requests"] == 1   # 共有の接続プールを通っている
+    request = requests[0]
+    assert request.url.path == "/v1/checkout/sessions"
+    assert request.headers["Stripe-Version"] == STRIPE_API_VERSION
+    assert request.headers["Idempotency-Key"]
+    assert request.headers["Authorization"] == "Bearer sk_test_1"
+    form = parse_qs(request.content.decode())
+    assert form["line_items[0][price]"] == ["price_1"]
+    assert form["metadata[user_id]"] == ["u1"]
+
+
+@pytest.mark.parametrize("status, headers", [(503, {}), (429, {"Stripe-Should-Retry": "true"})])
+def test_checkout_retries_with_same_idempotency_key(status, headers):
+    requests = []
+    error = {"error": {"type": "api_error", "message": "try again"}}
+    _, api = make_api([(status, error, headers), (200, SESSION, {})], requests)
+    assert asyncio.run(api.create_checkout_session(mode="subscription"))["id"] == SESSION["id"]
+    assert len(requests) == 2
+    assert requests[0].headers["Idempotency-Key"] == requests[1].headers["Idempotency-Key"]
+
+
+def test_checkout_error_is_raised_as_stripe_api_error():
+    requests = []
+    error = {"error": {"type": "invalid_request_error", "message": "No such price: 'price_x'"}}
+    _, api = make_api([(400, error, {})], requests)
+    with pytest.raises(StripeApiError) as e:
+        asyncio.run(api.create_checkout_session(mode="subscription"))
+    assert e.value.status == 400
+    assert "No such price" in str(e.value)
+    assert len(requests) == 1   # 400 は再試行しない
+
+def test_connection_error_is_retried_through_the_pool():
+    requests = []
+
+    def handler(request: httpx.Request):
+        requests.append(request)
+        if len(requests) == 1:
+            raise httpx.ConnectError("connection reset")
+        return httpx.Response(200, json=SESSION)
+
+    http = ServiceClient("stripe", LIMITS, transport=httpx.MockTransport(handler))
+    api = StripeApi(http, "sk_test_1")
+    assert asyncio.run(api.create_checkout_session(mode="subscription"))["id"] == SESSION["id"]
+    assert len(requests) == 2
+    assert http.stats()["requests"] == 2
@@ -0,0 +1,149 @@
+import asyncio
+import time
+
+import pytest
+
+from local_supabase import LocalSupabase
+from webhook_jobs import WebhookJobQueue
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "webhook_jobs.sqlite3")
+
+
+def job_row(queue, event_id):
+    return queue._execute(
+        "SELECT status, attempts, next_attempt_at, last_error FROM webhook_events WHERE event_id = ?", (event_id,)
+    ).fetchone()
+
+
+def make_due(queue, event_id):
+    queue._execute("UPDATE webhook_events SET next_attempt_at = ? WHERE event_id = ?", (time.time() - 1, event_id))
+
+
+def test_enqueue_dedups_by_event_id(db_path):
+    calls = []
+    queue = WebhookJobQueue(db_path, {"invoice.payment_failed": calls.append})
+    assert queue.enqueue("evt_1", "invoice.payment_failed", {"customer": "cus_1"})
+    assert not queue.enqueue("evt_1", "invoice.payment_failed", {"customer": "cus_1"})
+    assert asyncio.run(queue.process_due()) == 1
+    # 処理済みのイベントが再送されても、もう一度は処理しない
+    assert not queue.enqueue("evt_1", "invoice.payment_failed", {"customer": "cus_1"})
+    assert asyncio.run(queue.process_due()) == 0
+    assert calls == [{"customer": "cus_1"}]
+    assert queue.stats() == {"done": 1, "dead_letters": 0}
+
+
+def test_failed_job_is_retried_with_backoff(db_path):
+    attempts = []
+
+    async def flaky(data):
+        attempts.append(data)
+        if len(attempts) < 3:
+            raise RuntimeError("supabase down")
+
+    queue = WebhookJobQueue(db_path, {"checkout.session.completed": flaky}, base_delay=10.0, max_delay=15.0)
+    queue.enqueue("evt_1", "checkout.session.completed", {})
+
+    started = time.time()
+    asyncio.run(queue.process_due())
+    status, tries, next_at, error = job_row(queue, "evt_1")
+    assert (status, tries, error) == ("pending", 1, "supabase down")
+    assert next_at - started == pytest.approx(10.0, abs=1.0)
+    # 期限前は再試行しない
+    assert asyncio.run(queue.process_due()) == 0
+
+    make_due(queue, "evt_1")
+    started = time.time()
+    asyncio.run(queue.process_due())
+    status, tries, next_at, _ = job_row(queue, "evt_1")
+    # 2回目の待ちは倍（20秒）だが max_delay で頭打ち
+    assert (status, tries) == ("pending", 2)
+    assert next_at - started == pytest.approx(15.0, abs=1.0)
+
+    make_due(queue, "evt_1")
+    asyncio.run(queue.process_due())
+    assert job_row(queue, "evt_1")[0] == "done"
+    assert len(attempts) == 3
+
+
+def test_job_moves_to_dead_letters_after_max_attempts(db_path):
+    def broken(data):
+        raise ValueError("bad payload")
+
+    queue = WebhookJobQueue(db_path, {"invoice.payment_failed": broken}, max_attempts=3, base_delay=0.0)
+    queue.enqueue("evt_1", "invoice.payment_failed", {"customer": "cus_1"})
+    for _ in range(5):
+        asyncio.run(queue.process_due())
+    assert job_row(queue, "evt_1")[:2] == ("dead", 3)
+    dead = queue._execute("SELECT event_id, type, attempts, error FROM dead_letters").fetchall()
+    assert dead == [("evt_1", "invoice.payment_failed", 3, "bad payload")]
+    assert queue.stats() == {"dead": 1, "dead_letters": 1}
+
+
+def test_checkout_completed_updates_profile_in_local_supabase(db_path):
+    import main
+
+    db = LocalSupabase({"profiles": [
+        {"id": "user-1", "plan_type": "free", "subscription_status": None, "stripe_customer_id": None},
+        {"id": "user-2", "plan_type": "free", "subscription_status": None, "stripe_customer_id": None},
+    ]})
+    main.supabase_client.set(db)
+    queue = WebhookJobQueue(db_path, main.WEBHOOK_HANDLERS)
+    session = {"client_reference_id": "user-1", "customer": "cus_1", "metadata": {"plan_type": "pro_monthly"}}
+    assert queue.enqueue("evt_1", "checkout.session.completed", session)
+    assert not queue.enqueue("evt_1", "checkout.session.completed", session)
+    asyncio.run(queue.process_due())
+
+    assert job_row(queue, "evt_1")[0] == "done"
+    assert db.tables["profiles"][0] == {
+        "id": "user-1", "plan_type": "pro_monthly", "subscription_status": "active", "stripe_customer_id": "cus_1",
+    }
+    assert db.tables["profiles"][1]["plan_type"] == "free"
+
+
+def test_cancelled_worker_returns_claimed_jobs_to_pending(db_path):
+    entered = []
+
+    async def slow(data):
+        entered.append(data)
+        await asyncio.sleep(3600)
+
+    queue = WebhookJobQueue(db_path, {"invoice.payment_failed": slow})
+    queue.enqueue("evt_1", "invoice.payment_failed", {"customer": "cus_1"})
+    queue.enqueue("evt_2", "invoice.payment_failed", {"customer": "cus_2"})
+
+    async def run():
+        queue.start()
+        while not entered:
+            await asyncio.sleep(0.01)
+        # ハンドラの途中で停止する（シャットダウン・ワーカーの入れ替え）
+        await queue.stop()
+
+    asyncio.run(run())
+    # 処理中だったジョブも、同時に取り出して未着手だったジョブも、失敗に数えず待ちに戻る
+    assert job_row(queue, "evt_1")[:2] == ("pending", 0)
+    assert job_row(queue, "evt_2")[:2] == ("pending", 0)
+
+    done = []
+    queue.handlers["invoice.payment_failed"] = done.append
+    assert asyncio.run(queue.process_due()) == 2
+    assert done == [{"customer": "cus_1"}, {"customer": "cus_2"}]
+
+
+def test_running_job_past_its_lease_is_reclaimed(db_path):
+    done = []
+    queue = WebhookJobQueue(db_path, {"invoice.payment_failed": done.append}, lease_timeout=60.0)
+    queue.enqueue("evt_1", "invoice.payment_failed", {"customer": "cus_1"})
+    queue.enqueue("evt_2", "invoice.payment_failed", {"customer": "cus_2"})
+    # ほかのワーカーが取り出したまま落ちた（evt_1 は期限切れ、evt_2 はまだ処理中の扱い）
+    queue._execute("UPDATE webhook_events SET status = 'running', updated_at = ? WHERE event_id = 'evt_1'",
+                   (time.time() - 61,))
+    queue._execute("UPDATE webhook_events SET status = 'running', updated_at = ? WHERE event_id = 'evt_2'",
+                   (time.time() - 30,))
+
+    assert asyncio.run(queue.process_due()) == 1
+    assert done == [{"customer": "cus_1"}]
+    assert job_row(queue, "evt_1")[0] == "done"
+    assert job_row(queue, "evt_2")[0] == "running"
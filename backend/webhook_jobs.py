@@ -0,0 +1,213 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class WebhookJobQueue:
+    """
+    Stripe Webhook の冪等受付 + バックグラウンド処理キュー（ローカルSQLite）
+
+    - enqueue(): イベントIDを主キーに保存。再送された同じイベントは無視する
+    - ワーカーが期限の来たジョブを取り出してハンドラを実行
+    - 失敗時は指数バックオフで再試行し、max_attempts 回失敗したら dead_letters へ移す
+    - 停止・ワーカーの入れ替えで中断したジョブは待ちに戻す。プロセスごと落ちて running のまま
+      lease_timeout 秒たったジョブは、ほかのワーカーが取り直す
+    同じDBファイルを複数プロセスで共有しても、ジョブは1つのワーカーだけが処理する
+    """
+
+    def __init__(self, path: str, handlers: dict, max_attempts: int = 5,
+                 base_delay: float = 2.0, max_delay: float = 300.0, poll_interval: float = 1.0,
+                 lease_timeout: float = 300.0):
+        self.path = path
+        self.handlers = handlers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.lease_timeout = lease_timeout
+        self._lock = threading.Lock()
+        self._connect()
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS webhook_events (
+                event_id TEXT PRIMARY KEY,
+                type TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_webhook_events_due ON webhook_events(status, next_attempt_at);
+            CREATE TABLE IF NOT EXISTS dead_letters (
+                event_id TEXT PRIMARY KEY,
+                type TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                error TEXT,
+                failed_at REAL NOT NULL
+            );
+            """
+        )
+        # 前回のプロセスが処理中のまま落ちたジョブを戻す
+        self._conn.execute("UPDATE webhook_events SET status = 'pending' WHERE status = 'running'")
+        self._wakeup = None
+        self._task = None
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._pid = os.getpid()
+
+    def _execute(self, sql: str, params=()):
+        with self._lock:
+            if self._pid != os.getpid():
+                # fork 後の子プロセスでは親の接続を使わず開き直す（prefork.py）
+                self._connect()
+            return self._conn.execute(sql, params)
+
+    # --- 受付 ---
+
+    def enqueue(self, event_id: str, event_type: str, data_object: dict) -> bool:
+        """新規イベントなら True、既に受け付け済み（Stripeの再送）なら False"""
+        now = time.time()
+        cur = self._execute(
+            "INSERT OR IGNORE INTO webhook_events"
+            " (event_id, type, payload, next_attempt_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (event_id, event_type, json.dumps(data_object), now, now, now),
+        )
+        if cur.rowcount and self._wakeup is not None:
+            self._wakeup.set()
+        return bool(cur.rowcount)
+
+    # --- 処理 ---
+
+    def _claim_due(self, limit: int = 10) -> list:
+        now = time.time()
+        # 期限の来た待ちジョブと、処理していたワーカーが落ちたまま lease_timeout を過ぎたジョブ
+        rows = self._execute(
+            "SELECT event_id, type, payload, attempts, status, updated_at FROM webhook_events"
+            " WHERE (status = 'pending' AND next_attempt_at <= ?) OR (status = 'running' AND updated_at < ?)"
+            " ORDER BY next_attempt_at LIMIT ?",
+            (now, now - self.lease_timeout, limit),
+        ).fetchall()
+        claimed = []
+        for event_id, event_type, payload, attempts, status, updated_at in rows:
+            # 取り出した時と状態が変わっていなければ自分のものにする（ほかのワーカーと取り合わない）
+            cur = self._execute(
+                "UPDATE webhook_events SET status = 'running', updated_at = ?"
+                " WHERE event_id = ? AND status = ? AND updated_at = ?",
+                (now, event_id, status, updated_at),
+            )
+            if cur.rowcount:
+                claimed.append((event_id, event_type, json.loads(payload), attempts))
+        return claimed
+
+    def _release(self, event_ids: list):
+        """取り出したまま処理を終えていないジョブを待ちに戻す（試行回数には数えない）"""
+        now = time.time()
+        for event_id in event_ids:
+            self._execute(
+                "UPDATE webhook_events SET status = 'pending', next_attempt_at = ?, updated_at = ?"
+                " WHERE event_id = ? AND status = 'running'",
+                (now, now, event_id),
+            )
+
+    def _complete(self, event_id: str):
+        self._execute(
+            "UPDATE webhook_events SET status = 'done', last_error = NULL, updated_at = ? WHERE event_id = ?",
+            (time.time(), event_id),
+        )
+
+    def _fail(self, event_id: str, event_type: str, data_object: dict, attempts: int, error: str):
+        now = time.time()
+        if attempts >= self.max_attempts:
+            self._execute(
+                "INSERT OR REPLACE INTO dead_letters (event_id, type, payload, attempts, error, failed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (event_id, event_type, json.dumps(data_object), attempts, error, now),
+            )
+            self._execute(
+                "UPDATE webhook_events SET status = 'dead', attempts = ?, last_error = ?, updated_at = ? WHERE event_id = ?",
+                (attempts, error, now, event_id),
+            )
+            print(f"Webhook Dead Letter: {event_type} {event_id} ({error})")
+            return
+        delay = min(self.base_delay * (2 ** (attempts - 1)), self.max_delay)
+        self._execute(
+            "UPDATE webhook_events SET status = 'pending', attempts = ?, last_error = ?,"
+            " next_attempt_at = ?, updated_at = ? WHERE event_id = ?",
+            (attempts, error, now + delay, now, event_id),
+        )
+
+    async def process_due(self) -> int:
+        """期限の来たジョブを処理する。処理した件数を返す"""
+        jobs = self._claim_due()
+        for index, (event_id, event_type, data_object, attempts) in enumerate(jobs):
+            handler = self.handlers.get(event_type)
+            try:
+                if asyncio.iscoroutinefunction(handler):
+                    await handler(data_object)
+                elif handler is not None:
+                    # 同期のハンドラはイベントループを止めないようスレッドで実行する
+                    await asyncio.to_thread(handler, data_object)
+                self._complete(event_id)
+            except asyncio.CancelledError:
+                # stop()・ワーカーの入れ替え（--max-requests）で中断された: このジョブと未着手のジョブを戻す
+                self._release([job[0] for job in jobs[index:]])
+                raise
+            except Exception as e:
+                print(f"Webhook Job Error ({event_type} {event_id}): {e}")
+                self._fail(event_id, event_type, data_object, attempts + 1, str(e))
+        return len(jobs)
+
+    def _next_wait(self) -> float:
+        """次の再試行予定までの待ち時間（最大 poll_interval）"""
+        row = self._execute("SELECT MIN(next_attempt_at) FROM webhook_events WHERE status = 'pending'").fetchone()
+        if row[0] is None:
+            return self.poll_interval
+        return max(0.0, min(self.poll_interval, row[0] - time.time()))
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                if await self.process_due():
+                    continue
+            except Exception as e:
+                print(f"Webhook Worker Error: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._next_wait())
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        counts = dict(self._execute("SELECT status, COUNT(*) FROM webhook_events GROUP BY status").fetchall())
+        counts["dead_letters"] = self._execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+        return counts
+
+
+def default_queue_path() -> str:
+    return os.getenv(
+        "WEBHOOK_DB_PATH",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "webhook_jobs.sqlite3"),
+    )
@@ -0,0 +1,24 @@
+import type { Metadata } from "next";
+
+// 詳細ページ本体はクライアントコンポーネントのため、OGP（SNSシェア用）の設定はこのレイアウトで行う
+const BACKEND_URL = process.env.NEXT_PUBLIC_BACKEND_URL || "https://medical-backend-92rr.onrender.com";
+
+export async function generateMetadata({ params }: { params: { id: string } }): Promise<Metadata> {
+  // 画像には作成日だけが描かれる（症状などの本文は載せない）。非公開のサマリーは画像が 404 になる
+  const image = `${BACKEND_URL}/api/ogp/summary/${encodeURIComponent(params.id)}.png`;
+  return {
+    title: "医師提示用サマリー",
+    openGraph: {
+      title: "医師提示用サマリー | Karutto",
+      images: [{ url: image, width: 1200, height: 630, alt: "Karutto 医療サマリー" }],
+    },
+    twitter: {
+      card: "summary_large_image",
+      images: [image],
+    },
+  };
+}
+
+export default function SummaryLayout({ children }: { children: React.ReactNode }) {
+  return children;
+}
@@ -58,9 +58,20 @@ export default function HistoryDetailPage() {
 
   const handleDownloadPDF = async () => {
     setPdfLoading(true);
+    // ポップアップブロック対策で先にタブを開いておく
+    const pdfWindow = window.open('', '_blank');
     try {
-      window.open(`${BACKEND_URL}/api/pdf/${id}`, '_blank');
+      // 非公開サマリーは本人確認が必要なため、アクセストークンを付けて取得する
+      const { data: { session } } = await supabase.auth.getSession();
+      const res = await fetch(`${BACKEND_URL}/api/pdf/${id}`, {
+        headers: session ? { Authorization: `Bearer ${session.access_token}` } : {},
+      });
+      if (!res.ok) throw new Error("PDF Error");
+      const url = URL.createObjectURL(await res.blob());
+      if (pdfWindow) pdfWindow.location.href = url;
+      else window.open(url, '_blank');
     } catch (e) {
+      pdfWindow?.close();
       alert("PDFのダウンロードに失敗しました");
     } finally {
       setPdfLoading(false);
@@ -16,25 +16,34 @@ type LinkProps = any; // エラー回避用
 // --- [プレビュー用モック END] ---
 
 
-import { ArrowLeft, Calendar, FileText, ChevronRight, User, Filter, Clock, Lock, Eye, EyeOff } from 'lucide-react';
+import { ArrowLeft, Calendar, FileText, ChevronRight, User, Filter, Clock, Lock, Eye, EyeOff, Download, Loader2 } from 'lucide-react';
 
+const BACKEND_URL = process.env.NEXT_PUBLIC_BACKEND_URL || "https://medical-backend-92rr.onrender.com";
+
+// GET /api/history の1件（家族の範囲・非公開の除外・表示名の結合はサーバー側で済んでいる）
 interface SummaryRecord {
   id: string;
   user_id: string;
   created_at: string;
-  content: string; 
-  departments: string;
-  is_private: boolean; // 追加
-  display_name?: string;
-  is_me?: boolean;
+  is_private: boolean;
+  chief_complaint: string;
+  preview: string;
+  departments: string[];
+  display_name: string;
+  is_me: boolean;
 }
 
+const PAGE_SIZE = 20;
+
 export default function HistoryPage() {
   const [summaries, setSummaries] = useState<SummaryRecord[]>([]);
-  const [filteredSummaries, setFilteredSummaries] = useState<SummaryRecord[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [filter, setFilter] = useState<'all' | 'me'>('all');
+  const [department, setDepartment] = useState<string | null>(null);
   const [user, setUser] = useState<any>(null);
+  const [exporting, setExporting] = useState(false);
 
   useEffect(() => {
     const init = async () => {
@@ -44,55 +53,62 @@ export default function HistoryPage() {
         return;
       }
       setUser(session.user);
-      await fetchHistory(session.user.id);
     };
     init();
   }, []);
 
+  // 絞り込みが変わったら1ページ目から取り直す
   useEffect(() => {
-    if (filter === 'me') {
-      setFilteredSummaries(summaries.filter(s => s.is_me));
-    } else {
-      setFilteredSummaries(summaries);
-    }
-  }, [filter, summaries]);
+    if (user) fetchHistory(true);
+  }, [user, filter, department]);
 
-  const fetchHistory = async (myUserId: string) => {
+  const fetchHistory = async (reset: boolean) => {
+    if (reset) setLoading(true); else setLoadingMore(true);
     try {
-      const { data: summaryData, error } = await supabase
-        .from('summaries')
-        .select('*')
-        .order('created_at', { ascending: false });
-
-      if (error) throw error;
-      if (!summaryData || summaryData.length === 0) {
-        setLoading(false);
-        return;
-      }
-
-      const userIds = Array.from(new Set(summaryData.map((s: any) => s.user_id)));
-      
-      const { data: profiles } = await supabase
-        .from('profiles')
-        .select('id, display_name')
-        .in('id', userIds);
+      const { data: { session } } = await supabase.auth.getSession();
+      if (!session) return;
+      const params = new URLSearchParams({ scope: filter, limit: String(PAGE_SIZE) });
+      if (department) params.set('department', department);
+      if (!reset && nextCursor) params.set('before', nextCursor);
 
-      const combined = summaryData.map((item: any) => {
-        const profile = profiles?.find((p: any) => p.id === item.user_id);
-        return {
-          ...item,
-          display_name: profile?.display_name || "名無し",
-          is_me: item.user_id === myUserId
-        };
+      const res = await fetch(`${BACKEND_URL}/api/history?${params}`, {
+        headers: { Authorization: `Bearer ${session.access_token}` },
       });
-
-      setSummaries(combined);
-      setFilteredSummaries(combined);
-
+      if (!res.ok) throw new Error("History Error");
+      const data = await res.json();
+      setSummaries(prev => reset ? data.items : [...prev, ...data.items]);
+      setNextCursor(data.next_cursor);
     } catch (e) {
       console.error(e);
     } finally {
       setLoading(false);
+      setLoadingMore(false);
+    }
+  };
+
+  // 表示中の履歴をまとめて1つのPDFに書き出す（サーバー側で少しずつ生成して送られてくる）
+  const handleExportPDF = async () => {
+    setExporting(true);
+    try {
+      const { data: { session } } = await supabase.auth.getSession();
+      if (!session) throw new Error("Not logged in");
+      const res = await fetch(`${BACKEND_URL}/api/pdf/export`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', Authorization: `Bearer ${session.access_token}` },
+        // 「自分のみ」（診療科の絞り込みなし）なら件数に関係なく本人の全履歴、それ以外は表示中のものを指定
+        body: JSON.stringify(filter === 'me' && !department ? {} : { summary_ids: summaries.map(s => s.id) }),
+      });
+      if (!res.ok) throw new Error("Export Error");
+      const url = URL.createObjectURL(await res.blob());
+      const a = document.createElement('a');
+      a.href = url;
+      a.download = 'summaries.pdf';
+      a.click();
+      URL.revokeObjectURL(url);
+    } catch (e) {
+      alert("PDFの書き出しに失敗しました");
+    } finally {
+      setExporting(false);
     }
   };
 
@@ -108,7 +124,6 @@ export default function HistoryPage() {
       s.id === record.id ? { ...s, is_private: newStatus } : s
     );
     setSummaries(updatedSummaries);
-    setFilteredSummaries(filter === 'me' ? updatedSummaries.filter(s => s.is_me) : updatedSummaries);
 
     // DB更新
     const { error } = await supabase
@@ -134,13 +149,6 @@ export default function HistoryPage() {
     return isToday ? `今日 ${timePart}` : `${datePart} ${timePart}`;
   };
 
-  const parseContent = (content: any) => {
-    if (typeof content === 'string') {
-      try { return JSON.parse(content); } catch (e) { return null; }
-    }
-    return content;
-  };
-
   return (
     <div className="min-h-screen bg-slate-50 text-slate-900 font-sans">
       <header className="sticky top-0 z-50 bg-white/80 backdrop-blur-md border-b border-slate-200">
@@ -151,6 +159,14 @@ export default function HistoryPage() {
             </Link>
             <h1 className="text-lg font-bold tracking-tight">家族の履歴</h1>
           </div>
+          <button
+            onClick={handleExportPDF}
+            disabled={exporting || summaries.length === 0}
+            className="p-2 rounded-full hover:bg-slate-100 text-teal-600 transition disabled:opacity-40"
+            title="PDFで書き出す"
+          >
+            {exporting ? <Loader2 size={20} className="animate-spin" /> : <Download size={20} />}
+          </button>
         </div>
       </header>
 
@@ -171,9 +187,21 @@ export default function HistoryPage() {
           </button>
         </div>
 
+        {department && (
+          <div className="flex items-center gap-2 mb-4 text-xs text-slate-500">
+            <Filter size={12} /> 診療科:
+            <button
+              onClick={() => setDepartment(null)}
+              className="bg-teal-50 text-teal-700 px-2 py-1 rounded-md border border-teal-200 font-bold"
+            >
+              {department} ×
+            </button>
+          </div>
+        )}
+
         {loading ? (
           <div className="text-center py-12 text-slate-400 text-sm animate-pulse">データを読み込んでいます...</div>
-        ) : filteredSummaries.length === 0 ? (
+        ) : summaries.length === 0 ? (
           <div className="text-center py-12">
             <div className="w-16 h-16 bg-slate-100 rounded-full flex items-center justify-center mx-auto mb-4 text-slate-300">
               <FileText size={32} />
@@ -185,10 +213,7 @@ export default function HistoryPage() {
           </div>
         ) : (
           <div className="space-y-4">
-            {filteredSummaries.map((item) => {
-              const content = parseContent(item.content);
-              if (!content) return null;
-
+            {summaries.map((item) => {
               return (
                 <Link key={item.id} href={`/history/${item.id}`} className="block">
                   <div className="bg-white rounded-2xl border border-slate-200 p-5 shadow-sm hover:shadow-md transition group relative overflow-hidden">
@@ -223,10 +248,15 @@ export default function HistoryPage() {
                           </button>
                         )}
                         <div className="flex gap-1">
-                          {parseContent(item.departments)?.slice(0, 1).map((dept: string, i: number) => (
-                            <span key={i} className="text-[10px] bg-slate-100 text-slate-500 px-2 py-1 rounded-md border border-slate-200">
+                          {item.departments.slice(0, 1).map((dept: string, i: number) => (
+                            <button
+                              key={i}
+                              onClick={(e) => { e.preventDefault(); e.stopPropagation(); setDepartment(dept); }}
+                              className="text-[10px] bg-slate-100 text-slate-500 px-2 py-1 rounded-md border border-slate-200 hover:bg-slate-200"
+                              title="この診療科で絞り込む"
+                            >
                               {dept}
-                            </span>
+                            </button>
                           ))}
                         </div>
                       </div>
@@ -234,12 +264,10 @@ export default function HistoryPage() {
                     
                     <div className="pl-3">
                       <h3 className="font-bold text-slate-800 text-base mb-1 line-clamp-1">
-                        {content.chief_complaint || "主訴なし"}
+                        {item.chief_complaint || "主訴なし"}
                       </h3>
                       <p className="text-xs text-slate-500 line-clamp-2 leading-relaxed">
-                        {item.is_private && !item.is_me 
-                          ? "🔒 非公開の記録です" 
-                          : content.history}
+                        {item.preview}
                       </p>
                     </div>
 
@@ -252,6 +280,16 @@ export default function HistoryPage() {
                 </Link>
               );
             })}
+            {nextCursor && (
+              <button
+                onClick={() => fetchHistory(false)}
+                disabled={loadingMore}
+                className="w-full py-3 text-sm font-bold text-teal-600 bg-white border border-slate-200 rounded-xl hover:bg-slate-50 transition flex items-center justify-center gap-2 disabled:opacity-60"
+              >
+                {loadingMore && <Loader2 size={16} className="animate-spin" />}
+                さらに読み込む
+              </button>
+            )}
           </div>
         )}
       </main>
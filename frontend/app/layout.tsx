@@ -9,6 +9,9 @@ const inter = Inter({ subsets: ["latin"] });
 // .env.local に NEXT_PUBLIC_FRONTEND_URL がなければデフォルト値を使います
 const BASE_URL = process.env.NEXT_PUBLIC_FRONTEND_URL || "https://karteno.jp";
 const GA_ID = process.env.NEXT_PUBLIC_GA_ID || "";
+// OGP画像はバックエンドがページごとにレンダリング・キャッシュして返す
+const BACKEND_URL = process.env.NEXT_PUBLIC_BACKEND_URL || "https://medical-backend-92rr.onrender.com";
+const OGP_IMAGE_URL = `${BACKEND_URL}/api/ogp/page/home.png`;
 
 export const metadata: Metadata = {
   metadataBase: new URL(BASE_URL),
@@ -39,7 +42,7 @@ export const metadata: Metadata = {
     type: 'website',
     images: [
       {
-        url: '/ogp.png', // publicフォルダに配置した画像
+        url: OGP_IMAGE_URL,
         width: 1200,
         height: 630,
         alt: 'Karutto OGP Image',
@@ -50,7 +53,7 @@ export const metadata: Metadata = {
     card: 'summary_large_image',
     title: 'Karutto (カルット)',
     description: '医師に伝える、家族と備える。AI医療サマリーアプリ。',
-    images: ['/ogp.png'],
+    images: [OGP_IMAGE_URL],
   },
   appleWebApp: {
     capable: true,
@@ -39,7 +39,8 @@ const DICT = {
     disclaimer: "※本結果はAIによる自動生成であり、医師による診断ではありません。参考情報としてご利用いただき、必ず医療機関を受診してください。",
     login: "ログイン", logout: "ログアウト", history: "履歴",
     adTitle: "ご家族の安心のために",
-    public: "家族に公開中", private: "自分のみ (非公開)"
+    public: "家族に公開中", private: "自分のみ (非公開)",
+    rateLimited: "利用回数の上限に達しました。しばらくしてから再度お試しください。"
   },
   en: { 
     label: "English", button: "Create Medical Summary", loading: "AI is organizing your symptoms...", 
@@ -61,7 +62,8 @@ const DICT = {
     disclaimer: "* This is AI-generated text, not a medical diagnosis. Please consult a doctor.",
     login: "Login", logout: "Logout", history: "History",
     adTitle: "Recommended Services",
-    public: "Shared with Family", private: "Private (Only Me)"
+    public: "Shared with Family", private: "Private (Only Me)",
+    rateLimited: "Usage limit reached. Please try again shortly."
   },
   // 他言語省略
 };
@@ -135,6 +137,8 @@ const MainApp = ({ user, isGuest }: { user: any, isGuest: boolean }) => {
   const [isRecording, setIsRecording] = useState(false);
   
   const recognitionRef = useRef<any>(null);
+  // 前回解析した入力と結果（書き足して再解析するとき、変更箇所だけで更新してもらう）
+  const lastAnalysisRef = useRef<{ text: string; language: string; result: AnalysisResult } | null>(null);
   const settingsRef = useRef<HTMLDivElement>(null);
   const t = DICT[lang as LangKey] || DICT.ja;
 
@@ -150,13 +154,47 @@ const MainApp = ({ user, isGuest }: { user: any, isGuest: boolean }) => {
     if (isRecording) { recognitionRef.current?.stop(); setIsRecording(false); }
 
     try {
-      const response = await fetch(`${BACKEND_URL}/analyze`, {
-        method: "POST", headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ text: inputText, language: t.label }),
+      // ストリーミング版: 確定したフィールドから順に表示する (NDJSON)
+      // ログイン中はトークンを送り、プランに応じた利用上限を適用してもらう
+      const { data: { session } } = await supabase.auth.getSession();
+      const last = lastAnalysisRef.current;
+      const previous = last && last.language === t.label && last.text !== inputText ? { text: last.text, result: last.result } : undefined;
+      const response = await fetch(`${BACKEND_URL}/analyze/stream`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json", ...(session ? { Authorization: `Bearer ${session.access_token}` } : {}) },
+        body: JSON.stringify({ text: inputText, language: t.label, ...(previous ? { previous } : {}) }),
       });
-      if (!response.ok) throw new Error("API Error");
-      const data: AnalysisResult = await response.json();
+      if (response.status === 429) { alert(t.rateLimited); return; }
+      if (!response.ok || !response.body) throw new Error("API Error");
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      const partial: AnalysisResult = { summary: { chief_complaint: "", history: "", symptoms: "", background: "" } };
+      let buffered = "";
+      let data: AnalysisResult | null = null;
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split("\n");
+        buffered = lines.pop() || "";
+        for (const line of lines) {
+          if (!line.trim()) continue;
+          const event = JSON.parse(line);
+          if (event.event === "field") {
+            if (event.path === "departments") partial.departments = event.value;
+            else partial.summary = { ...partial.summary, [event.path.replace("summary.", "")]: event.value };
+            setResult({ ...partial });
+          } else if (event.event === "done") {
+            data = event.result as AnalysisResult;
+          } else if (event.event === "error") {
+            throw new Error(event.detail);
+          }
+        }
+      }
+      if (!data) throw new Error("API Error");
       setResult(data);
+      lastAnalysisRef.current = { text: inputText, language: t.label, result: data };
 
       if (user && !isGuest) {
         const { data: inserted, error } = await supabase.from('summaries').insert({